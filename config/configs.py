@@ -14,6 +14,57 @@ class Config():
     chunk_size = 800
     chunk_overlap = 20
     chunk_filter_len = 2
+    # 按 token 分块（可选）：按 embedding 模型的 token 数打包分块，分词器不可用时退回按字符
+    chunk_by_tokens = False
+    chunk_token_size = 512  # 每个分块的目标 token 数
+    tokenizer_backend = "tiktoken"  # 分词器类型："tiktoken" 或 "hf"（HuggingFace 分词器）
+    tokenizer_name = "cl100k_base"  # tiktoken 编码名，或 HuggingFace 分词器路径（如 bert_path）
+    embedding_max_tokens = 8192  # embedding 模型单条输入的 token 上限
+
+    #索引构建参数
+    incremental_index = True  # 增量索引：只向量化新增/变化的文件，并追加到已有索引
+    # 索引类型：flat（精确检索）/ ivf_flat / ivf_pq（向量压缩，省内存）/ hnsw（图索引，低延迟）/ auto（按向量数选择）
+    # 建索引时的参数写在索引旁的 <索引路径>.params.json 中，检索时按其中的 nprobe / ef_search 设置，可单独修改
+    index_type = "auto"
+    index_auto_ivf_min = 10000  # auto：向量数超过该值使用 ivf_flat，否则使用 flat
+    index_auto_pq_min = 2000000  # auto：向量数超过该值使用 ivf_pq
+    index_nlist = 0  # IVF 聚类中心数，0 表示按向量数自动选择（约 4*sqrt(n)）
+    index_rebuild_nlist_ratio = 2.0  # 增量更新后按新向量数选出的 nlist 与训练时相差超过该倍数时，用原始向量重建 IVF 索引
+    index_nprobe = 16  # IVF 检索时探查的聚类数，越大召回越高、检索越慢（没有参数文件的旧索引也使用该值）
+    index_pq_m = 0  # PQ 每个向量压缩后的字节数（子向量个数，须整除维度），0 表示自动选择（约 维度/16）
+    index_pq_nbits = 8  # PQ 每个子向量的编码位数
+    index_hnsw_m = 32  # HNSW 每个节点的邻居数，越大召回越高、内存占用越大
+    index_hnsw_ef_construction = 200  # HNSW 建图时的候选队列长度，越大建图越慢、图质量越好
+    index_hnsw_ef_search = 128  # HNSW 检索时的候选队列长度，越大召回越高、检索越慢
+
+    #入库流水线参数
+    ingest_parse_workers = 4  # 解析阶段并发线程数
+    ingest_chunk_workers = 4  # 分块阶段进程数（分块受 GIL 限制，用多进程并行）
+    ingest_process_start_method = "spawn"  # 入库进程池（分块、大 PDF 解析）启动子进程的方式：spawn / forkserver，不要用 fork
+    ingest_queue_size = 8  # 阶段间有界队列容量（批次数），控制内存占用
+    ingest_embed_batch_size = 200  # 每次送入向量化阶段的分块数（再由 vectorize_query 拆成并发请求）
+    ingest_job_workers = 2  # 后台同时执行的入库任务数（同一知识库的任务仍排队执行）
+    ingest_job_history = 20  # 保留的已结束入库任务数
+    ingest_ui_concurrency = 4  # 界面上同时跟踪进度的上传数（与问答使用不同的并发组，互不占用）
+    ingest_progress_interval = 1.0  # 界面刷新入库进度的间隔（秒）
+
+    #分块去重参数
+    dedup_enabled = True  # 向量化前去掉重复/近似重复的分块
+    dedup_threshold = 0.95  # SimHash 相似度阈值（1 - 汉明距离/64），达到阈值视为近似重复
+    dedup_min_len = 50  # 短于该长度的分块只做精确去重
+
+    #PDF 解析参数
+    pdf_workers = 4  # 大 PDF 按页段并行提取的进程数，<=1 时串行
+    pdf_parallel_min_pages = 64  # 页数达到该值才启用进程池
+    pdf_pages_per_task = 16  # 每个进程任务提取的页数
+    pdf_strip_boilerplate = True  # 分块前去掉跨页重复的页眉/页脚/页码行和目录页
+    boilerplate_edge_lines = 3  # 每页顶部/底部参与页眉页脚检测的行数
+    boilerplate_min_page_ratio = 0.5  # 在至少这个比例的页面上重复出现的边缘行视为页眉页脚
+    toc_min_entries = 5  # 一页中至少有这么多“标题…页码”条目才可能判为目录页
+
+    #TXT 解析参数
+    encoding_sample_bytes = 64 * 1024  # 编码检测只分析文件开头这么多字节
+    stream_ingest_min_mb = 64  # 不小于该大小（MB）的文本文件流式解码、清洗和分块，<=0 表示不启用
 
     #generator参数
     max_source_length = 767  #输入的最大长度
@@ -26,7 +77,19 @@ class Config():
     base_url = "https://dashscope.aliyuncs.com/compatible-mode/v1"
     model_name = "text-embedding-v3"
     dimensions = 1024
-    batch_size = 10
+    batch_size = 10  # 单个 embedding 请求的最大条数
+    embedding_batch_max_chars = 16000  # 单个 embedding 请求的最大总字符数，长文本会自动减少每批条数
+    embedding_concurrency = 4  # 同时在途的 embedding 请求数
+    embedding_max_retries = 3  # 单个 embedding 请求失败（如限流）后的重试次数
+    embedding_retry_backoff = 2.0  # 首次重试前等待的秒数，之后每次翻倍
+    embedding_encoding_format = "base64"  # 响应格式：base64 体积小、解码快；服务端以 400 拒绝时该服务自动改用 "float"
+
+    #本地 embedding 参数 - use_api = False 时使用 bert_path 下的模型，用于离线入库和检索
+    local_embedding_runtime = "torch"  # 推理方式："torch"、"int8"（torch 动态 int8 量化）或 "onnx"（ONNX Runtime）
+    local_embedding_onnx_path = ""  # ONNX 模型文件路径，为空时使用 bert_path/model.onnx
+    local_embedding_threads = 0  # 推理线程数，<=0 表示使用框架默认值
+    local_embedding_batch_size = 32  # 每个推理批次的文本数（按长度排序后分桶，批内长度接近，减少填充）
+    local_embedding_max_length = 512  # 单条文本的最大 token 数，超出部分截断
 
 
     #LLM API 参数 - 用于 rag.py
@@ -52,10 +115,18 @@ class Config():
     # 知识库配置
     kb_base_dir = "knowledge_bases"  # 知识库根目录
     default_kb = "碳化硅MOSFET"  # 默认知识库名称
+    kb_cache_enabled = True  # 检索时复用已加载的索引和元数据，文件更新后自动重新加载
+    kb_cache_max_mb = 4096  # 常驻内存的索引和元数据总大小上限（MB），超过后释放最久未使用的知识库
+    kb_index_mmap = True  # 检索时以内存映射方式只读打开索引：启动时不复制索引，多个服务进程通过页缓存共享同一份；失败时退回普通读取
     
     # 输出目录配置 - 现在用作临时文件目录
     output_dir = "output_files"
 
+    # embedding 缓存配置：按 (模型, 维度, 文本) 缓存向量，重复文本不再调用 API
+    embedding_cache_enabled = True
+    embedding_cache_path = os.path.join(output_dir, "embedding_cache.sqlite")
+    embedding_cache_max_mb = 2048  # 缓存容量上限（MB），超过后淘汰最久未访问的向量
+
     # logging 配置
     log_dir = "logs"
     
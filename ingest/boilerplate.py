@@ -0,0 +1,86 @@
+import re
+from collections import Counter
+from typing import List, Tuple
+from config.configs import Config
+
+# PDF 跨页样板内容检测：页眉、页脚、版本戳、页码这类每页都重复出现的行，以及目录页，
+# 在分块之前去掉，否则它们会变成大量内容相同的垃圾分块，浪费 embedding 调用并挤占 top-k。
+
+_WHITESPACE = re.compile(r'\s+')
+_DIGITS = re.compile(r'\d+')
+# 单独的页码行：12 / Page 12 / 12 of 40 / 第 12 页 / - 12 -
+_PAGE_NUMBER = re.compile(r'^[-–—\s]*(page\s*)?(第\s*)?\d+(\s*页)?(\s*(/|of)\s*\d+)?[-–—\s]*$', re.IGNORECASE)
+# 目录条目：标题 + 引导符（连续的点、省略号或中点，点之间可能被提取成空格）+ 页码
+# 只靠空白间隔 + 末尾数字不能判断：参数表的每一行（"Drain-Source Voltage  VDS  1200"）也是这种形式
+_TOC_ENTRY = re.compile(r'\S.*?(\.{3,}|(\. ){3,}|…+|·{3,})\s*\d+\s*$')
+_TOC_TITLE = re.compile(r'^\s*(目\s*录|table\s+of\s+contents|contents)\s*$', re.IGNORECASE)
+
+
+def _normalize_line(line: str) -> str:
+    # 页眉页脚里常带页码、日期，把数字统一替换掉再比较
+    return _DIGITS.sub('#', _WHITESPACE.sub(' ', line).strip().lower())
+
+
+def _edge_indexes(lines: List[str], edge_lines: int) -> List[int]:
+    """
+    返回页面顶部和底部各若干个非空行的下标
+    边缘区最多占页面非空行的 1/3，短页面上不会把正文也当成页眉页脚
+    """
+    non_empty = [i for i, line in enumerate(lines) if line.strip()]
+    n = min(edge_lines, len(non_empty) // 3)
+    if n == 0:
+        return []
+    return non_empty[:n] + non_empty[-n:]
+
+
+def is_toc_page(page_text: str, min_entries: int = Config.toc_min_entries) -> bool:
+    """判断页面是否为目录页：目录条目足够多，且占非空行的多数（有目录标题时放宽比例）"""
+    lines = [line for line in page_text.splitlines() if line.strip()]
+    if not lines:
+        return False
+    entries = sum(1 for line in lines if _TOC_ENTRY.match(line))
+    if entries < min_entries:
+        return False
+    has_title = any(_TOC_TITLE.match(line) for line in lines[:5])
+    return entries * 2 >= len(lines) or (has_title and entries * 4 >= len(lines))
+
+
+def strip_boilerplate(pages: List[str],
+                      edge_lines: int = Config.boilerplate_edge_lines,
+                      min_page_ratio: float = Config.boilerplate_min_page_ratio,
+                      min_pages: int = 3) -> Tuple[List[str], dict]:
+    """
+    去掉跨页重复的页眉/页脚行、页码行和目录页
+    Args:
+        pages: 按页的原始文本（clean_text 之前，保留换行）
+        edge_lines: 每页顶部/底部参与检测的非空行数，只在这个范围内删除，正文中的同样文字不受影响
+        min_page_ratio: 规范化后的行在至少这个比例的页面边缘出现，才视为页眉页脚
+        min_pages: 页数少于该值时不做页眉页脚检测
+    Returns:
+        (处理后的页面列表, {"header_lines": 删除的页眉页脚行数, "toc_pages": 删除的目录页数})
+    """
+    stats = {"header_lines": 0, "toc_pages": 0}
+    page_lines = [page.splitlines() for page in pages]
+
+    # 统计每个规范化的边缘行出现在多少页上（同一页只计一次）
+    repeated = set()
+    if len(pages) >= min_pages:
+        counts = Counter()
+        for lines in page_lines:
+            counts.update({_normalize_line(lines[i]) for i in _edge_indexes(lines, edge_lines)})
+        threshold = max(min_pages, min_page_ratio * len(pages))
+        repeated = {line for line, n in counts.items() if n >= threshold}
+
+    result = []
+    for lines in page_lines:
+        if is_toc_page("\n".join(lines)):
+            stats["toc_pages"] += 1
+            result.append("")
+            continue
+        drop = {i for i in _edge_indexes(lines, edge_lines)
+                if _normalize_line(lines[i]) in repeated or _PAGE_NUMBER.match(lines[i])}
+        stats["header_lines"] += len(drop)
+        kept = [line for i, line in enumerate(lines) if i not in drop]
+        # 每页末尾保留换行，拼接后相邻两页的文字不会粘在一起
+        result.append("\n".join(kept) + "\n" if kept else "")
+    return result, stats
@@ -1,8 +1,8 @@
-from typing import List
-from llama_index.core.node_parser import SentenceSplitter
+from typing import List, Iterable, Iterator, Optional, Tuple
 import re
 from utils.logger_config import setup_logger
 from config.configs import Config
+from ingest.token_counter import TokenCounter, get_token_counter
 
 # 设置日志
 logger = setup_logger("chunker.log")
@@ -12,159 +12,236 @@ chunk_size = Config.chunk_size
 chunk_filter_len = Config.chunk_filter_len
 chunk_overlap = Config.chunk_overlap
 
-# 语义分块函数
-def semantic_chunk(text: str, chunk_size=800, chunk_overlap=20) -> List[dict]:
+# 句子分隔符：在默认分隔符句号 。 的基础上，额外增加了中文分号 ；、感叹号 !、问号 ? 和换行符 \n。
+# 正则在模块加载时编译一次，不再在每次调用 semantic_chunk 时重建
+SENTENCE_SEPARATORS = ["。", "；", "!", "?", "\n"]
+_SENTENCE_SPLIT = re.compile("(" + "|".join(map(re.escape, SENTENCE_SEPARATORS)) + ")")
+
+# 多种段落分隔符的正则表达式
+# 1. 双换行符\n\n
+# 2. 单个换行符后跟空格或tab（在某些格式中）
+# 3. 特定段落标记如<p>标签
+# 4. 中文段落常用分隔：句号+换行
+_PARAGRAPH_DELIMITERS = re.compile(r'\n\s*\n|\n(?=\s*[A-Z\u4e00-\u9fff])|\.\s*\n')
+
+# 超长段落切分时优先寻找的句子结束符
+_SENTENCE_BREAKS = ['.', '!', '?', '。', '！', '？', '\n']
+
+
+# 按标点切分句子
+def split_sentences(text: str) -> List[str]:
     """
-    # 继承并增强llama_index的句子文本分割器SentenceSplitter，但是问题是
-    # ❌ 默认更偏英文 ❌ 中文断句不理想 ❌ 分隔符不够灵活
-    自定义了分隔符和分句逻辑，从而提高RAG的召回粒度和语义完整性。
-    自定义分隔符：它在默认分隔符（通常是句号 。）的基础上，额外增加了中文分号 ；、感叹号 !、问号 ? 和换行符 \n。
+    按照标点符号来切分，但是保留标点符号（召回显示给用户看时，没有标点的段落读起来会非常累）。
+    re.split 带捕获组时，结果中偶数位是文本、奇数位是分隔符，因此一次遍历即可区分，不需要再对每段做 fullmatch。
+    换行符 \n 只起断开作用：前后文本直接拼接，不结束当前分块（与原 EnhancedSentenceSplitter 的行为一致）。
     """
-    class EnhancedSentenceSplitter(SentenceSplitter):
-        def __init__(self, *args, **kwargs):
-            custom_seps = ["；", "!", "?", "\n"]
-            separators = [kwargs.get("separator", "。")] + custom_seps
-            kwargs["separator"] = '|'.join(map(re.escape, separators))
-            super().__init__(*args, **kwargs)
-
-        def _split_text(self, text: str, **kwargs) -> List[str]:
-            # 按照标点符号来切分，但是保留标点符号，因为f-string中有括号
-            splits = re.split(f'({self.separator})', text)
-            chunks = []
-            current_chunk = []
-            for part in splits:
-                # strip() 会同时去掉字符串首尾的 空格 和 \n\r（换行符）,\t,\v,\f，也就是说如果seprarator如何是空格或者\n,在这里是会呗去掉的
-                part = part.strip()
-                if not part:
-                    continue
-                # 匹配是否是标点符号
-                if re.fullmatch(self.separator, part):
-                    if current_chunk:
-                        # 把标点符合符号页加上，这样召回显示给用户看时，没有标点的段落读起来会非常累。
-                        current_chunk.append(part)  # 保留标点，我加的。
-                        # 注意这里用join()方法，把current_chunk中的内容拼接成字符串，并添加到chunks列表中。这是为了语义的完整性
-                        chunks.append("".join(current_chunk))
-                        current_chunk = []
-                else:
-                    # 如果separator如何是空格或者\n,各个part会在这里append到current_chunk中
-                    current_chunk.append(part)
-                    #logger.info("append part")
-
-            if current_chunk:
+    pieces = _SENTENCE_SPLIT.split(text)
+    n_pieces = len(pieces)
+    chunks = []
+    current_chunk = []
+    for i in range(0, n_pieces, 2):
+        # strip() 会同时去掉字符串首尾的 空格 和 \n\r（换行符）,\t,\v,\f
+        part = pieces[i].strip()
+        if part:
+            current_chunk.append(part)
+        if i + 1 < n_pieces:
+            separator = pieces[i + 1]
+            if separator != "\n" and current_chunk:
+                # 把标点符号也加上，拼接成完整的一句，保证语义完整性
+                current_chunk.append(separator)
                 chunks.append("".join(current_chunk))
-            return [chunk.strip() for chunk in chunks if chunk.strip()]
+                current_chunk = []
+    if current_chunk:
+        chunks.append("".join(current_chunk))
+    return chunks
 
-    text_splitter = EnhancedSentenceSplitter(
-        separator="。",
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        paragraph_separator="\n\n"
-    )
 
+# 语义分块函数
+def semantic_chunk(text: str, chunk_size=800, chunk_overlap=20, token_size=None,
+                   counter: Optional[TokenCounter] = None) -> List[dict]:
+    """
+    先按段落或长度分段，再在段落内按标点符号切分句子。
+    自定义分隔符：它在默认分隔符（通常是句号 。）的基础上，额外增加了中文分号 ；、感叹号 !、问号 ? 和换行符 \n。
+    原先在每次调用时定义 llama_index SentenceSplitter 的子类，但子类重写了 _split_text，
+    父类的合并逻辑并没有生效，这里直接用模块级的 split_sentences，切分结果不变。
 
+    token_size: 按 token 打包分块的目标大小。为 None 时，若开启 Config.chunk_by_tokens 则使用
+        Config.chunk_token_size；分词器不可用时退回按句子分块。
+    counter: 按 token 分块使用的计数器，不传时使用全局共享的计数器（见 ingest.token_counter）
+    """
+    token_size, counter = _resolve_token_mode(token_size, counter)
     ##############---按照段落或长度来分段---#################
-    logger.info("=" * 60)
-    logger.info("执行分段逻辑")
-    paragraphs = split_text_into_paragraphs(text, chunk_size=800, chunk_overlap=20,separator="。")
-    logger.info(f"分段结束，分段落数：{len(paragraphs)}")
-
+    # 按 token 打包时重叠只在最终分块之间加一次，分段时不加，否则相邻分段打包进同一分块后重叠文本会重复出现
+    paragraphs = split_text_into_paragraphs(text, chunk_size=chunk_size,
+                                            chunk_overlap=0 if counter else chunk_overlap)
 
     #############---按照标点符号来分块--####################
-    logger.info("执行分块逻辑")
     chunk_data_list = []
-    chunk_id = 0
-    for para in paragraphs:
-        chunks = text_splitter.split_text(para)
-        for chunk in chunks:
-            # 这里默认chunk_filter_len=2是为了过滤掉过短的段落，可以自己调整.原先是20，我改成了2，后期可以把这个放到config文件中，方便配置。
-            if len(chunk) < Config.chunk_filter_len:
-                logger.info("-" * 60)
-                logger.info(f"过滤掉过短的段落：{chunk}")
-                continue
-            chunk_data_list.append({
-                "id": f'chunk{chunk_id}',
-                "chunk": chunk,
-                "method": "semantic_chunk"
-            })
-            log_data = {
-                "id": f'chunk{chunk_id}',
-                "chunk": chunk,  # 截断以防刷屏
-                "method": "semantic_chunk"
-            }
-            logger.info("-" * 60)
-            logger.info(f"生成分块数据: {log_data}")
-            chunk_id += 1
+    filtered = 0
+    for chunk in _iter_sentence_chunks(paragraphs, token_size, counter, chunk_overlap):
+        # 这里默认chunk_filter_len=2是为了过滤掉过短的段落，可以在config文件中配置。
+        if len(chunk) < Config.chunk_filter_len:
+            filtered += 1
+            continue
+        chunk_data_list.append({
+            "id": f'chunk{len(chunk_data_list)}',
+            "chunk": chunk,
+            "method": "semantic_chunk"
+        })
 
+    # 只记录汇总信息，逐块打印完整内容在大文件上会拖慢分块并撑大日志
+    logger.info(f"分块完成：输入 {len(text)} 字符，分段 {len(paragraphs)} 个，"
+                f"生成分块 {len(chunk_data_list)} 个，过滤过短分块 {filtered} 个")
     return chunk_data_list
 
 
-#
-def split_text_into_paragraphs(text: str, chunk_size=800, chunk_overlap=20,separator="。") -> List[str]:
-    paragraphs = []
+# 流式语义分块
+def semantic_chunk_stream(pieces: Iterable[str], chunk_size=800, chunk_overlap=20, token_size=None,
+                          counter: Optional[TokenCounter] = None) -> Iterator[dict]:
+    """
+    semantic_chunk 的流式版本：逐段消费文本片段（文件按块解码的结果、PDF 的逐页文本等），边读边产出分块，
+    内存占用只与 chunk_size 有关，与文件大小无关。
+    输入应当是经过 clean_text（或 iter_clean_text）的文本，即不含段落分隔符；此时产出的分块
+    与对拼接后的整段文本调用 semantic_chunk 完全一致。
+    """
+    n_chars = 0
+
+    def counted(source):
+        nonlocal n_chars
+        for piece in source:
+            n_chars += len(piece)
+            yield piece
+
+    token_size, counter = _resolve_token_mode(token_size, counter)
+    split_overlap = 0 if counter else chunk_overlap
+    n_chunks = 0
+    filtered = 0
+    paragraphs = _merge_paragraphs(split_long_paragraph_stream(counted(pieces), chunk_size, split_overlap),
+                                   chunk_size, split_overlap)
+    for chunk in _iter_sentence_chunks(paragraphs, token_size, counter, chunk_overlap):
+        if len(chunk) < Config.chunk_filter_len:
+            filtered += 1
+            continue
+        yield {
+            "id": f'chunk{n_chunks}',
+            "chunk": chunk,
+            "method": "semantic_chunk"
+        }
+        n_chunks += 1
+
+    logger.info(f"流式分块完成：输入 {n_chars} 字符，生成分块 {n_chunks} 个，过滤过短分块 {filtered} 个")
+
+
+# 确定是否按 token 打包：返回 (token_size, 计数器)，不按 token 打包（未开启或分词器不可用）时计数器为 None
+def _resolve_token_mode(token_size=None, counter: Optional[TokenCounter] = None):
+    if token_size is None and Config.chunk_by_tokens:
+        token_size = Config.chunk_token_size
+    if not token_size:
+        return None, None
+    return token_size, counter or get_token_counter()
+
+
+# 在段落内按标点切句；按 token 分块时按 token 预算打包句子
+def _iter_sentence_chunks(paragraphs: Iterable[str], token_size=None, counter: Optional[TokenCounter] = None,
+                          chunk_overlap=0) -> Iterator[str]:
+    if counter is not None:
+        return pack_sentences_by_tokens(paragraphs, counter, token_size, chunk_overlap)
+    return (chunk for para in paragraphs for chunk in split_sentences(para))
+
+
+def _overlap_start(chunk: str, counter: TokenCounter, chunk_overlap: int) -> Tuple[List[str], int]:
+    """下一个分块的开头：上一个分块末尾的 chunk_overlap 个字符及其 token 数"""
+    tail = chunk[-chunk_overlap:].lstrip() if chunk_overlap > 0 else ""
+    return ([tail], counter.count(tail)) if tail else ([], 0)
+
+
+# 按 token 预算打包句子
+def pack_sentences_by_tokens(paragraphs: Iterable[str], counter: TokenCounter, token_size: int,
+                             chunk_overlap: int = 0) -> Iterator[str]:
+    """
+    把连续的句子贪心地合并成不超过 token_size 个 token 的分块，得到更少、更“满”的分块；
+    单个句子超过预算时按 token 切成多段，不丢弃尾部。
+    chunk_overlap: 相邻分块之间重叠的字符数，每个分块以上一个分块末尾的这些字符开头（重叠部分计入 token 预算）；
+        重叠只在这里加一次，传入的段落本身不应带重叠
+    """
+    current = []  # 当前分块的文本片段，可能以上一个分块的重叠尾部开头
+    current_tokens = 0
+    n_sentences = 0  # 当前分块中的新句子数（不含重叠尾部）
+    for para in paragraphs:
+        para_start = True
+        for sentence in split_sentences(para):
+            n_tokens = counter.count(sentence)
+            if n_tokens > token_size:
+                if n_sentences:
+                    yield "".join(current)
+                pieces = counter.split(sentence, token_size)
+                yield from pieces
+                current, current_tokens = _overlap_start(pieces[-1], counter, chunk_overlap)
+                n_sentences = 0
+                para_start = False
+                continue
+            if current_tokens + n_tokens > token_size:
+                if n_sentences:
+                    chunk = "".join(current)
+                    yield chunk
+                    current, current_tokens = _overlap_start(chunk, counter, chunk_overlap)
+                    n_sentences = 0
+                if current_tokens + n_tokens > token_size:
+                    # 加上重叠尾部就超出预算：这个分块不带重叠
+                    current, current_tokens = [], 0
+            if current:
+                # 跨段落用换行连接；英文句子之间补一个空格，中文直接拼接
+                if para_start:
+                    current.append("\n")
+                elif current[-1][-1].isascii() and sentence[0].isascii():
+                    current.append(" ")
+            current.append(sentence)
+            current_tokens += n_tokens
+            n_sentences += 1
+            para_start = False
+    if n_sentences:
+        yield "".join(current)
+
+
+# 合并小段落，直到段落长度小于等于 chunk_size；单个超长段落按长度切分
+def _merge_paragraphs(raw_paragraphs: Iterable[str], chunk_size=800, chunk_overlap=20) -> Iterator[str]:
     current_para = []
     current_len = 0
-    para_id = 0
-
-    # 按照\n\n来分段落，遍历每个段落
-    # 合并小段落，直到段落长度小于= chunk_size
-    i = 0
-
-    # 多种段落分隔符的正则表达式
-    # 1. 双换行符\n\n
-    # 2. 单个换行符后跟空格或tab（在某些格式中）
-    # 3. 特定段落标记如<p>标签
-    # 4. 中文段落常用分隔：句号+换行
-    paragraph_delimiters = re.compile(r'\n\s*\n|\n(?=\s*[A-Z\u4e00-\u9fff])|\.\s*\n')
-
-    # 先尝试按段落分隔符分割
-    if paragraph_delimiters.search(text):
-        logger.info("有明显的段落分隔符，按照分隔符分段")
-        raw_paragraphs = re.split(paragraph_delimiters, text)
-    else:
-        # 如果没有明显的段落分隔，按长度分段。
-        logger.info("没有明显的段落分隔符，按长度分段")
-        raw_paragraphs = split_long_paragraph(text, chunk_size, chunk_overlap)
-    logger.info(f"段落数：{len(raw_paragraphs)}")
-
     for para in raw_paragraphs:
         para = para.strip()
-        para_len = len(para)
-        logger.info(f"段落i={i},长度para_len={para_len}")
-
-        if para_len == 0:
+        if not para:
             continue
+        para_len = len(para)
         if current_len + para_len <= chunk_size:
-            logger.info(f"段落长度小于等于chunk_size={chunk_size}，直接加入段落列表")
             current_para.append(para)
             current_len += para_len
-        else:
-            if len(current_para) <= chunk_size:
-                paragraphs.append("\n".join(current_para))
-                logger.info("*" * 60)
-                logger.info(f"分段id:{para_id},存入：{current_para}")
-                para_id += 1
-            else:
-                logger.info("*" * 60)
-                logger.info(f"存入超出段落，chunk_size > {chunk_size}, 切分后内容为: {current_para}")
-
-                chunks = split_long_paragraph(current_para, chunk_size,chunk_overlap)
-                paragraphs.extend(chunks)
-            current_para = [para]
-            current_len = para_len
-        i += 1
-    # 如果最后一个段落，没有加入到段落列表中，则加入
-    if len(current_para) <=  chunk_size:
-        paragraphs.append("\n".join(current_para))
-        logger.info(f"i={i},最后一个分段,chunk_size={len(current_para)}<{chunk_size},para_id={para_id},存入：{current_para}")
+            continue
+        if current_para:
+            yield from _flush_paragraph(current_para, current_len, chunk_size, chunk_overlap)
+        current_para = [para]
+        current_len = para_len
+    # 最后一个段落
+    if current_para:
+        yield from _flush_paragraph(current_para, current_len, chunk_size, chunk_overlap)
+
+
+def _flush_paragraph(current_para: List[str], current_len: int, chunk_size: int, chunk_overlap: int) -> Iterator[str]:
+    # 按字符数（而不是列表元素个数）判断是否超长
+    if current_len <= chunk_size:
+        yield "\n".join(current_para)
     else:
-        logger.info("*" * 60)
-        logger.info(f"i={i},最后一个分段,存入超出段落，chunk_size > {chunk_size}, 内容为: {current_para}")
-        chunks = split_long_paragraph(current_para, chunk_size, chunk_overlap)
-        paragraphs.extend(chunks)
+        yield from split_long_paragraph("\n".join(current_para), chunk_size, chunk_overlap)
+
 
-        logger.info(f"最后一个超长段落被分成{len(chunks)}个段落")
+#
+def split_text_into_paragraphs(text: str, chunk_size=800, chunk_overlap=20, separator="。") -> List[str]:
+    # 先尝试按段落分隔符分割，如果没有明显的段落分隔，按长度分段。
+    if _PARAGRAPH_DELIMITERS.search(text):
+        raw_paragraphs = _PARAGRAPH_DELIMITERS.split(text)
+    else:
+        raw_paragraphs = split_long_paragraph(text, chunk_size, chunk_overlap)
+    return list(_merge_paragraphs(raw_paragraphs, chunk_size, chunk_overlap))
 
-    return paragraphs
 
 def split_long_paragraph(text: str, chunk_size=800, chunk_overlap=20) -> List[str]:
     """
@@ -176,27 +253,53 @@ def split_long_paragraph(text: str, chunk_size=800, chunk_overlap=20) -> List[st
     text_len = len(text)
 
     while start < text_len:
-        # 计算结束位置
-        end = start + chunk_size
-
         # 如果剩余文本不足chunk_size
-        if end >= text_len:
+        if start + chunk_size >= text_len:
             chunks.append(text[start:])
             break
-
-        # 尽量在句子边界处切割
-        # 寻找最近的句子结束符
-        sentence_breaks = ['.', '!', '?', '。', '！', '？', '\n']
-        for break_char in sentence_breaks:
-            last_break = text.rfind(break_char, start, end)
-            if last_break != -1 and last_break - start > chunk_size // 2:
-                end = last_break + 1  # 包含结束符
-                break
-
-        # 如果没有找到合适的断句点，按字符切割
-        chunk = text[start:end]
+        chunk, start = _split_step(text, start, chunk_size, chunk_overlap)
         chunks.append(chunk)
+    return chunks
+
 
-        # 移动起始位置，考虑重叠
-        start = end - chunk_overlap
-    return chunks
\ No newline at end of file
+def _split_step(text: str, start: int, chunk_size: int, chunk_overlap: int) -> Tuple[str, int]:
+    """从 start 开始切出一段（调用方保证 start + chunk_size < len(text)），返回 (分段, 下一段的起始位置)"""
+    # 计算结束位置
+    end = start + chunk_size
+
+    # 尽量在句子边界处切割
+    # 寻找最近的句子结束符
+    for break_char in _SENTENCE_BREAKS:
+        last_break = text.rfind(break_char, start, end)
+        if last_break != -1 and last_break - start > chunk_size // 2:
+            end = last_break + 1  # 包含结束符
+            break
+
+    # 如果没有找到合适的断句点，按字符切割
+    # 移动起始位置，考虑重叠
+    return text[start:end], end - chunk_overlap
+
+
+def split_long_paragraph_stream(pieces: Iterable[str], chunk_size=800, chunk_overlap=20) -> Iterator[str]:
+    """
+    split_long_paragraph 的流式版本：切分点与对拼接后的整段文本调用 split_long_paragraph 相同。
+    只有缓冲区中 start 之后的文本超过 chunk_size 时才切分（确认不是最后一段），缓冲区只保留未切分的尾部。
+    """
+    text = ""
+    start = 0
+    pending = []
+    pending_len = 0
+    for piece in pieces:
+        pending.append(piece)
+        pending_len += len(piece)
+        # 攒够若干个 chunk_size 再拼接，避免逐个小片段拼接字符串
+        if len(text) - start + pending_len <= chunk_size * 4:
+            continue
+        text = text[start:] + "".join(pending)
+        start = 0
+        pending = []
+        pending_len = 0
+        while start + chunk_size < len(text):
+            chunk, start = _split_step(text, start, chunk_size, chunk_overlap)
+            yield chunk
+    yield from split_long_paragraph(text[start:] + "".join(pending), chunk_size, chunk_overlap)
@@ -0,0 +1,122 @@
+import hashlib
+import re
+from typing import Dict, Iterable, Optional, Set, Tuple
+import numpy as np
+from config.configs import Config
+
+# 分块近似去重：同一系列的器件手册会反复出现相同的段落（绝对最大额定值、ESD 说明、法律声明等），
+# 在向量化之前用 SimHash 指纹去掉重复分块，减少 embedding 调用和索引体积，也避免重复内容挤占 top-k。
+# 每个登记的分块都记录来源文件：被丢弃的分块依赖另一个文件中保留的那一份，
+# 那个文件被替换时，依赖它的文件需要重新入库（见 references 和 ingest_service 中的处理），否则内容会丢失。
+
+_FINGERPRINT_BITS = 64
+_WHITESPACE = re.compile(r'\s+')
+
+# 字符 3-gram 哈希用到的乘数（64 位奇数常量）
+_P1 = np.uint64(0x9E3779B97F4A7C15)
+_P2 = np.uint64(0xC2B2AE3D27D4EB4F)
+_P3 = np.uint64(0x165667B19E3779F9)
+
+
+def _normalize(text: str) -> str:
+    return _WHITESPACE.sub(' ', text).strip().lower()
+
+
+def _mix64(h: np.ndarray) -> np.ndarray:
+    # splitmix64 的终结步骤，让相近的 3-gram 得到分布均匀的哈希
+    h = h ^ (h >> np.uint64(30))
+    h = h * np.uint64(0xBF58476D1CE4E5B9)
+    h = h ^ (h >> np.uint64(27))
+    h = h * np.uint64(0x94D049BB133111EB)
+    return h ^ (h >> np.uint64(31))
+
+
+def simhash(text: str) -> int:
+    """计算文本的 64 位 SimHash 指纹（特征为字符 3-gram，全部用 numpy 向量化计算）"""
+    codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    if len(codes) < 3:
+        codes = np.concatenate([codes, np.zeros(3 - len(codes), dtype=np.uint64)])
+    with np.errstate(over='ignore'):
+        shingles = _mix64((codes[:-2] * _P1) ^ (codes[1:-1] * _P2) ^ (codes[2:] * _P3))
+    # 按位展开后逐列求和，得到每一位上 1 的个数，超过半数的位在指纹中置 1
+    bit_counts = np.unpackbits(shingles.astype('<u8').view(np.uint8).reshape(-1, 8),
+                               axis=1, bitorder='little').sum(axis=0, dtype=np.int64)
+    bits = bit_counts * 2 > len(shingles)
+    return int.from_bytes(np.packbits(bits, bitorder='little').tobytes(), 'little')
+
+
+class ChunkDeduplicator:
+    """
+    分块去重器：先按规范化文本的哈希做精确去重，再对足够长的分块按 SimHash 汉明距离做近似去重
+    Args:
+        threshold: 相似度阈值，相似度 = 1 - 汉明距离 / 64，达到阈值即视为重复
+        min_len: 短于该长度的分块只做精确去重（短文本的 SimHash 不稳定）
+    """
+
+    def __init__(self, threshold: float = Config.dedup_threshold, min_len: int = Config.dedup_min_len):
+        self.max_distance = max(0, int((1 - threshold) * _FINGERPRINT_BITS))
+        self.min_len = min_len
+        # 把指纹切成 max_distance + 1 段：汉明距离不超过 max_distance 的两个指纹至少有一段完全相同
+        n_bands = self.max_distance + 1
+        width = -(-_FINGERPRINT_BITS // n_bands)
+        self._bands = [(i * width, (1 << min(width, _FINGERPRINT_BITS - i * width)) - 1)
+                       for i in range(n_bands) if i * width < _FINGERPRINT_BITS]
+        # 精确哈希 / 指纹 -> 来源文件
+        self._buckets = [dict() for _ in self._bands]
+        self._exact: Dict[bytes, str] = {}
+        self.seen = 0
+        self.dropped = 0
+        # 来源文件 -> 它被丢弃的分块所重复的其他来源文件
+        self.references: Dict[str, Set[str]] = {}
+
+    def _find_near(self, fingerprint: int) -> Optional[str]:
+        for (shift, mask), buckets in zip(self._bands, self._buckets):
+            for other, source in buckets.get((fingerprint >> shift) & mask, ()):
+                if (fingerprint ^ other).bit_count() <= self.max_distance:
+                    return source
+        return None
+
+    def _register(self, fingerprint: int, source: str):
+        for (shift, mask), buckets in zip(self._bands, self._buckets):
+            buckets.setdefault((fingerprint >> shift) & mask, []).append((fingerprint, source))
+
+    def find_duplicate(self, text: str, source: str = "") -> Optional[str]:
+        """
+        查找与分块重复的已登记分块，返回其来源文件；不重复时返回 None，并以 source 为来源登记该分块
+        """
+        normalized = _normalize(text)
+        digest = hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).digest()
+        if digest in self._exact:
+            return self._exact[digest]
+        fingerprint = simhash(normalized) if len(normalized) >= self.min_len else None
+        if fingerprint is not None:
+            match = self._find_near(fingerprint)
+            if match is not None:
+                return match
+        self._exact[digest] = source
+        if fingerprint is not None:
+            self._register(fingerprint, source)
+        return None
+
+    def is_duplicate(self, text: str) -> bool:
+        """判断分块是否与已见过的分块重复；不重复时登记该分块"""
+        return self.find_duplicate(text) is not None
+
+    def seed(self, items: Iterable[Tuple[str, str]]):
+        """登记已入库的分块 (分块文本, 来源文件)（例如知识库中已有的内容），新分块会与它们比较"""
+        for text, source in items:
+            self.find_duplicate(text, source)
+
+    def filter(self, texts: Iterable[str], source: str = "") -> list:
+        """过滤掉重复分块，返回保留的分块，并累计统计；与其他来源重复的记入 references[source]"""
+        kept = []
+        for text in texts:
+            self.seen += 1
+            match = self.find_duplicate(text, source)
+            if match is None:
+                kept.append(text)
+                continue
+            self.dropped += 1
+            if match and match != source:
+                self.references.setdefault(source, set()).add(match)
+        return kept
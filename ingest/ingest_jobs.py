@@ -0,0 +1,158 @@
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+from config.configs import Config
+from ingest.ingest_service import INGEST_SUCCESS, INGEST_UNCHANGED, batch_upload_to_kb
+
+# 后台入库任务：上传后立即返回任务ID，入库在后台线程池中执行，界面轮询任务进度。
+# 同一知识库的任务由 kb.kb_jobs 的知识库锁串行执行，不同知识库的任务可以并行。
+
+_STATUS_QUEUED = "排队中"
+_STATUS_RUNNING = "运行中"
+_STATUS_DONE = "已完成"
+_STATUS_FAILED = "失败"
+
+
+class IngestJob:
+    """单个入库任务的状态与进度（由流水线线程更新，界面线程读取）"""
+
+    def __init__(self, kb_name: str, file_paths: List[str]):
+        self.job_id = uuid.uuid4().hex[:8]
+        self.kb_name = kb_name
+        self.file_paths = file_paths
+        self.status = _STATUS_QUEUED
+        self.result = ""
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        # 文件名 -> {"state": 状态, "chunks": 分块数, "embedded": 已向量化分块数}
+        self.files: Dict[str, dict] = {os.path.basename(p): {"state": "等待", "chunks": 0, "embedded": 0}
+                                       for p in file_paths}
+        self.counts = {"parse": 0, "chunk": 0, "embed": 0, "index": 0, "skipped": 0, "failed": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (_STATUS_DONE, _STATUS_FAILED)
+
+    def on_progress(self, stage: str, file_name: Optional[str], count: int):
+        """流水线进度回调，参数含义见 IngestPipeline"""
+        with self._lock:
+            info = self.files.setdefault(file_name, {"state": "等待", "chunks": 0, "embedded": 0}) \
+                if file_name else None
+            if stage == "parse":
+                self.counts["parse"] += 1
+                info["state"] = "已解析"
+            elif stage == "chunk":
+                self.counts["chunk"] += count
+                info["chunks"] = count
+                info["state"] = "已分块" if count else "已入库（内容均重复）"
+            elif stage == "embed":
+                self.counts["embed"] += count
+                info["embedded"] += count
+                info["state"] = "向量化中"
+            elif stage == "index":
+                self.counts["index"] += count
+                for item in self.files.values():
+                    if item["state"] == "向量化中" and item["embedded"] >= item["chunks"]:
+                        item["state"] = "已入库"
+            elif stage == "skipped":
+                self.counts["skipped"] += 1
+                info["state"] = "未变化，跳过"
+            elif stage == "failed":
+                self.counts["failed"] += 1
+                info["state"] = "失败"
+
+    def render(self) -> str:
+        """生成显示在界面上的进度文本"""
+        with self._lock:
+            now = self.finished_at or time.time()
+            elapsed = now - (self.started_at or now)
+            lines = [f"任务 {self.job_id}（知识库: {self.kb_name}）{self.status}，已用时 {elapsed:.0f}s",
+                     f"解析 {self.counts['parse']}/{len(self.files)} 个文件 | 分块 {self.counts['chunk']} 个 | "
+                     f"向量化 {self.counts['embed']}/{self.counts['chunk']} | 入索引 {self.counts['index']}"]
+            for name, info in self.files.items():
+                detail = f"{info['embedded']}/{info['chunks']}" if info["chunks"] else ""
+                lines.append(f"  - {name}: {info['state']} {detail}".rstrip())
+            if self.result:
+                lines.append("")
+                lines.append(self.result)
+            return "\n".join(lines)
+
+
+class IngestJobManager:
+    """
+    后台入库任务管理器
+    Args:
+        max_workers: 同时执行的入库任务数（不同知识库可以并行，同一知识库排队）
+        history: 保留的已结束任务数
+    """
+
+    def __init__(self, max_workers: int = Config.ingest_job_workers, history: int = Config.ingest_job_history):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="ingest-job")
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._history = history
+        self._lock = threading.Lock()
+
+    def submit(self, file_objs: List, kb_name: str) -> IngestJob:
+        # Gradio 的上传对象或路径字符串都转成带 name 属性的对象，与 batch_upload_to_kb 的参数一致
+        file_paths = [getattr(f, "name", f) for f in file_objs or []]
+        job = IngestJob(kb_name, file_paths)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._trim()
+        self._executor.submit(self._run, job)
+        print(f"已提交入库任务 {job.job_id}：知识库 {kb_name}，{len(file_paths)} 个文件")
+        return job
+
+    def _run(self, job: IngestJob):
+        # 状态和时间在界面线程的 render() 中读取，修改时持有任务的锁
+        with job._lock:
+            job.status = _STATUS_RUNNING
+            job.started_at = time.time()
+        report = {}
+        try:
+            files = [SimpleNamespace(name=path) for path in job.file_paths]
+            result = batch_upload_to_kb(files, job.kb_name, progress_callback=job.on_progress, report=report)
+            status = _STATUS_DONE if report.get("status") in (INGEST_SUCCESS, INGEST_UNCHANGED) else _STATUS_FAILED
+        except Exception as e:
+            traceback.print_exc()
+            result = f"入库任务 {job.job_id} 出错: {str(e)}"
+            status = _STATUS_FAILED
+        with job._lock:
+            job.result = result
+            job.status = status
+            job.finished_at = time.time()
+
+    def _trim(self):
+        # 只淘汰已结束的任务，进行中的任务始终保留
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self._history)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def active_jobs(self) -> List[IngestJob]:
+        with self._lock:
+            return [job for job in self._jobs.values() if not job.finished]
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> IngestJobManager:
+    """返回全局共享的入库任务管理器"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = IngestJobManager()
+        return _manager
@@ -0,0 +1,613 @@
+import json
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import traceback
+from itertools import chain, islice
+from concurrent.futures import wait, FIRST_COMPLETED
+from collections import Counter
+from typing import Callable, List, Dict, Iterable, Optional, Tuple
+import numpy as np
+from config.configs import Config
+from ingest.chunker import semantic_chunk, semantic_chunk_stream
+from ingest.dedup import ChunkDeduplicator
+from ingest.process_pool import new_process_pool
+from ingest.text_cleaner import clean_text, iter_clean_text, mark_clean
+from ingest.text_loader import iter_text_file
+from ingest.token_counter import truncate_for_embedding
+from kb.chunk_store import iter_metadata, read_metadata_sources
+from llm.embedding_cache import open_checkpoint
+from llm.embedding_client import vectorize_query
+from rag.indexer import build_index_from_vectors, to_metadata
+
+# 流式入库流水线：解析 -> 分块 -> 向量化 -> 建索引 四个阶段并发执行，阶段之间用有界队列连接。
+# 解析下一个 PDF 的同时，上一个文件的分块已经在调用 embedding API；
+# 队列有界，上游跑得快时会被阻塞等待，因此内存占用不随批次大小增长。
+
+# 队列结束标记
+_DONE = object()
+
+
+# 分块的清洗和校验：返回可以送去向量化的文本，无效分块返回 None
+def _finalize_chunk(chunk: dict) -> Optional[str]:
+    clean_chunk_text = clean_text(chunk["chunk"])
+    if not clean_chunk_text:
+        print(f"警告: 跳过无效分块 {chunk['id']}")
+        return None
+    # 如果文本超过 embedding 的输入上限，截断它
+    truncated_text = truncate_for_embedding(clean_chunk_text)
+    if len(truncated_text) < len(clean_chunk_text):
+        # 截断后重新清洗（只去掉末尾可能留下的空白），保证标记为已清洗的文本确实干净
+        clean_chunk_text = clean_text(truncated_text)
+        print(f"警告: 分块 {chunk['id']} 过长已被截断")
+    return clean_chunk_text
+
+
+# 分块子进程任务：返回清洗、校验后的分块文本列表（只传普通字符串，减少进程间序列化开销）和耗时
+# CleanStr 子类的序列化要走 Python 层的 __reduce_ex__，比普通 str 慢数倍，清洗标记由 _emit_chunks 重新加上
+def _chunk_worker(text: str) -> Tuple[List[str], float]:
+    start = time.perf_counter()
+    chunk_texts = [str(chunk_text) for chunk_text in map(_finalize_chunk, semantic_chunk(text)) if chunk_text]
+    return chunk_texts, time.perf_counter() - start
+
+
+# 超大文本文件的流式分块：边解码、边清洗、边分块，内存占用与文件大小无关
+def _iter_stream_chunks(file_path: str) -> Iterable[str]:
+    chunks = semantic_chunk_stream(iter_clean_text(iter_text_file(file_path)))
+    return (chunk_text for chunk_text in map(_finalize_chunk, chunks) if chunk_text)
+
+
+# 判断文件是否走流式入库（目前只对文本文件生效，PDF 需要看到全部页面才能去除页眉页脚）
+def _should_stream(file_path: str) -> bool:
+    if file_path.lower().endswith('.pdf') or Config.stream_ingest_min_mb <= 0:
+        return False
+    try:
+        return os.path.getsize(file_path) >= Config.stream_ingest_min_mb * 1024 * 1024
+    except OSError:
+        return False
+
+
+class _Counted:
+    """包装迭代器并统计产出的元素个数"""
+
+    def __init__(self, iterable: Iterable):
+        self._it = iter(iterable)
+        self.count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = next(self._it)
+        self.count += 1
+        return item
+
+
+class _SpilledMetadata:
+    """落盘的元数据（JSONL）：支持 len() 和按行顺序迭代，keep 给出时只产出对应的行"""
+
+    def __init__(self, path: str, keep: Optional[np.ndarray] = None, count: int = 0):
+        self.path = path
+        self.keep = keep
+        self.count = int(keep.sum()) if keep is not None else count
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for row, line in enumerate(f):
+                if self.keep is None or self.keep[row]:
+                    yield json.loads(line)
+
+
+class _IndexSpill:
+    """
+    建索引阶段的落盘缓冲：向量逐批追加到工作目录中的 float32 文件，元数据逐行写入 JSONL，
+    全部到齐后以内存映射方式交给建索引，内存占用与本次入库的分块总数无关
+    """
+
+    # 剔除失败文件的向量时每次复制的行数
+    _COPY_BLOCK_ROWS = 65536
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.vectors_path = os.path.join(directory, "pending_vectors.f32")
+        self.metadata_path = os.path.join(directory, "pending_metadata.jsonl")
+        self._vectors_file = open(self.vectors_path, 'wb')
+        self._metadata_file = open(self.metadata_path, 'w', encoding='utf-8')
+        self.count = 0
+        self.dim = 0
+
+    def append(self, vectors: np.ndarray, metadata: List[dict]):
+        self.dim = vectors.shape[1]
+        self._vectors_file.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        for meta in metadata:
+            self._metadata_file.write(json.dumps(meta, ensure_ascii=False) + "\n")
+        self.count += len(metadata)
+
+    def close(self):
+        self._vectors_file.close()
+        self._metadata_file.close()
+
+    def sources(self) -> List[Optional[str]]:
+        self.close()
+        return [meta.get("source") for meta in _SpilledMetadata(self.metadata_path, count=self.count)]
+
+    def load(self, keep: Optional[np.ndarray] = None) -> Tuple[np.ndarray, _SpilledMetadata]:
+        """返回 (向量的内存映射, 元数据)；keep 给出时只保留对应的行，向量按块复制到新文件"""
+        self.close()
+        n_kept = self.count if keep is None else int(keep.sum())
+        if n_kept == 0:
+            # 空文件不能做内存映射；没有新向量时只需要从索引中删除被替换文件的旧分块
+            return np.zeros((0, self.dim), dtype=np.float32), _SpilledMetadata(self.metadata_path, count=0)
+        vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(self.count, self.dim))
+        if keep is None:
+            return vectors, _SpilledMetadata(self.metadata_path, count=self.count)
+        kept_path = os.path.join(self.directory, "pending_vectors_kept.f32")
+        kept = np.memmap(kept_path, dtype=np.float32, mode='w+', shape=(n_kept, self.dim))
+        row = 0
+        for begin in range(0, self.count, self._COPY_BLOCK_ROWS):
+            block = vectors[begin:begin + self._COPY_BLOCK_ROWS][keep[begin:begin + self._COPY_BLOCK_ROWS]]
+            kept[row:row + len(block)] = block
+            row += len(block)
+        kept.flush()
+        del vectors
+        return kept, _SpilledMetadata(self.metadata_path, keep=keep)
+
+
+class StageStats:
+    """
+    单个阶段的吞吐统计
+    rate 按墙钟时间计算（该阶段第一项开始处理到最后一项处理完），是阶段的实际吞吐；
+    busy_seconds 是各工作线程/进程处理耗时之和，多个工作线程并行时会大于墙钟时间，只用于看单个工作者的负载
+    """
+
+    def __init__(self, name: str, unit: str):
+        self.name = name
+        self.unit = unit
+        self.count = 0
+        self.busy_seconds = 0.0
+        self.first_start = None
+        self.last_end = None
+        self._lock = threading.Lock()
+
+    def record(self, count: int, seconds: float):
+        """记录刚处理完的一项：count 个单位，处理耗时 seconds 秒"""
+        now = time.perf_counter()
+        with self._lock:
+            self.count += count
+            self.busy_seconds += seconds
+            start = now - seconds
+            self.first_start = start if self.first_start is None else min(self.first_start, start)
+            self.last_end = now
+
+    @property
+    def wall_seconds(self) -> float:
+        if self.first_start is None:
+            return 0.0
+        return self.last_end - self.first_start
+
+    @property
+    def rate(self) -> float:
+        wall = self.wall_seconds
+        return self.count / wall if wall > 0 else 0.0
+
+    def summary(self) -> str:
+        return (f"{self.name}: {self.count} {self.unit}，耗时 {self.wall_seconds:.2f}s"
+                f"（各工作者累计 {self.busy_seconds:.2f}s），{self.rate:.1f} {self.unit}/s")
+
+
+class IngestPipeline:
+    """
+    知识库入库流水线
+    Args:
+        kb_dir: 目标知识库目录（原始文件会被复制到这里）
+        index_path / metadata_path: 知识库索引与元数据路径
+        parse_workers: 解析阶段的并发线程数
+        chunk_workers: 分块阶段的进程数，<=1 时在分块线程内串行执行
+        queue_size: 阶段间队列的容量（以批次计）
+        embed_batch_size: 每次送入向量化阶段的分块数
+        dedup: 是否在向量化之前去掉重复/近似重复的分块
+        checkpoint_path: embedding 断点文件路径；任务失败时保留已完成批次的向量，重跑时复用，成功后删除
+        workspace_dir: 任务工作目录（见 kb.kb_jobs），索引和元数据先写到这里再替换到知识库目录
+        progress_callback: 进度回调 callback(stage, file_name, count)，stage 为 "parse" / "chunk" / "embed" /
+            "index" / "failed"；index 阶段 file_name 为 None。回调在流水线线程中调用，应尽快返回
+    """
+
+    def __init__(self, kb_dir: str, index_path: str, metadata_path: str,
+                 parse_workers: int = Config.ingest_parse_workers,
+                 chunk_workers: int = Config.ingest_chunk_workers,
+                 queue_size: int = Config.ingest_queue_size,
+                 embed_batch_size: int = Config.ingest_embed_batch_size,
+                 dedup: bool = Config.dedup_enabled,
+                 checkpoint_path: Optional[str] = None,
+                 workspace_dir: Optional[str] = None,
+                 progress_callback: Optional[Callable[[str, Optional[str], int], None]] = None):
+        self.kb_dir = kb_dir
+        self.index_path = index_path
+        self.metadata_path = metadata_path
+        self.parse_workers = max(1, parse_workers)
+        self.chunk_workers = max(1, chunk_workers)
+        self.queue_size = max(1, queue_size)
+        self.embed_batch_size = max(1, embed_batch_size)
+        # 去重器只在分块线程里使用，不需要加锁
+        self.deduplicator = ChunkDeduplicator() if dedup else None
+        self.checkpoint_path = checkpoint_path
+        self.workspace_dir = workspace_dir
+        self.progress_callback = progress_callback
+        self.checkpoint = None
+
+        self.stats = {
+            "parse": StageStats("解析", "files"),
+            "chunk": StageStats("分块", "chunks"),
+            "embed": StageStats("向量化", "vectors"),
+            "index": StageStats("建索引", "vectors"),
+        }
+        self._abort = threading.Event()
+        self._lock = threading.Lock()
+        self.errors: List[str] = []
+        self.file_chunks: Dict[str, int] = {}   # 文件路径 -> 分块数
+        self.failed_sources = set()             # 向量化失败的文件，其分块不会写入索引
+        self.num_vectors = 0
+        self.index_updated = False              # 建索引阶段是否正常结束（没有新向量、无需重写索引时也为 True）
+
+    # ------------------------------------------------------------------
+    # 队列工具：放入/取出时检查中止标记，任何一个阶段异常退出都不会让其他阶段永远阻塞
+    # ------------------------------------------------------------------
+    def _put(self, q: queue.Queue, item) -> bool:
+        while not self._abort.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue):
+        while not self._abort.is_set():
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _error(self, message: str):
+        print(message)
+        with self._lock:
+            self.errors.append(message)
+
+    def _notify(self, stage: str, file_name: Optional[str] = None, count: int = 0):
+        # 进度回调出错不影响入库本身
+        if self.progress_callback is None:
+            return
+        try:
+            self.progress_callback(stage, file_name, count)
+        except Exception as e:
+            print(f"进度回调出错: {str(e)}")
+
+    def _fail(self, stage: str, e: Exception):
+        self._error(f"入库流水线 {stage} 阶段出错: {str(e)}")
+        traceback.print_exc()
+        self._abort.set()
+
+    # ------------------------------------------------------------------
+    # 阶段 1：解析（多线程），输出 (文件路径, 文本)
+    # ------------------------------------------------------------------
+    def _parse_worker(self, file_queue: queue.Queue, text_queue: queue.Queue):
+        from ingest.ingest_service import process_single_file
+        while not self._abort.is_set():
+            try:
+                file_path = file_queue.get_nowait()
+            except queue.Empty:
+                return
+            file_name = os.path.basename(file_path)
+            if _should_stream(file_path):
+                # 超大文本文件不在这里读入，由分块阶段边读边切（text 为 None）
+                print(f"文件 {file_name} 较大，使用流式解析和分块")
+                self.stats["parse"].record(1, 0.0)
+                self._notify("parse", file_name)
+                if not self._put(text_queue, (file_path, None)):
+                    return
+                continue
+
+            start = time.perf_counter()
+            text = process_single_file(file_path)
+            self.stats["parse"].record(1, time.perf_counter() - start)
+
+            if isinstance(text, str) and text.startswith("处理文件"):
+                self._error(text)
+                self._notify("failed", file_name)
+                continue
+            if not text or not isinstance(text, str) or len(text.strip()) == 0:
+                self._error(f"文件 {file_name} 处理后内容为空")
+                self._notify("failed", file_name)
+                continue
+            self._notify("parse", file_name)
+            if not self._put(text_queue, (file_path, text)):
+                return
+
+    def _parse_stage(self, file_paths: List[str], text_queue: queue.Queue):
+        try:
+            file_queue = queue.Queue()
+            for file_path in file_paths:
+                file_queue.put(file_path)
+            workers = [threading.Thread(target=self._parse_worker, args=(file_queue, text_queue),
+                                        name=f"ingest-parse-{i}", daemon=True)
+                       for i in range(min(self.parse_workers, len(file_paths)))]
+            for w in workers:
+                w.start()
+            for w in workers:
+                w.join()
+        except Exception as e:
+            self._fail("解析", e)
+        finally:
+            self._put(text_queue, _DONE)
+
+    # ------------------------------------------------------------------
+    # 阶段 2：分块 + 清洗校验（进程池），按 embed_batch_size 切成批次输出
+    # ------------------------------------------------------------------
+    def _seed_deduplicator(self, append: bool, replace_sources: Iterable[str]):
+        # 增量入库时，新分块也要和知识库中已有的分块比较；即将被替换的文件不参与比较
+        if self.deduplicator is None or not append or not os.path.exists(self.metadata_path):
+            return
+        replace_sources = set(replace_sources)
+        self.deduplicator.seed((meta["chunk"], meta.get("source", "")) for meta in iter_metadata(self.metadata_path)
+                               if meta.get("source") not in replace_sources and meta.get("chunk"))
+
+    def _emit_chunks(self, file_path: str, chunk_texts: Iterable[str], batch_queue: queue.Queue) -> bool:
+        """
+        把一个文件的分块去重后按 embed_batch_size 切成批次送入向量化阶段
+        chunk_texts 可以是列表，也可以是流式分块的迭代器（边切分边送出，不在内存中攒下整个文件的分块）
+        """
+        file_name = os.path.basename(file_path)
+        chunk_iter = iter(chunk_texts)
+        first = next(chunk_iter, None)
+        if first is None:
+            self._error(f"文件 {file_name} 无法生成任何分块")
+            self._notify("failed", file_name)
+            return True
+
+        # 将处理后的文件保存到知识库目录（去重来源变化而重新入库的文件本身就是知识库中的副本）
+        kb_copy = os.path.join(self.kb_dir, file_name)
+        if os.path.abspath(file_path) != os.path.abspath(kb_copy):
+            try:
+                shutil.copy2(file_path, kb_copy)
+                print(f"已将文件 {file_name} 复制到知识库")
+            except Exception as e:
+                print(f"复制文件到知识库失败: {str(e)}")
+
+        # 子进程只回传分块文本，分块字典在这里组装；source 记录分块来源，增量更新时按文件替换
+        # 分块都经过 _finalize_chunk 清洗，标记为 CleanStr 后向量化阶段不再重复清洗
+        chunk_iter = chain([first], chunk_iter)
+        n_chunks = 0
+        n_kept = 0
+        while True:
+            group = list(islice(chunk_iter, self.embed_batch_size))
+            if not group:
+                break
+            n_chunks += len(group)
+            if self.deduplicator is not None:
+                group = self.deduplicator.filter(group, file_name)
+            batch = [{"id": f"chunk{chunk_id}", "chunk": mark_clean(chunk_text), "method": "semantic_chunk", "source": file_name}
+                     for chunk_id, chunk_text in enumerate(group, start=n_kept)]
+            n_kept += len(group)
+            if batch and not self._put(batch_queue, batch):
+                return False
+
+        if n_kept < n_chunks:
+            print(f"文件 {file_name} 去除重复分块 {n_chunks - n_kept} 个")
+        with self._lock:
+            self.file_chunks[file_path] = n_kept
+        # 分块全部与已有内容重复时，文件仍记为已入库（分块数为 0），不再送入向量化
+        print(f"文件 {file_name} 处理完成，生成 {n_kept} 个分块")
+        self._notify("chunk", file_name, n_kept)
+        return True
+
+    def _chunk_stage(self, text_queue: queue.Queue, batch_queue: queue.Queue,
+                     append: bool, replace_sources: Iterable[str]):
+        # 分块是纯 Python 的正则处理，受 GIL 限制，多个文件交给独立进程并行切分
+        # 进程池用 spawn 启动（见 ingest.process_pool），_chunk_worker 只接收和返回字符串
+        executor = new_process_pool(self.chunk_workers) if self.chunk_workers > 1 else None
+        max_pending = self.chunk_workers * 2
+        pending = {}
+        input_done = False
+        try:
+            self._seed_deduplicator(append, replace_sources)
+            while not self._abort.is_set():
+                # 在途任务未满时从解析阶段取下一个文件
+                if not input_done and len(pending) < max_pending:
+                    try:
+                        item = text_queue.get(timeout=0.05 if pending else 0.5)
+                    except queue.Empty:
+                        item = None
+                    if item is _DONE:
+                        input_done = True
+                    elif item is not None:
+                        file_path, text = item
+                        print(f"对文件 {os.path.basename(file_path)} 进行语义分块...")
+                        if text is None:
+                            # 流式分块在本线程中进行，分块随切随送，向量化阶段可以同时开始
+                            stream_start = time.perf_counter()
+                            counted = _Counted(_iter_stream_chunks(file_path))
+                            if not self._emit_chunks(file_path, counted, batch_queue):
+                                return
+                            self.stats["chunk"].record(counted.count, time.perf_counter() - stream_start)
+                        elif executor is None:
+                            chunk_texts, seconds = _chunk_worker(text)
+                            self.stats["chunk"].record(len(chunk_texts), seconds)
+                            if not self._emit_chunks(file_path, chunk_texts, batch_queue):
+                                return
+                        else:
+                            pending[executor.submit(_chunk_worker, text)] = file_path
+                        del text, item
+
+                if pending:
+                    can_take_more = not input_done and len(pending) < max_pending
+                    done, _ = wait(pending, timeout=0 if can_take_more else 0.5, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        file_path = pending.pop(future)
+                        chunk_texts, seconds = future.result()
+                        self.stats["chunk"].record(len(chunk_texts), seconds)
+                        if not self._emit_chunks(file_path, chunk_texts, batch_queue):
+                            return
+                elif input_done:
+                    break
+        except Exception as e:
+            self._fail("分块", e)
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+            self._put(batch_queue, _DONE)
+
+    # ------------------------------------------------------------------
+    # 阶段 3：向量化，输出 (分块批次, 向量矩阵)
+    # ------------------------------------------------------------------
+    def _embed_stage(self, batch_queue: queue.Queue, vector_queue: queue.Queue):
+        try:
+            while True:
+                batch = self._get(batch_queue)
+                if batch is _DONE:
+                    break
+                start = time.perf_counter()
+                vectors = vectorize_query([chunk["chunk"] for chunk in batch], checkpoint=self.checkpoint)
+                self.stats["embed"].record(len(vectors), time.perf_counter() - start)
+
+                if vectors.size == 0 or len(vectors) != len(batch):
+                    sources = {chunk["source"] for chunk in batch}
+                    self._error(f"向量化失败或向量数量({len(vectors)})与分块数({len(batch)})不匹配，"
+                                f"涉及文件: {sorted(sources)}")
+                    with self._lock:
+                        self.failed_sources.update(sources)
+                    for source in sources:
+                        self._notify("failed", source)
+                    continue
+                for source, n in Counter(chunk["source"] for chunk in batch).items():
+                    self._notify("embed", source, n)
+                if not self._put(vector_queue, (batch, np.asarray(vectors, dtype=np.float32))):
+                    return
+        except Exception as e:
+            self._fail("向量化", e)
+        finally:
+            self._put(vector_queue, _DONE)
+
+    # ------------------------------------------------------------------
+    # 阶段 4：建索引，向量和元数据随到随写入工作目录，全部到齐后一次性写入索引（增量模式下追加到已有索引）
+    # ------------------------------------------------------------------
+    def _index_stage(self, vector_queue: queue.Queue, append: bool, replace_sources: Iterable[str]):
+        # 没有任务工作目录时使用临时目录，结束后删除
+        scratch_dir = None if self.workspace_dir else tempfile.mkdtemp(prefix="ingest_index_")
+        spill = None
+        try:
+            spill = _IndexSpill(self.workspace_dir or scratch_dir)
+            while True:
+                item = self._get(vector_queue)
+                if item is _DONE:
+                    break
+                batch, vectors = item
+                spill.append(vectors, [to_metadata(chunk) for chunk in batch])
+
+            if self._abort.is_set():
+                return
+
+            # 某个文件只要有一个批次向量化失败，就整体不入索引，避免出现残缺文件
+            keep = None
+            if self.failed_sources and spill.count:
+                keep = np.array([source not in self.failed_sources for source in spill.sources()], dtype=bool)
+            vectors, metadata = spill.load(keep)
+
+            # 只替换本次成功重新入库的文件，处理失败的文件保留旧分块
+            with self._lock:
+                indexed_sources = {os.path.basename(path) for path in self.file_chunks} - self.failed_sources
+            replace = set(replace_sources) & indexed_sources
+            has_index = append and os.path.exists(self.index_path) and os.path.exists(self.metadata_path)
+            if not len(metadata) and not (has_index and replace):
+                # 分块全部与已有内容重复（或全部失败）且没有要删除的旧分块：索引不变，不重写
+                if has_index:
+                    self.num_vectors = len(read_metadata_sources(self.metadata_path))
+                self.index_updated = has_index
+                return
+
+            start = time.perf_counter()
+            self.num_vectors = build_index_from_vectors(
+                vectors, metadata, self.index_path, self.metadata_path,
+                append=append, replace_sources=replace, staging_dir=self.workspace_dir)
+            self.index_updated = True
+            self.stats["index"].record(len(metadata), time.perf_counter() - start)
+            self._notify("index", None, len(metadata))
+        except Exception as e:
+            self._fail("建索引", e)
+        finally:
+            if spill is not None:
+                spill.close()
+            if scratch_dir is not None:
+                shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    def _close_checkpoint(self):
+        if self.checkpoint is None:
+            return
+        # 全部成功时删除断点文件；有文件失败时保留，重新上传时已完成的批次不再调用 API
+        if self._abort.is_set() or self.failed_sources or self.stats["index"].count == 0:
+            self.checkpoint.close()
+            print(f"已完成批次的向量保存在断点文件 {self.checkpoint_path}，重新上传将从断点继续")
+        else:
+            self.checkpoint.destroy()
+        self.checkpoint = None
+
+    def run(self, file_paths: List[str], append: bool = False, replace_sources: Iterable[str] = ()) -> dict:
+        """
+        执行入库流水线
+        Returns:
+            {"indexed_files": {文件路径: 分块数}, "num_chunks": 入索引的分块数, "num_vectors": 索引总向量数,
+             "dedup_dropped": 去重丢弃的分块数, "dedup_refs": {文件路径: [被丢弃分块所重复的其他来源文件]},
+             "errors": [...], "stats": {阶段: StageStats}, "elapsed": 总耗时}
+        """
+        start = time.perf_counter()
+        if self.checkpoint_path:
+            self.checkpoint = open_checkpoint(self.checkpoint_path)
+        text_queue = queue.Queue(maxsize=self.parse_workers)
+        batch_queue = queue.Queue(maxsize=self.queue_size)
+        vector_queue = queue.Queue(maxsize=self.queue_size)
+
+        threads = [
+            threading.Thread(target=self._parse_stage, args=(file_paths, text_queue), name="ingest-parse"),
+            threading.Thread(target=self._chunk_stage, args=(text_queue, batch_queue, append, replace_sources),
+                             name="ingest-chunk"),
+            threading.Thread(target=self._embed_stage, args=(batch_queue, vector_queue), name="ingest-embed"),
+            threading.Thread(target=self._index_stage, args=(vector_queue, append, replace_sources),
+                             name="ingest-index"),
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        elapsed = time.perf_counter() - start
+        self._close_checkpoint()
+        # 分块全部与已有内容重复的文件也记为已入库（分块数为 0），写入文件清单后不会被反复重新处理
+        indexed_files = {} if self._abort.is_set() or not self.index_updated else {
+            path: n for path, n in self.file_chunks.items()
+            if os.path.basename(path) not in self.failed_sources
+        }
+        references = self.deduplicator.references if self.deduplicator is not None else {}
+        dedup_refs = {path: sorted(references[os.path.basename(path)])
+                      for path in indexed_files if os.path.basename(path) in references}
+        result = {
+            "indexed_files": indexed_files,
+            "num_chunks": self.stats["index"].count,
+            "num_vectors": self.num_vectors,
+            "dedup_dropped": self.deduplicator.dropped if self.deduplicator is not None else 0,
+            "dedup_refs": dedup_refs,
+            "errors": list(self.errors),
+            "stats": self.stats,
+            "elapsed": elapsed,
+        }
+        print(f"入库流水线结束，总耗时 {elapsed:.2f}s")
+        for stage in self.stats.values():
+            print("  " + stage.summary())
+        if self.deduplicator is not None:
+            print(f"  去重: 检查 {self.deduplicator.seen} 个分块，丢弃 {self.deduplicator.dropped} 个")
+        return result
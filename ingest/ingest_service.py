@@ -1,17 +1,15 @@
-from typing import List
+from typing import Callable, List, Optional
 import os
 from config.configs import Config
 from ingest.pdf_loader import extract_text_from_pdf
-import chardet  # 用于自动检测编码
 from ingest.text_cleaner import clean_text
+from ingest.text_loader import read_text_file
 import traceback
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from ingest.chunker import semantic_chunk
-from ingest.vectorizer import vectorize_file
-from rag.indexer import build_faiss_index
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import json
-import shutil
+from ingest.ingest_pipeline import IngestPipeline
+from kb.kb_paths import get_kb_paths
+from kb.kb_manifest import compute_file_hash, find_dedup_dependents, load_manifest, save_manifest
+from kb.kb_jobs import kb_ingest_job
+import time
 
 
 # 创建知识库根目录和临时文件目录
@@ -36,39 +34,8 @@ def process_single_file(file_path: str) -> str:
             if not text:
                 return f"PDF文件 {file_path} 内容为空或无法提取"
         else:
-            # "rb"：代表以二进制（Binary）模式读取。
-            with open(file_path, "rb") as f:
-                content = f.read()
-            # chardet 是一个著名的字符集检测库。
-            #  核心动作：它会对 content 里的字节进行统计分析（比如根据某些字节出现的频率特征），并给出一个最可能的编码方案。
-            result = chardet.detect(content)
-            detected_encoding = result['encoding']
-            confidence = result['confidence']
-
-            # 尝试多种编码方式
-            if detected_encoding and confidence > 0.7:
-                try:
-                    text = content.decode(detected_encoding)
-                    print(f"文件 {file_path} 使用检测到的编码 {detected_encoding} 解码成功")
-                except UnicodeDecodeError:
-                    text = content.decode('utf-8', errors='ignore')
-                    print(f"文件 {file_path} 使用 {detected_encoding} 解码失败，强制使用 UTF-8 忽略非法字符")
-            else:
-                # 尝试多种常见编码
-                encodings = ['utf-8', 'gbk', 'gb18030', 'gb2312', 'latin-1', 'utf-16', 'cp936', 'big5']
-                text = None
-                for encoding in encodings:
-                    try:
-                        text = content.decode(encoding)
-                        print(f"文件 {file_path} 使用 {encoding} 解码成功")
-                        break
-                    except UnicodeDecodeError:
-                        continue
-
-                # 如果所有编码都失败，使用忽略错误的方式解码
-                if text is None:
-                    text = content.decode('utf-8', errors='ignore')
-                    print(f"警告：文件 {file_path} 强制使用 UTF-8，已经忽略非法字符")
+            # 严格 UTF-8 快速路径，必要时只对开头的样本做编码检测，按块增量解码
+            text = read_text_file(file_path)
 
         # 确保文本是干净的，移除非法字符
         text = clean_text(text)
@@ -79,127 +46,157 @@ def process_single_file(file_path: str) -> str:
         return f"处理文件 {file_path} 失败：{str(e)}"
 
 
+# 入库结果状态，写在 report["status"] 中，调用方据此判断成败，不解析返回的提示文本
+INGEST_SUCCESS = "success"      # 索引已更新（部分文件失败时也算成功，失败的文件列在 errors 中）
+INGEST_UNCHANGED = "unchanged"  # 所有文件均未变化，无需重新索引
+INGEST_FAILED = "failed"        # 索引没有更新
+
+
+def get_checkpoint_path(kb_name: str) -> str:
+    """知识库的 embedding 断点文件路径（见 IngestPipeline 的 checkpoint_path）"""
+    return os.path.join(OUTPUT_DIR, "embed_checkpoints", f"{kb_name}.sqlite")
+
+
 # 批量处理并索引文件 - 修改为支持指定知识库
-def process_and_index_files(file_objs: List, kb_name: str = DEFAULT_KB) -> str:
-    """处理并索引文件到指定的知识库"""
+def process_and_index_files(file_objs: List, kb_name: str = DEFAULT_KB,
+                            incremental: bool = Config.incremental_index,
+                            progress_callback: Optional[Callable[[str, Optional[str], int], None]] = None,
+                            report: Optional[dict] = None) -> str:
+    """
+    处理并索引文件到指定的知识库
+    incremental=True 时按文件清单中的 sha256 跳过未变化的文件，只向量化新增/变化的文件并追加到已有索引；
+    incremental=False 时用本批文件全量重建索引。
+    progress_callback: 进度回调 callback(stage, file_name, count)，见 IngestPipeline；未变化而跳过的文件以 "skipped" 上报
+    report: 传入字典时写入结构化结果（后台任务和命令行入口使用）：status（INGEST_SUCCESS / INGEST_UNCHANGED /
+        INGEST_FAILED）、skipped_files、reingested_files、errors，
+        流水线执行后还有 IngestPipeline.run 返回的各项（indexed_files、num_chunks、stats、elapsed 等）
+    """
+    if report is None:
+        report = {}
+    report["status"] = INGEST_FAILED
     # 确保知识库目录存在
     kb_dir = os.path.join(KB_BASE_DIR, kb_name)
     os.makedirs(kb_dir, exist_ok=True)
 
-    # 设置临时处理文件路径
-    semantic_chunk_output = os.path.join(OUTPUT_DIR, "semantic_chunk_output.json")
-    semantic_chunk_vector = os.path.join(OUTPUT_DIR, "semantic_chunk_vector.json")
-
     # 设置知识库索引文件路径
-    semantic_chunk_index = os.path.join(kb_dir, "semantic_chunk.index")
-    semantic_chunk_metadata = os.path.join(kb_dir, "semantic_chunk_metadata.json")
+    kb_paths = get_kb_paths(kb_name)
+    semantic_chunk_index = kb_paths["index_path"]
+    semantic_chunk_metadata = kb_paths["metadata_path"]
+    manifest_path = kb_paths["manifest_path"]
 
-    all_chunks = []
     error_messages = []
     try:
         if not file_objs or len(file_objs) == 0:
             return "错误：没有选择任何文件"
 
-        print(f"开始处理 {len(file_objs)} 个文件，目标知识库: {kb_name}...")
-        with ThreadPoolExecutor(max_workers=4) as executor:
-            future_to_file = {executor.submit(process_single_file, file_obj.name): file_obj for file_obj in file_objs}
-            for future in as_completed(future_to_file):
-                result = future.result()
-                file_obj = future_to_file[future]
-                file_name = file_obj.name
-
-                if isinstance(result, str) and result.startswith("处理文件"):
-                    error_messages.append(result)
-                    print(result)
+        # 同一知识库的任务串行执行（文件清单和索引都要读改写）；每个任务有独立的工作目录，结束后删除
+        with kb_ingest_job(kb_name) as workspace:
+            # 增量模式：索引存在时才信任清单，否则清单已过期，所有文件都按新文件处理
+            has_index = os.path.exists(semantic_chunk_index) and os.path.exists(semantic_chunk_metadata)
+            append = incremental and has_index
+            manifest = load_manifest(manifest_path) if append else {}
+
+            # 计算文件哈希，筛出需要处理的文件
+            file_hashes = {}
+            replace_sources = set()
+            pending_files = []
+            skipped_files = []
+            for file_obj in file_objs:
+                file_basename = os.path.basename(file_obj.name)
+                try:
+                    file_hash = compute_file_hash(file_obj.name)
+                except Exception as e:
+                    error_messages.append(f"文件 {file_basename} 读取失败: {str(e)}")
                     continue
-
-                # 检查结果是否为有效文本
-                if not result or not isinstance(result, str) or len(result.strip()) == 0:
-                    error_messages.append(f"文件 {file_name} 处理后内容为空")
-                    print(f"警告: 文件 {file_name} 处理后内容为空")
+                entry = manifest.get(file_basename)
+                if entry and entry.get("sha256") == file_hash:
+                    skipped_files.append(file_basename)
+                    if progress_callback is not None:
+                        progress_callback("skipped", file_basename, 0)
                     continue
-
-                print(f"对文件 {file_name} 进行语义分块...")
-                chunks = semantic_chunk(result)
-
-                if not chunks or len(chunks) == 0:
-                    error_messages.append(f"文件 {file_name} 无法生成任何分块")
-                    print(f"警告: 文件 {file_name} 无法生成任何分块")
+                if entry:
+                    # 同名文件内容发生变化，旧分块需要从索引中替换掉
+                    replace_sources.add(file_basename)
+                file_hashes[file_obj.name] = file_hash
+                pending_files.append(file_obj.name)
+
+            # 有分块因与被替换文件重复而被去重丢弃的文件，用知识库中保存的副本一起重新入库，避免内容丢失
+            pending_names = {os.path.basename(path) for path in pending_files}
+            reingested_files = []
+            for file_basename in find_dedup_dependents(manifest, replace_sources):
+                if file_basename in pending_names:
                     continue
-
-                # 将处理后的文件保存到知识库目录
-                file_basename = os.path.basename(file_name)
-                dest_file_path = os.path.join(kb_dir, file_basename)
+                kb_copy = os.path.join(kb_dir, file_basename)
                 try:
-                    shutil.copy2(file_name, dest_file_path)
-                    print(f"已将文件 {file_basename} 复制到知识库 {kb_name}")
+                    file_hash = compute_file_hash(kb_copy)
                 except Exception as e:
-                    print(f"复制文件到知识库失败: {str(e)}")
-
-                all_chunks.extend(chunks)
-                print(f"文件 {file_name} 处理完成，生成 {len(chunks)} 个分块")
-
-        if not all_chunks:
-            return "所有文件处理失败或内容为空\n" + "\n".join(error_messages)
-
-        # 确保分块内容干净且长度合适
-        valid_chunks = []
-        for chunk in all_chunks:
-            # 深度清理文本
-            clean_chunk_text = clean_text(chunk["chunk"])
-
-            # 检查清理后的文本是否有效
-            if clean_chunk_text and 1 <= len(clean_chunk_text) <= 8000:
-                chunk["chunk"] = clean_chunk_text
-                valid_chunks.append(chunk)
-            elif len(clean_chunk_text) > 8000:
-                # 如果文本太长，截断它
-                chunk["chunk"] = clean_chunk_text[:8000]
-                valid_chunks.append(chunk)
-                print(f"警告: 分块 {chunk['id']} 过长已被截断")
+                    error_messages.append(f"文件 {file_basename} 依赖的去重来源已变化，但无法读取知识库中的副本: {str(e)}")
+                    continue
+                replace_sources.add(file_basename)
+                file_hashes[kb_copy] = file_hash
+                pending_files.append(kb_copy)
+                reingested_files.append(file_basename)
+                if file_basename in skipped_files:
+                    skipped_files.remove(file_basename)
+
+            report["skipped_files"] = skipped_files
+            report["reingested_files"] = reingested_files
+            if reingested_files:
+                print(f"去重依赖的文件已变化，重新入库 {len(reingested_files)} 个文件: {reingested_files}")
+            report["errors"] = error_messages
+            if skipped_files:
+                print(f"跳过 {len(skipped_files)} 个未变化的文件: {skipped_files}")
+            if not pending_files:
+                if error_messages:
+                    return "所有文件处理失败\n" + "\n".join(error_messages)
+                report["status"] = INGEST_UNCHANGED
+                return f"知识库 {kb_name} 中的 {len(skipped_files)} 个文件均未变化，无需重新索引。"
+
+            # 解析、分块、向量化、建索引以流水线方式并发执行
+            if append:
+                print(f"开始增量处理 {len(pending_files)} 个文件，目标知识库: {kb_name}...")
             else:
-                print(f"警告: 跳过无效分块 {chunk['id']}")
-
-        if not valid_chunks:
-            return "所有生成的分块内容无效或为空\n" + "\n".join(error_messages)
-
-        print(f"处理了 {len(all_chunks)} 个分块，有效分块数: {len(valid_chunks)}")
-
-        # 保存语义分块
-        with open(semantic_chunk_output, 'w', encoding='utf-8') as json_file:
-            json.dump(valid_chunks, json_file, ensure_ascii=False, indent=4)
-        print(f"语义分块完成: {semantic_chunk_output}")
-
-        # 向量化语义分块
-        print(f"开始向量化 {len(valid_chunks)} 个分块...")
-        vectorize_file(valid_chunks, semantic_chunk_vector)
-        print(f"语义分块向量化完成: {semantic_chunk_vector}")
-
-        # 验证向量文件是否有效
-        try:
-            with open(semantic_chunk_vector, 'r', encoding='utf-8') as f:
-                vector_data = json.load(f)
-
-            if not vector_data or len(vector_data) == 0:
-                return f"向量化失败: 生成的向量文件为空\n" + "\n".join(error_messages)
-
-            # 检查向量数据结构
-            if 'vector' not in vector_data[0]:
-                return f"向量化失败: 数据中缺少向量字段\n" + "\n".join(error_messages)
-
-            print(f"成功生成 {len(vector_data)} 个向量")
-        except Exception as e:
-            return f"读取向量文件失败: {str(e)}\n" + "\n".join(error_messages)
-
-        # 构建索引
-        print(f"开始为知识库 {kb_name} 构建索引...")
-        build_faiss_index(semantic_chunk_vector, semantic_chunk_index, semantic_chunk_metadata)
-        print(f"知识库 {kb_name} 索引构建完成: {semantic_chunk_index}")
-
-        status = f"知识库 {kb_name} 更新成功！共处理 {len(valid_chunks)} 个有效分块。\n"
-        if error_messages:
-            status += "以下文件处理过程中出现问题：\n" + "\n".join(error_messages)
-        return status
+                print(f"开始处理 {len(pending_files)} 个文件，目标知识库: {kb_name}...")
+            # 断点文件按知识库区分，上一次同一知识库的上传中途失败时，这次会复用已完成的向量
+            checkpoint_path = get_checkpoint_path(kb_name)
+            pipeline = IngestPipeline(kb_dir, semantic_chunk_index, semantic_chunk_metadata,
+                                      checkpoint_path=checkpoint_path, workspace_dir=workspace,
+                                      progress_callback=progress_callback)
+            result = pipeline.run(pending_files, append=append, replace_sources=replace_sources)
+            error_messages.extend(result["errors"])
+            report.update({key: value for key, value in result.items() if key != "errors"})
+
+            if not result["indexed_files"]:
+                return "所有文件处理失败或内容为空\n" + "\n".join(error_messages)
+            print(f"知识库 {kb_name} 索引构建完成: {semantic_chunk_index}")
+
+            # 索引写入成功后再更新文件清单，保证清单与索引内容一致
+            now = time.strftime("%Y-%m-%d %H:%M:%S")
+            for file_path, n_chunks in result["indexed_files"].items():
+                manifest[os.path.basename(file_path)] = {
+                    "sha256": file_hashes[file_path],
+                    "size": os.path.getsize(file_path),
+                    "chunks": n_chunks,
+                    "indexed_at": now,
+                    "dedup_refs": result["dedup_refs"].get(file_path, [])
+                }
+            save_manifest(manifest_path, manifest)
+            report["status"] = INGEST_SUCCESS
+
+            stats = result["stats"]
+            status = f"知识库 {kb_name} 更新成功！共处理 {result['num_chunks']} 个有效分块，索引共 {result['num_vectors']} 个向量。\n"
+            status += (f"耗时 {result['elapsed']:.1f}s，"
+                       f"解析 {stats['parse'].rate:.2f} files/s，分块 {stats['chunk'].rate:.0f} chunks/s，"
+                       f"向量化 {stats['embed'].rate:.1f} vectors/s\n")
+            if result["dedup_dropped"]:
+                status += f"去除重复/近似重复分块 {result['dedup_dropped']} 个。\n"
+            if reingested_files:
+                status += f"重新入库 {len(reingested_files)} 个去重依赖已变化的文件。\n"
+            if skipped_files:
+                status += f"跳过 {len(skipped_files)} 个未变化的文件。\n"
+            if error_messages:
+                status += "以下文件处理过程中出现问题：\n" + "\n".join(error_messages)
+            return status
     except Exception as e:
         error = f"知识库 {kb_name} 索引构建过程中出错：{str(e)}"
         print(error)
@@ -208,8 +205,13 @@ def process_and_index_files(file_objs: List, kb_name: str = DEFAULT_KB) -> str:
 
 
 # 添加处理函数，批量上传文件到指定知识库
-def batch_upload_to_kb(file_objs: List, kb_name: str) -> str:
-    """批量上传文件到指定知识库并进行处理"""
+def batch_upload_to_kb(file_objs: List, kb_name: str, incremental: bool = Config.incremental_index,
+                       progress_callback: Optional[Callable[[str, Optional[str], int], None]] = None,
+                       report: Optional[dict] = None) -> str:
+    """批量上传文件到指定知识库并进行处理；report 见 process_and_index_files"""
+    if report is None:
+        report = {}
+    report["status"] = INGEST_FAILED
     try:
         if not kb_name or not kb_name.strip():
             return "错误：未指定知识库"
@@ -222,7 +224,8 @@ def batch_upload_to_kb(file_objs: List, kb_name: str) -> str:
         if not file_objs or len(file_objs) == 0:
             return "错误：未选择任何文件"
 
-        return process_and_index_files(file_objs, kb_name)
+        return process_and_index_files(file_objs, kb_name, incremental=incremental,
+                                       progress_callback=progress_callback, report=report)
     except Exception as e:
         return f"上传文件到知识库失败: {str(e)}"
 
@@ -1,18 +1,68 @@
 import fitz  # PyMuPDF
+import re
+from collections import deque
+from typing import Iterator, List, Tuple
+from config.configs import Config
+from ingest.boilerplate import strip_boilerplate
+from ingest.process_pool import new_process_pool
+
+# 孤立的代理字符（surrogate）无法编码成 UTF-8，原先每页做一次 encode/decode 往返来去掉它们；
+# 这里用预编译正则一次扫描，没有匹配时直接返回原字符串，不产生拷贝
+_SURROGATES = re.compile('[\ud800-\udfff]')
+
+
+def _clean_page_text(page_text: str) -> str:
+    return _SURROGATES.sub('', page_text)
+
+
+# 进程池任务：提取 [start, end) 范围内的页面，页码从 1 开始
+def _extract_page_range(pdf_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    with fitz.open(pdf_path) as doc:
+        return [(page_no + 1, _clean_page_text(doc[page_no].get_text())) for page_no in range(start, end)]
+
+
+# 逐页提取PDF文本
+def iter_pdf_pages(pdf_path: str, workers: int = Config.pdf_workers,
+                   pages_per_task: int = Config.pdf_pages_per_task) -> Iterator[Tuple[int, str]]:
+    """
+    惰性地按顺序产出 (页码, 页面文本)，页码从 1 开始
+    页数不少于 Config.pdf_parallel_min_pages 的大 PDF 会按页段分发到进程池并行提取，
+    同时在途的页段数有上限，消费方跟不上时不会把整本手册堆在内存里。
+    """
+    with fitz.open(pdf_path) as doc:
+        page_count = doc.page_count
+        if workers <= 1 or page_count < Config.pdf_parallel_min_pages:
+            for page in doc:
+                yield page.number + 1, _clean_page_text(page.get_text())
+            return
+
+    ranges = [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+    max_pending = workers * 2
+    # 进程池用 spawn 启动（见 ingest.process_pool），_extract_page_range 只接收路径和页段
+    with new_process_pool(min(workers, len(ranges))) as executor:
+        pending = deque()
+        for start, end in ranges:
+            pending.append(executor.submit(_extract_page_range, pdf_path, start, end))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
 
 # PDF文本提取
 def extract_text_from_pdf(pdf_path):
     try:
-        doc = fitz.open(pdf_path)
-        text = ""
-        for page in doc:
-            page_text = page.get_text()
-            # 清理不可打印字符，尝试用 UTF-8 解码，失败时忽略非法字符
-            text += page_text.encode('utf-8', errors='ignore').decode('utf-8')
+        pages = [page_text for _, page_text in iter_pdf_pages(pdf_path)]
+        # 去掉跨页重复的页眉页脚和目录页，需要看到全部页面才能判断哪些行是重复的
+        if Config.pdf_strip_boilerplate:
+            pages, stats = strip_boilerplate(pages)
+            if stats["header_lines"] or stats["toc_pages"]:
+                print(f"PDF文件 {pdf_path} 去除页眉页脚 {stats['header_lines']} 行，目录页 {stats['toc_pages']} 页")
+        # 一次性 join，避免 text += page_text 在长文档上的反复拷贝
+        text = "".join(pages)
         if not text.strip():
             print(f"警告：PDF文件 {pdf_path} 提取内容为空")
         return text
     except Exception as e:
         print(f"PDF文本提取失败：{str(e)}")
         return ""
-
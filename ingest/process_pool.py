@@ -0,0 +1,18 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from config.configs import Config
+
+# 入库用到的进程池（分块、大 PDF 按页段解析）统一用 spawn / forkserver 启动子进程。
+# 入库发生在已经有多个线程的进程里（流水线的解析/向量化线程、Gradio 服务、后台任务线程），
+# Linux 默认的 fork 会把其他线程当时持有的锁（logging、分词器、sqlite 等）原样复制到子进程，
+# 子进程里没有线程会释放它们，可能直接死锁。spawn 启动的子进程重新导入模块，
+# 因此提交给进程池的函数必须定义在模块顶层，参数只能是可序列化的普通对象。
+
+
+def new_process_pool(max_workers: int) -> ProcessPoolExecutor:
+    """创建使用 Config.ingest_process_start_method 启动子进程的进程池"""
+    method = Config.ingest_process_start_method
+    if method not in multiprocessing.get_all_start_methods() or method == "fork":
+        print(f"警告: 进程启动方式 {method} 不可用或不安全，改用 spawn")
+        method = "spawn"
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(method))
@@ -1,6 +1,6 @@
 import os
+import time
 import torch
-from functional import seq
 import numpy as np
 import torch.nn.functional as F  
 from torch import cosine_similarity
@@ -20,15 +20,63 @@ class TextVector():
         self.model_name = getattr(cfg, 'model_name', "text-embedding-v3")
         self.dimensions = getattr(cfg, 'dimensions', 1024)
         self.batch_size = getattr(cfg, 'batch_size', 10)
-        
+
+        # 本地模型推理参数
+        self.runtime = getattr(cfg, 'local_embedding_runtime', "torch")
+        self.onnx_path = getattr(cfg, 'local_embedding_onnx_path', "") or os.path.join(self.bert_path, "model.onnx")
+        self.threads = getattr(cfg, 'local_embedding_threads', 0)
+        self.local_batch_size = getattr(cfg, 'local_embedding_batch_size', 32)
+        self.max_length = getattr(cfg, 'local_embedding_max_length', 512)
+        self.model = None
+        self.session = None
+
         # 只有在不使用API时才加载本地模型
         if not self.use_api:
             self.load_model()
 
+    @property
+    def model_id(self):
+        """本地模型的标识（用作 embedding 缓存键的模型名），int8 / onnx 的向量与 fp32 略有差异，分开缓存"""
+        return f"local:{os.path.basename(os.path.normpath(self.bert_path))}:{self.runtime}"
+
     def load_model(self):
-        """载入模型"""
+        """载入模型：torch（可选动态 int8 量化）或 ONNX Runtime"""
+        from transformers import AutoTokenizer, AutoModel
+
+        start = time.perf_counter()
         self.tokenizer = AutoTokenizer.from_pretrained(self.bert_path)
-        self.model = AutoModel.from_pretrained(self.bert_path)
+        if self.threads > 0:
+            torch.set_num_threads(self.threads)
+        if self.runtime == "onnx":
+            self.session = self._load_onnx()
+            if self.session is None:
+                self.runtime = "torch"
+        if self.session is None:
+            self.model = AutoModel.from_pretrained(self.bert_path)
+            self.model.eval()
+            if self.runtime == "int8":
+                # 动态量化：Linear 层权重转为 int8，CPU 推理更快、占用内存更小
+                self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        print(f"本地 embedding 模型 {self.bert_path} 加载完成（{self.runtime}，"
+              f"线程数 {self.threads if self.threads > 0 else torch.get_num_threads()}），"
+              f"耗时 {time.perf_counter() - start:.1f}s")
+
+    def _load_onnx(self):
+        """载入 ONNX 模型，onnxruntime 未安装或模型文件不存在时返回 None（退回 torch 推理）"""
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            print("警告: 未安装 onnxruntime，本地 embedding 改用 torch 推理")
+            return None
+        if not os.path.exists(self.onnx_path):
+            print(f"警告: ONNX 模型 {self.onnx_path} 不存在，本地 embedding 改用 torch 推理")
+            return None
+        options = ort.SessionOptions()
+        if self.threads > 0:
+            options.intra_op_num_threads = self.threads
+        session = ort.InferenceSession(self.onnx_path, options, providers=["CPUExecutionProvider"])
+        self.onnx_inputs = [item.name for item in session.get_inputs()]
+        return session
 
     def mean_pooling(self, model_output, attention_mask):
         """采用序列mean-pooling获得句子的表征向量"""
@@ -36,19 +84,52 @@ class TextVector():
         input_mask_expanded = attention_mask.unsqueeze(-1).expand(token_embeddings.size()).float()
         return torch.sum(token_embeddings * input_mask_expanded, 1) / torch.clamp(input_mask_expanded.sum(1), min=1e-9)
 
+    def _encode_batch(self, sentences):
+        """对一个批次做推理和 mean-pooling，返回 (批大小, 维度) 的 numpy 数组"""
+        if self.session is not None:
+            encoded_input = self.tokenizer(sentences, padding=True, truncation=True,
+                                           max_length=self.max_length, return_tensors='np')
+            feeds = {name: encoded_input[name].astype(np.int64) for name in self.onnx_inputs if name in encoded_input}
+            token_embeddings = self.session.run(None, feeds)[0]
+            mask = encoded_input['attention_mask'][..., None].astype(np.float32)
+            return (token_embeddings * mask).sum(1) / np.clip(mask.sum(1), 1e-9, None)
+
+        encoded_input = self.tokenizer(sentences, padding=True, truncation=True,
+                                       max_length=self.max_length, return_tensors='pt')
+        with torch.inference_mode():
+            model_output = self.model(**encoded_input)
+        return self.mean_pooling(model_output, encoded_input['attention_mask']).cpu().numpy()
+
+    def encode(self, sentences, batch_size=None):
+        """
+        本地模型向量化，返回按输入顺序排列、L2 归一化的 float32 矩阵 (n, dim)，与 API 向量一样可直接用于内积索引
+        先按文本长度排序再分批，同一批内的文本长度接近，padding 只补到批内最长的文本
+        """
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        if batch_size is None:
+            batch_size = self.local_batch_size
+        order = sorted(range(len(sentences)), key=lambda i: len(sentences[i]), reverse=True)
+        vectors = None
+        for start in range(0, len(order), batch_size):
+            indexes = order[start:start + batch_size]
+            batch_vectors = self._encode_batch([sentences[i] for i in indexes])
+            if vectors is None:
+                vectors = np.empty((len(sentences), batch_vectors.shape[1]), dtype=np.float32)
+            vectors[indexes] = batch_vectors
+        if vectors is None:
+            return np.zeros((0, self.dimensions), dtype=np.float32)
+        vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors
+
     def get_vec(self, sentences):
         """通过模型获取句子的向量"""
         if self.use_api:
             # 如果使用API，重定向到API方法
             return self.get_vec_api(sentences)
-            
-        # 否则使用原始BERT方法
-        encoded_input = self.tokenizer(sentences, padding=True, truncation=True, return_tensors='pt')
-        with torch.no_grad():
-            model_output = self.model(**encoded_input)
-        sentence_embeddings = self.mean_pooling(model_output, encoded_input['attention_mask'])
-        sentence_embeddings = sentence_embeddings.data.cpu().numpy().tolist()
-        return sentence_embeddings
+
+        # 否则使用本地模型
+        return self.encode(sentences).tolist()
     
     def get_vec_api(self, query, batch_size=None):
         """通过API获取句子的向量"""
@@ -126,14 +207,8 @@ class TextVector():
             vectors = self.get_vec_api(data, bs)
             return torch.tensor(np.array(vectors)) if len(vectors) > 0 else torch.tensor(np.array([]))
         
-        # 否则使用原始BERT方法
-        data = seq(data).grouped(bs)
-        all_vectors = []
-        for batch in data:
-            vecs = self.get_vec(batch)
-            all_vectors.extend(vecs)
-        all_vectors = torch.tensor(np.array(all_vectors))
-        return all_vectors
+        # 否则使用本地模型（按长度分桶批量推理）
+        return torch.tensor(self.encode(data, bs))
 
     def vector_similarity(self, vectors):
         """以[query，text1，text2...]来计算query与text1，text2,...的cosine相似度"""
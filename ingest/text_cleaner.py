@@ -1,20 +1,84 @@
 import re
+from typing import Iterable, Iterator
+
+_CONTROL_CHARS = re.compile(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]')
+_WHITESPACE = re.compile(r'\s+')
+_DOT_LEADERS = re.compile(r'\.\.\.+')
+
+
+class CleanStr(str):
+    """
+    clean_text 的输出标记：已经清洗过的文本再次传给 clean_text 时直接返回，不再重复处理
+    切片、拼接等操作得到的是普通 str，标记随之消失，所以被改动过的文本仍会重新清洗
+    """
+    __slots__ = ()
+
+
+def mark_clean(text: str) -> CleanStr:
+    """把确定已经清洗过的文本标记为 CleanStr（例如跨进程传回、丢失了标记的分块）"""
+    return text if isinstance(text, CleanStr) else CleanStr(text)
+
 
 def clean_text(text):
     """清理文本中的非法字符，控制文本长度"""
     if not text:
         return ""
-    # 移除控制字符，保留换行和制表符
-    text = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]', '', text)
-    # 移除重复的空白字符
-    # \s+ 匹配一个或多个空格、换行、制表符，并将其统一替换成一个空格
+    # 上游已经清洗过（入库时整个文件清洗一次，分块再清洗一次，向量化时不必第三次）
+    if isinstance(text, CleanStr):
+        return text
+    # 移除控制字符，保留换行和制表符（大多数文本没有控制字符，先查找再替换）
+    if _CONTROL_CHARS.search(text):
+        text = _CONTROL_CHARS.sub('', text)
+    # 移除重复的空白字符，并去掉首尾空白
+    # str.split() 与 \s+ 的空白字符定义相同，按空白切开再用一个空格拼接，等价于 re.sub(r'\s+', ' ', text).strip()，
+    # 但在一次 C 层扫描中完成，比正则替换快一倍以上
     # 警惕：\s+ 可能会杀掉表格结构。 如果半导体手册里有很多复杂的参数对比表，\s+ 会把原本分行的表格数据全部“揉”成一坨
-    text = re.sub(r'\s+', ' ', text)
+    text = ' '.join(text.split())
     # 确保文本长度在合理范围内
 
-    # 针对目录的...........，
-    text = re.sub(r'\.\.\.+', ' ', text)
-    return text.strip()
+    # 针对目录的...........，没有省略号串时跳过
+    if '...' in text:
+        text = _DOT_LEADERS.sub(' ', text).strip()
+    return CleanStr(text)
+
+
+def _is_run_char(ch: str) -> bool:
+    # 可能属于跨片段的空白串、控制字符或省略号串的字符，不能在它后面切开
+    return ch.isspace() or ch == '.' or _CONTROL_CHARS.match(ch) is not None
+
+
+def _clean_segment(text: str) -> str:
+    text = _CONTROL_CHARS.sub('', text)
+    text = _WHITESPACE.sub(' ', text)
+    return _DOT_LEADERS.sub(' ', text)
+
+
+def iter_clean_text(pieces: Iterable[str]) -> Iterator[str]:
+    """
+    clean_text 的流式版本：逐段清洗文本片段，输出拼接后与对整段文本调用 clean_text 的结果相同
+    每个片段只在“普通字符”之后切开，空白串、省略号串不会被片段边界截断；未能切开的尾部留到下一个片段
+    """
+    carry = ""
+    started = False
+    for piece in pieces:
+        buf = carry + piece if carry else piece
+        cut = len(buf)
+        while cut > 0 and _is_run_char(buf[cut - 1]):
+            cut -= 1
+        if cut == 0:
+            carry = buf
+            continue
+        out = _clean_segment(buf[:cut])
+        carry = buf[cut:]
+        if not started:
+            out = out.lstrip()
+        if out:
+            started = True
+            yield out
+    out = _clean_segment(carry)
+    out = out.rstrip() if started else out.strip()
+    if out:
+        yield out
 
 
 """
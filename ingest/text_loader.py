@@ -0,0 +1,191 @@
+import codecs
+import time
+from typing import Iterator, List, Optional, Tuple
+import chardet  # 用于自动检测编码
+from config.configs import Config
+
+# TXT 文件解码：先走严格 UTF-8 快速路径，失败时才用 chardet 检测编码，且只检测文件开头的一段样本。
+# 原先对整个文件内容执行 chardet.detect，几百 MB 的文本导出要分析很久，而且是持有 GIL 的纯 Python 计算。
+# 解码按块增量进行，不需要先把全部字节读进内存再整体 decode。
+
+# 逐块读取的大小
+_READ_BLOCK = 4 * 1024 * 1024
+
+# chardet 置信度不足时依次尝试的常见编码（latin-1 能解码任意字节，放在靠后的位置）
+FALLBACK_ENCODINGS = ['utf-8', 'gbk', 'gb18030', 'gb2312', 'latin-1', 'utf-16', 'cp936', 'big5']
+
+_BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+
+# 文件开头是 ASCII、后面才出现的常见多字节编码（FALLBACK_ENCODINGS 中与 ASCII 兼容的部分）；
+# latin-1、utf-16 能“成功”解码几乎任意字节，不放在这里，否则个别损坏的字节会让整个文件变成乱码
+_MIXED_FALLBACKS = ['gbk', 'gb18030', 'big5']
+
+
+def _read_sample(file_path: str, size: int, offset: int = 0) -> bytes:
+    with open(file_path, "rb") as f:
+        f.seek(offset)
+        return f.read(size)
+
+
+def _decode_file(file_path: str, encoding: str, errors: str = 'strict') -> str:
+    """
+    按块增量解码整个文件，编码不匹配时抛出 UnicodeDecodeError，
+    异常的 file_offset 属性为出错字节在文件中的位置
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors=errors)
+    parts: List[str] = []
+    offset = 0
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(_READ_BLOCK), b""):
+            # 解码器内部可能缓存着上一块末尾不完整的字符，异常位置相对于 缓存 + 本块
+            buffered = len(decoder.getstate()[0])
+            try:
+                parts.append(decoder.decode(block))
+            except UnicodeDecodeError as e:
+                e.file_offset = offset - buffered + e.start
+                raise
+            offset += len(block)
+    parts.append(decoder.decode(b"", final=True))
+    return "".join(parts)
+
+
+def detect_encoding(sample: bytes) -> Tuple[Optional[str], float]:
+    """
+    检测样本的编码，返回 (编码, 置信度)
+    有 BOM 时直接确定；样本是合法 UTF-8 时直接返回 utf-8，不调用 chardet
+    """
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding, 1.0
+    try:
+        # 样本末尾可能截断在多字节字符中间，用增量解码器且不结束输入
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8', 1.0
+    except UnicodeDecodeError:
+        pass
+    # chardet 是一个著名的字符集检测库。
+    #  核心动作：它会对 sample 里的字节进行统计分析（比如根据某些字节出现的频率特征），并给出一个最可能的编码方案。
+    result = chardet.detect(sample)
+    return result['encoding'], result['confidence'] or 0.0
+
+
+def _mixed_candidates(file_path: str, offset: Optional[int], sample_size: int, failed: str) -> List[str]:
+    """
+    样本判断的编码在文件后面出错时（常见于开头是纯 ASCII、后面才出现 GBK 等编码的文件，样本是合法 UTF-8），
+    返回依次尝试的编码：先对出错位置之后的一段字节重新检测，再加上常见的多字节编码
+    """
+    candidates = []
+    if offset is not None:
+        window_encoding, window_confidence = detect_encoding(_read_sample(file_path, sample_size, offset))
+        if window_encoding and window_confidence > 0.7:
+            candidates.append(window_encoding)
+    return [c for c in dict.fromkeys(candidates + _MIXED_FALLBACKS) if c.lower() != failed.lower()]
+
+
+def read_text_file(file_path: str, sample_size: int = Config.encoding_sample_bytes) -> str:
+    """读取文本文件并自动识别编码"""
+    start = time.perf_counter()
+    encoding, confidence = detect_encoding(_read_sample(file_path, sample_size))
+    detect_seconds = time.perf_counter() - start
+
+    def decoded(candidate: str, text: str) -> str:
+        print(f"文件 {file_path} 使用 {candidate} 解码成功（编码检测耗时 {detect_seconds * 1000:.1f}ms，"
+              f"总耗时 {time.perf_counter() - start:.2f}s）")
+        return text
+
+    if not encoding or confidence <= 0.7:
+        # 尝试多种常见编码
+        print(f"文件 {file_path} 编码检测置信度不足（{encoding}, {confidence:.2f}），尝试常见编码")
+        for candidate in FALLBACK_ENCODINGS:
+            try:
+                return decoded(candidate, _decode_file(file_path, candidate))
+            except (UnicodeDecodeError, LookupError):
+                print(f"文件 {file_path} 使用 {candidate} 解码失败")
+        # 如果所有编码都失败，使用忽略错误的方式解码
+        print(f"警告：文件 {file_path} 强制使用 UTF-8，已经忽略非法字符")
+        return _decode_file(file_path, 'utf-8', errors='ignore')
+
+    try:
+        return decoded(encoding, _decode_file(file_path, encoding))
+    except (UnicodeDecodeError, LookupError) as e:
+        print(f"文件 {file_path} 使用 {encoding} 解码失败")
+        error_offset = getattr(e, "file_offset", None)
+
+    # 样本判断的编码对整个文件不成立：用能解码整个文件的其他编码
+    for candidate in _mixed_candidates(file_path, error_offset, sample_size, encoding):
+        try:
+            return decoded(candidate, _decode_file(file_path, candidate))
+        except (UnicodeDecodeError, LookupError):
+            print(f"文件 {file_path} 使用 {candidate} 解码失败")
+
+    # 仍然失败时多半是文件中混入了个别损坏的字节：按样本判断的编码解码并忽略非法字符
+    print(f"警告：文件 {file_path} 强制使用 {encoding}，已经忽略非法字符")
+    return _decode_file(file_path, encoding, errors='ignore')
+
+
+def iter_text_file(file_path: str, sample_size: int = Config.encoding_sample_bytes,
+                   block_size: int = _READ_BLOCK) -> Iterator[str]:
+    """
+    流式读取文本文件，逐块产出解码后的文本，用于超大文件的流式入库
+    编码先根据开头的样本确定；中途遇到按该编码无法解码的字节时，出错位置之后的内容改用重新检测的编码，
+    已经产出的文本无法回退，所以切换之后再遇到非法字节直接忽略
+    """
+    sample = _read_sample(file_path, sample_size)
+    encoding, confidence = detect_encoding(sample)
+    if not encoding or confidence <= 0.7:
+        encoding = 'utf-8'
+        for candidate in FALLBACK_ENCODINGS:
+            try:
+                codecs.getincrementaldecoder(candidate)().decode(sample, final=False)
+                encoding = candidate
+                break
+            except (UnicodeDecodeError, LookupError):
+                continue
+    print(f"文件 {file_path} 按 {encoding} 流式解码")
+
+    decoder = codecs.getincrementaldecoder(encoding)()
+    strict = True
+    offset = 0
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            if strict:
+                pending = decoder.getstate()[0]
+                try:
+                    text = decoder.decode(block)
+                except UnicodeDecodeError as e:
+                    # 出错之前紧挨着的非 ASCII 字节可能已被误当作原编码的字符（如 GBK 的“碳”恰好是合法的 UTF-8），
+                    # 从它们之前的最后一个 ASCII 字节处切换：之前的内容按原编码解码，之后的内容交给新的编码
+                    data = pending + block
+                    cut = e.start
+                    while cut > 0 and data[cut - 1] >= 0x80:
+                        cut -= 1
+                    text = data[:cut].decode(encoding, errors='ignore')
+                    new_encoding = encoding
+                    for candidate in _mixed_candidates(file_path, offset - len(pending) + cut, sample_size, encoding):
+                        try:
+                            codecs.getincrementaldecoder(candidate)().decode(data[cut:], final=False)
+                            new_encoding = candidate
+                            break
+                        except (UnicodeDecodeError, LookupError):
+                            continue
+                    print(f"文件 {file_path} 在第 {offset - len(pending) + e.start} 字节处无法按 {encoding} 解码，"
+                          f"之后的内容按 {new_encoding} 解码")
+                    decoder = codecs.getincrementaldecoder(new_encoding)(errors='ignore')
+                    text += decoder.decode(data[cut:])
+                    strict = False
+            else:
+                text = decoder.decode(block)
+            offset += len(block)
+            if text:
+                yield text
+    try:
+        text = decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        text = ""  # 文件末尾截断的不完整字符
+    if text:
+        yield text
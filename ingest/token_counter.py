@@ -0,0 +1,105 @@
+import threading
+from typing import List, Optional
+from config.configs import Config
+
+# 可选的 token 计数器：按 embedding 模型的 token 而不是字符来控制分块大小和截断长度。
+# 分词器依赖（tiktoken / transformers）是可选的，加载失败时返回 None，调用方退回按字符处理。
+
+# 按字符截断时的上限，略小于API限制的8192，留出一些余量
+MAX_EMBEDDING_CHARS = 8000
+
+
+class TokenCounter:
+    """对 tiktoken 和 HuggingFace 分词器的统一封装"""
+
+    def __init__(self, backend: str = Config.tokenizer_backend, name: str = Config.tokenizer_name):
+        self.backend = backend
+        self.name = name
+        if backend == "tiktoken":
+            import tiktoken
+            self._encoding = tiktoken.get_encoding(name)
+        elif backend == "hf":
+            from transformers import AutoTokenizer
+            self._tokenizer = AutoTokenizer.from_pretrained(name)
+        else:
+            raise ValueError(f"不支持的分词器类型: {backend}")
+
+    def encode(self, text: str) -> List[int]:
+        if self.backend == "tiktoken":
+            return self._encoding.encode(text, disallowed_special=())
+        return self._tokenizer.encode(text, add_special_tokens=False)
+
+    def count(self, text: str) -> int:
+        return len(self.encode(text))
+
+    def split(self, text: str, max_tokens: int) -> List[str]:
+        """把文本按 token 数切成若干段，每段不超过 max_tokens，不丢弃尾部"""
+        if self.backend == "tiktoken":
+            tokens = self.encode(text)
+            if len(tokens) <= max_tokens:
+                return [text]
+            # 中文等多字节字符常被拆成几个 token，直接 decode 任意一段 token 会把字符切成两半（变成 U+FFFD）；
+            # decode_with_offsets 给出每个 token 起始字节所在字符的下标，只在字符边界处切分
+            decoded, offsets = self._encoding.decode_with_offsets(tokens)
+            pieces = []
+            start = 0
+            while len(tokens) - start > max_tokens:
+                cut = start + max_tokens
+                # 切分点落在字符中间时向前退到该字符的第一个 token，整个字符归入下一段
+                while cut > start + 1 and offsets[cut - 1] == offsets[cut]:
+                    cut -= 1
+                if offsets[cut] > offsets[start]:
+                    pieces.append(decoded[offsets[start]:offsets[cut]])
+                start = cut
+            pieces.append(decoded[offsets[start]:])
+            return pieces
+
+        # HuggingFace 分词器用 offset 映射回原文切分，避免 decode 改变空格
+        offsets = self._tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+        if len(offsets) <= max_tokens:
+            return [text]
+        pieces = []
+        start = 0
+        for i in range(max_tokens, len(offsets), max_tokens):
+            end = offsets[i][0]
+            pieces.append(text[start:end])
+            start = end
+        pieces.append(text[start:])
+        return [piece for piece in pieces if piece.strip()]
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        return self.split(text, max_tokens)[0]
+
+
+_counter = None
+_counter_failed = False
+_counter_lock = threading.Lock()
+
+
+def get_token_counter() -> Optional[TokenCounter]:
+    """返回全局共享的 token 计数器；分词器不可用时返回 None"""
+    global _counter, _counter_failed
+    if _counter is not None or _counter_failed:
+        return _counter
+    with _counter_lock:
+        if _counter is None and not _counter_failed:
+            try:
+                _counter = TokenCounter()
+            except Exception as e:
+                _counter_failed = True
+                print(f"警告: 加载分词器 {Config.tokenizer_backend}/{Config.tokenizer_name} 失败，按字符数处理: {str(e)}")
+    return _counter
+
+
+def truncate_for_embedding(text: str) -> str:
+    """
+    把文本截断到 embedding 模型的输入上限
+    开启 chunk_by_tokens 时按 Config.embedding_max_tokens 个 token 截断，否则按 8000 字符截断
+    """
+    counter = get_token_counter() if Config.chunk_by_tokens else None
+    if counter is None:
+        return text[:MAX_EMBEDDING_CHARS] if len(text) > MAX_EMBEDDING_CHARS else text
+    # 按每个字符最多约 4 个 token 估算，足够短的文本不必分词
+    if len(text) * 4 <= Config.embedding_max_tokens:
+        return text
+    return counter.truncate(text, Config.embedding_max_tokens)
@@ -1,14 +1,41 @@
 import json
+from typing import List, Optional, Tuple
+import numpy as np
 from llm.embedding_client import vectorize_query
+from llm.embedding_cache import open_checkpoint
+from ingest.token_counter import truncate_for_embedding
+
+
+# 向量文件的存储格式：<name>.json 只保存分块数据（不含向量），<name>.npy 保存与之逐行对应的 float32 向量矩阵。
+# 原先把每个 1024 维向量以 float 列表写进带缩进的 JSON，之后还要解析两遍，大知识库上要占用数 GB 内存。
+def vector_file_paths(output_file_path: str) -> Tuple[str, str]:
+    """返回 (分块 JSON 路径, 向量 .npy 路径)"""
+    base = output_file_path[:-5] if output_file_path.endswith(".json") else output_file_path
+    return base + ".json", base + ".npy"
+
+
+def save_vector_file(output_file_path: str, data_list: List[dict], vectors: np.ndarray):
+    chunks_path, npy_path = vector_file_paths(output_file_path)
+    with open(chunks_path, 'w', encoding='utf-8') as outfile:
+        json.dump(data_list, outfile, ensure_ascii=False)
+    np.save(npy_path, np.ascontiguousarray(vectors, dtype=np.float32))
+
 
 # 向量化文件内容
-def vectorize_file(data_list, output_file_path, field_name="chunk"):
-    """向量化文件内容，处理长度限制并确保输入有效"""
+def vectorize_file(data_list, output_file_path=None, field_name="chunk",
+                   checkpoint_path: Optional[str] = None) -> Tuple[List[dict], np.ndarray]:
+    """
+    向量化文件内容，处理长度限制并确保输入有效
+    Returns:
+        (有效分块列表, 逐行对应的 (n, dim) float32 向量矩阵)，失败时向量矩阵为空数组。
+        给出 output_file_path 时同时按二进制格式保存（见 vector_file_paths）。
+    checkpoint_path: 断点文件路径，默认在 output_file_path 旁边（<name>.ckpt.sqlite）。
+        每个批次完成后写入，中途失败时保留，重跑时跳过已完成的批次；全部成功后删除。
+    """
+    empty = np.zeros((0, 0), dtype=np.float32)
     if not data_list:
         print("警告: 没有数据需要向量化")
-        with open(output_file_path, 'w', encoding='utf-8') as outfile:
-            json.dump([], outfile, ensure_ascii=False, indent=4)
-        return
+        return [], empty
 
     # 准备查询文本，确保每个文本有效且长度适中
     valid_data = []
@@ -16,46 +43,46 @@ def vectorize_file(data_list, output_file_path, field_name="chunk"):
 
     for data in data_list:
         text = data.get(field_name, "")
-        # 确保文本不为空且长度合适
-        if text and 1 <= len(text) <= 8000:  # 略小于API限制的8192，留出一些余量
-            valid_data.append(data)
-            valid_texts.append(text)
-        else:
-            # 如果文本太长，截断它
-            if len(text) > 8000:
-                truncated_text = text[:8000]
-                print(f"警告: 文本过长，已截断至8000字符。原始长度: {len(text)}")
-                data[field_name] = truncated_text
-                valid_data.append(data)
-                valid_texts.append(truncated_text)
-            else:
-                print(f"警告: 跳过空文本或长度为0的文本")
+        # 确保文本不为空
+        if not text:
+            print(f"警告: 跳过空文本或长度为0的文本")
+            continue
+        # 如果文本超过 embedding 的输入上限（按字符或 token），截断它
+        truncated_text = truncate_for_embedding(text)
+        if len(truncated_text) < len(text):
+            print(f"警告: 文本过长，已截断至 {len(truncated_text)} 字符。原始长度: {len(text)}")
+            data[field_name] = truncated_text
+        valid_data.append(data)
+        valid_texts.append(truncated_text)
 
     if not valid_texts:
         print("错误: 所有文本都无效，无法进行向量化")
-        with open(output_file_path, 'w', encoding='utf-8') as outfile:
-            json.dump([], outfile, ensure_ascii=False, indent=4)
-        return
+        return [], empty
+
+    if checkpoint_path is None and output_file_path:
+        checkpoint_path = vector_file_paths(output_file_path)[0][:-5] + ".ckpt.sqlite"
+    checkpoint = open_checkpoint(checkpoint_path) if checkpoint_path else None
 
     # 向量化有效文本
-    vectors = vectorize_query(valid_texts)
+    vectors = vectorize_query(valid_texts, checkpoint=checkpoint)
 
-    # 检查向量化是否成功
+    # 检查向量化是否成功；失败时不写出缺少向量的数据，已完成的批次保留在断点文件中
     if vectors.size == 0 or len(vectors) != len(valid_data):
         print \
             (f"错误: 向量化失败或向量数量({len(vectors) if vectors.size > 0 else 0})与数据条目({len(valid_data)})不匹配")
-        # 保存原始数据，但不含向量
-        with open(output_file_path, 'w', encoding='utf-8') as outfile:
-            json.dump(valid_data, outfile, ensure_ascii=False, indent=4)
-        return
-
-    # 添加向量到数据中
-    for data, vector in zip(valid_data, vectors):
-        data['vector'] = vector.tolist()
-
-    # 保存结果
-    with open(output_file_path, 'w', encoding='utf-8') as outfile:
-        json.dump(valid_data, outfile, ensure_ascii=False, indent=4)
+        if checkpoint is not None:
+            checkpoint.close()
+            print(f"已完成的批次已保存到断点文件 {checkpoint_path}，重新运行将从断点继续")
+        return valid_data, empty
 
-    print(f"成功向量化 {len(valid_data)} 条数据并保存到 {output_file_path}")
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
 
+    # 保存结果，之后断点文件就没用了
+    if output_file_path:
+        save_vector_file(output_file_path, valid_data, vectors)
+        print(f"成功向量化 {len(valid_data)} 条数据并保存到 {vector_file_paths(output_file_path)[1]}")
+    else:
+        print(f"成功向量化 {len(valid_data)} 条数据")
+    if checkpoint is not None:
+        checkpoint.destroy()
+    return valid_data, vectors
@@ -0,0 +1,179 @@
+"""
+命令行批量入库：遍历目录树，把其中的文档入库到指定知识库，不需要打开 Web 界面，适合 cron 定时执行
+
+使用方法:
+    python ingest_cli.py DIR [--kb KB_NAME] [--ext .txt .pdf] [--full] [--no-resume] [--group-size 200]
+                         [--parse-workers N] [--chunk-workers N] [--embed-concurrency N] [--embed-batch-size N]
+
+断点续跑:
+    文件按组入库，每组完成后立即发布索引并更新文件清单；中途中断后重新执行同一条命令，
+    已经入库且内容未变化的文件直接跳过。组内向量化到一半失败时，已完成批次的向量保存在断点文件中，重跑时复用。
+
+退出码: 全部成功为 0，有文件处理失败为 1，参数错误为 2
+
+注意: 同一知识库不要同时在 Web 界面中上传（界面和命令行是不同进程，知识库锁只在进程内有效）；
+命令行之间用锁文件互斥，上一次定时任务还没结束时，新的任务直接退出。
+"""
+
+import os
+import sys
+import time
+import argparse
+from types import SimpleNamespace
+from typing import Dict, List
+
+from config.configs import Config
+
+try:
+    import fcntl  # 仅 POSIX 平台可用，Windows 上不做跨进程互斥
+except ImportError:
+    fcntl = None
+
+
+def find_documents(root: str, extensions: List[str]) -> List[str]:
+    """
+    递归查找目录下指定扩展名的文件（跳过隐藏目录和隐藏文件），按路径排序
+    知识库以文件名区分文件，不同子目录下的同名文件只保留第一个
+    """
+    extensions = tuple(ext.lower() if ext.startswith('.') else '.' + ext.lower() for ext in extensions)
+    found: Dict[str, str] = {}
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names[:] = sorted(d for d in dir_names if not d.startswith('.'))
+        for file_name in sorted(file_names):
+            if file_name.startswith('.') or not file_name.lower().endswith(extensions):
+                continue
+            file_path = os.path.join(dir_path, file_name)
+            if file_name in found:
+                print(f"警告: 文件名重复，跳过 {file_path}（已使用 {found[file_name]}）")
+                continue
+            found[file_name] = file_path
+    return sorted(found.values())
+
+
+def apply_overrides(args):
+    # 流水线和 vectorize_query 的默认参数在模块导入时从 Config 读取，必须在导入入库模块之前修改
+    if args.parse_workers:
+        Config.ingest_parse_workers = args.parse_workers
+    if args.chunk_workers:
+        Config.ingest_chunk_workers = args.chunk_workers
+    if args.embed_concurrency:
+        Config.embedding_concurrency = args.embed_concurrency
+    if args.embed_batch_size:
+        Config.ingest_embed_batch_size = args.embed_batch_size
+
+
+def acquire_run_lock(kb_name: str):
+    """命令行任务之间的跨进程互斥，返回打开的锁文件（进程退出时自动释放），已被占用时返回 None"""
+    from kb.kb_jobs import JOBS_DIR
+
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    lock_file = open(os.path.join(JOBS_DIR, f"{kb_name}.cli.lock"), "w")
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return None
+    lock_file.write(str(os.getpid()))
+    lock_file.flush()
+    return lock_file
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="遍历目录树，批量入库到指定知识库")
+    parser.add_argument("directory", help="要入库的文档目录（递归遍历）")
+    parser.add_argument("--kb", default=Config.default_kb, help=f"目标知识库（默认: {Config.default_kb}）")
+    parser.add_argument("--ext", nargs="+", default=[".txt", ".pdf"], help="入库的文件扩展名（默认: .txt .pdf）")
+    parser.add_argument("--full", action="store_true", help="忽略文件清单，全量重建索引")
+    parser.add_argument("--no-resume", action="store_true", help="删除上次失败留下的 embedding 断点文件，重新向量化")
+    parser.add_argument("--group-size", type=int, default=200,
+                        help="每组入库的文件数，每组完成后发布索引，中断后从下一组继续（<=0 表示一次全部入库）")
+    parser.add_argument("--parse-workers", type=int, help=f"解析线程数（默认: {Config.ingest_parse_workers}）")
+    parser.add_argument("--chunk-workers", type=int, help=f"分块进程数（默认: {Config.ingest_chunk_workers}）")
+    parser.add_argument("--embed-concurrency", type=int,
+                        help=f"同时在途的 embedding 请求数（默认: {Config.embedding_concurrency}）")
+    parser.add_argument("--embed-batch-size", type=int,
+                        help=f"每次送入向量化阶段的分块数（默认: {Config.ingest_embed_batch_size}）")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        print(f"错误: 目录 {args.directory} 不存在")
+        return 2
+    kb_name = args.kb.strip()
+    if not kb_name:
+        print("错误: 未指定知识库")
+        return 2
+
+    apply_overrides(args)
+    from ingest.ingest_service import INGEST_FAILED, process_and_index_files, get_checkpoint_path
+
+    lock_file = acquire_run_lock(kb_name)
+    if lock_file is None:
+        print(f"知识库 {kb_name} 正在被另一个命令行入库任务更新，本次退出")
+        return 1
+
+    file_paths = find_documents(args.directory, args.ext)
+    print(f"在 {args.directory} 中找到 {len(file_paths)} 个文件，目标知识库: {kb_name}")
+    if not file_paths:
+        return 0
+
+    if args.no_resume:
+        checkpoint_path = get_checkpoint_path(kb_name)
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(checkpoint_path + suffix):
+                os.remove(checkpoint_path + suffix)
+        print(f"已删除 embedding 断点文件 {checkpoint_path}")
+
+    group_size = args.group_size if args.group_size > 0 else len(file_paths)
+    groups = [file_paths[i:i + group_size] for i in range(0, len(file_paths), group_size)]
+    totals = {"indexed": 0, "skipped": 0, "chunks": 0, "dedup": 0, "vectors": 0}
+    stage_totals: Dict[str, list] = {}
+    errors: List[str] = []
+    start = time.perf_counter()
+
+    for group_no, group in enumerate(groups, start=1):
+        print(f"\n===== 第 {group_no}/{len(groups)} 组，{len(group)} 个文件 =====")
+        report = {}
+        # 全量重建时只有第一组重建索引，后续组追加到刚建好的索引上
+        incremental = not args.full or group_no > 1
+        status = process_and_index_files([SimpleNamespace(name=path) for path in group], kb_name,
+                                         incremental=incremental, report=report)
+        print(status)
+
+        indexed = report.get("indexed_files", {})
+        totals["indexed"] += len(indexed)
+        totals["skipped"] += len(report.get("skipped_files", []))
+        totals["chunks"] += report.get("num_chunks", 0)
+        totals["dedup"] += report.get("dedup_dropped", 0)
+        totals["vectors"] = report.get("num_vectors", totals["vectors"])
+        for key, stage in report.get("stats", {}).items():
+            item = stage_totals.setdefault(key, [stage.name, stage.unit, 0, 0.0])
+            item[2] += stage.count
+            # 各组依次执行，阶段的墙钟时间可以直接相加
+            item[3] += stage.wall_seconds
+        errors.extend(report.get("errors", []))
+        # 整组失败（如向量化服务不可用）时报告里没有流水线结果，把返回的状态作为错误记录
+        if report.get("status") == INGEST_FAILED and "indexed_files" not in report:
+            errors.append(f"第 {group_no} 组: {status.strip()}")
+
+    elapsed = time.perf_counter() - start
+    failed = len(file_paths) - totals["indexed"] - totals["skipped"]
+    print("\n===== 入库汇总 =====")
+    print(f"知识库: {kb_name}，总耗时 {elapsed:.1f}s")
+    print(f"文件: 共 {len(file_paths)} 个，入库 {totals['indexed']} 个，未变化跳过 {totals['skipped']} 个，失败 {failed} 个")
+    print(f"分块: 入索引 {totals['chunks']} 个，去重丢弃 {totals['dedup']} 个；索引共 {totals['vectors']} 个向量")
+    for name, unit, count, seconds in stage_totals.values():
+        rate = count / seconds if seconds > 0 else 0.0
+        print(f"  {name}: {count} {unit}，耗时 {seconds:.2f}s，{rate:.1f} {unit}/s")
+    if elapsed > 0 and totals["chunks"]:
+        print(f"整体吞吐: {totals['chunks'] / elapsed:.1f} chunks/s")
+    if errors:
+        print("以下问题需要处理：")
+        for message in errors:
+            print(f"  - {message}")
+    lock_file.close()
+    return 1 if failed or errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
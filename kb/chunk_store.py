@@ -0,0 +1,196 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Iterable, Iterator, List, Optional, Union
+
+# 分块元数据存储：每个知识库一个 SQLite 文件，第 pos 行对应 FAISS 索引中的第 pos 个向量。
+# 检索时只按下标读取命中的几十行，不再把整个元数据 JSON 读入内存；文件交给 SQLite 和页缓存管理，冷启动只需打开文件。
+# 路径以 .json 结尾时仍按旧格式（缩进的 JSON 列表）读写，供显式传入 JSON 路径的脚本使用。
+
+# 元数据的列，与 rag.indexer.to_metadata 生成的字段一致
+_COLUMNS = ("id", "chunk", "method", "source")
+# 批量读取/写入的行数（SQLite 单条语句的参数个数有限制）
+_SQL_BATCH = 500
+
+
+def is_legacy_path(path: str) -> bool:
+    return path.endswith(".json")
+
+
+def legacy_path_for(store_path: str) -> str:
+    """新格式存储对应的旧 JSON 文件路径"""
+    return os.path.splitext(store_path)[0] + ".json"
+
+
+def _row_to_dict(row) -> dict:
+    item = {"id": row[0], "chunk": row[1], "method": row[2]}
+    if row[3] is not None:
+        item["source"] = row[3]
+    return item
+
+
+class ChunkStore:
+    """
+    只读的分块元数据存储，可在多个线程间共享
+    支持 len() 和按下标取值（store[pos]），与原先的元数据列表用法兼容；批量读取用 get_many
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # 只读打开；发布新版本时文件被整体替换，已打开的连接仍读取旧文件，直到重新打开
+        self._conn = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        # pos 从 0 连续编号，取最大值只需查找主键 B 树的末端，比 COUNT(*) 扫描全表快得多
+        self._count = self._conn.execute("SELECT COALESCE(MAX(pos) + 1, 0) FROM chunks").fetchone()[0]
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, pos: int) -> dict:
+        item = self.get_many([pos])[0]
+        if item is None:
+            raise IndexError(f"分块下标 {pos} 超出范围（共 {self._count} 个）")
+        return item
+
+    def get_many(self, positions: Iterable[int]) -> List[Optional[dict]]:
+        """按下标批量读取，返回与 positions 一一对应的列表，下标不存在时对应 None"""
+        positions = [int(pos) for pos in positions]
+        found = {}
+        wanted = list(dict.fromkeys(pos for pos in positions if 0 <= pos < self._count))
+        with self._lock:
+            for i in range(0, len(wanted), _SQL_BATCH):
+                part = wanted[i:i + _SQL_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT pos, id, chunk, method, source FROM chunks WHERE pos IN ({','.join('?' * len(part))})",
+                    part)
+                for row in rows:
+                    found[row[0]] = _row_to_dict(row[1:])
+        return [found.get(pos) for pos in positions]
+
+    def iter_rows(self, batch_size: int = 10000) -> Iterator[dict]:
+        """按下标顺序逐行读取全部元数据（入库时追加、去重使用，不一次性读入内存）"""
+        # 单独的游标分批读取，每批之间释放锁，不阻塞并发的检索
+        last = -1
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT pos, id, chunk, method, source FROM chunks WHERE pos > ? ORDER BY pos LIMIT ?",
+                    (last, batch_size)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield _row_to_dict(row[1:])
+            last = rows[-1][0]
+
+    def sources(self) -> List[Optional[str]]:
+        """按下标顺序返回每个分块的来源文件名"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT source FROM chunks ORDER BY pos")]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def write_chunk_store(path: str, rows: Iterable[dict]) -> int:
+    """
+    把元数据逐行写入新的存储文件（已存在时覆盖），返回写入的行数
+    调用方应当写到临时路径再替换到目标位置，检索端不会读到写了一半的文件
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    try:
+        # 文件写完才会被发布，中途失败直接丢弃，不需要日志保护
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("CREATE TABLE chunks (pos INTEGER PRIMARY KEY, id TEXT, chunk TEXT, method TEXT, source TEXT)")
+        count = 0
+        batch = []
+        for item in rows:
+            batch.append((count, item.get("id"), item.get("chunk"), item.get("method"), item.get("source")))
+            count += 1
+            if len(batch) >= _SQL_BATCH:
+                conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?, ?)", batch)
+                batch = []
+        if batch:
+            conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?, ?)", batch)
+        conn.commit()
+    finally:
+        conn.close()
+    return count
+
+
+def load_metadata_json(path: str) -> List[dict]:
+    """读取旧格式的元数据 JSON，编码异常时忽略非法字节重新读取"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except UnicodeDecodeError:
+        print(f"警告：{path} 编码异常，尝试忽略错误读取...")
+        with open(path, 'rb') as f:
+            return json.loads(f.read().decode('utf-8', errors='ignore'))
+
+
+def write_metadata(path: str, rows: Iterable[dict]) -> int:
+    """按路径的扩展名写入元数据（.json 为旧格式，其他为 SQLite 存储），返回行数"""
+    if is_legacy_path(path):
+        metadata = list(rows)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, ensure_ascii=False, indent=4)
+        return len(metadata)
+    return write_chunk_store(path, rows)
+
+
+def open_metadata(path: str) -> Union[ChunkStore, List[dict]]:
+    """打开元数据用于检索：SQLite 存储返回 ChunkStore，旧格式 JSON 返回列表"""
+    if is_legacy_path(path):
+        return load_metadata_json(path)
+    return ChunkStore(path)
+
+
+def iter_metadata(path: str) -> Iterator[dict]:
+    """按下标顺序逐行读取元数据"""
+    if is_legacy_path(path):
+        yield from load_metadata_json(path)
+        return
+    store = ChunkStore(path)
+    try:
+        yield from store.iter_rows()
+    finally:
+        store.close()
+
+
+def read_metadata_sources(path: str) -> List[Optional[str]]:
+    """按下标顺序返回每个分块的来源文件名"""
+    if is_legacy_path(path):
+        return [item.get("source") for item in load_metadata_json(path)]
+    store = ChunkStore(path)
+    try:
+        return store.sources()
+    finally:
+        store.close()
+
+
+_migrate_lock = threading.Lock()
+
+
+def migrate_legacy_metadata(store_path: str) -> bool:
+    """
+    知识库还只有旧的元数据 JSON 时转换为 SQLite 存储，转换成功后删除 JSON，返回是否做了转换
+    先写临时文件再替换，并发调用或中途失败都不会留下不完整的存储
+    """
+    legacy_path = legacy_path_for(store_path)
+    if is_legacy_path(store_path) or os.path.exists(store_path) or not os.path.exists(legacy_path):
+        return False
+    with _migrate_lock:
+        if os.path.exists(store_path):
+            return False
+        metadata = load_metadata_json(legacy_path)
+        tmp_path = store_path + ".tmp"
+        count = write_chunk_store(tmp_path, metadata)
+        os.replace(tmp_path, store_path)
+        os.remove(legacy_path)
+    print(f"已将元数据 {legacy_path} 转换为 {store_path}（{count} 个分块）")
+    return True
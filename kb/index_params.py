@@ -0,0 +1,147 @@
+import json
+import math
+import os
+from typing import Optional, Tuple
+import faiss
+from config.configs import Config
+
+# 索引参数：建索引时按 Config 选择索引类型（flat / ivf_flat / ivf_pq / hnsw）和参数，
+# 结果写在索引旁边的参数文件（<索引路径>.params.json）中，检索加载索引时读取并设置 nprobe / efSearch。
+# 参数文件可以手工修改或用 update_search_params 调整单个知识库的召回/延迟取舍，不需要重建索引；
+# 没有参数文件的旧索引使用 Config 中的默认检索参数。
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+# IVF 训练时每个聚类中心至少需要的训练向量数（FAISS 少于该值时会告警，聚类质量下降）
+_MIN_POINTS_PER_CENTROID = 39
+
+
+def params_path_for(index_path: str) -> str:
+    return index_path + ".params.json"
+
+
+def _auto_nlist(n_vectors: int) -> int:
+    # 经验值 4*sqrt(n)，同时保证每个聚类中心有足够的训练向量
+    nlist = Config.index_nlist or int(4 * math.sqrt(n_vectors))
+    return max(1, min(nlist, n_vectors // _MIN_POINTS_PER_CENTROID))
+
+
+def _auto_pq_m(dim: int) -> int:
+    # PQ 子向量个数必须整除维度；默认每 16 维压缩成 1 字节，取不超过 dim/16 的最大约数
+    if Config.index_pq_m and dim % Config.index_pq_m == 0:
+        return Config.index_pq_m
+    if Config.index_pq_m:
+        print(f"警告: index_pq_m={Config.index_pq_m} 不能整除向量维度 {dim}，改为自动选择")
+    target = max(1, dim // 16)
+    return max(m for m in range(1, target + 1) if dim % m == 0)
+
+
+def choose_index_params(n_vectors: int, dim: int, index_type: Optional[str] = None) -> dict:
+    """
+    根据向量规模和 Config 确定索引类型和参数，返回写入参数文件的字典
+    index_type 不指定时使用 Config.index_type；向量数不足以训练所选的 IVF / PQ 索引时降级为更简单的类型
+    """
+    index_type = index_type or Config.index_type
+    if index_type == "auto":
+        if n_vectors > Config.index_auto_pq_min:
+            index_type = "ivf_pq"
+        elif n_vectors > Config.index_auto_ivf_min:
+            index_type = "ivf_flat"
+        else:
+            index_type = "flat"
+    elif index_type not in INDEX_TYPES:
+        print(f"警告: 未知的索引类型 {index_type}，改用 flat")
+        index_type = "flat"
+
+    if index_type == "ivf_pq" and n_vectors < (1 << Config.index_pq_nbits) * _MIN_POINTS_PER_CENTROID:
+        print(f"向量数 {n_vectors} 不足以训练 PQ 编码，改用 ivf_flat")
+        index_type = "ivf_flat"
+    if index_type in ("ivf_flat", "ivf_pq") and n_vectors < 2 * _MIN_POINTS_PER_CENTROID:
+        print(f"向量数 {n_vectors} 不足以训练 IVF 聚类，改用 flat")
+        index_type = "flat"
+
+    params = {"type": index_type, "metric": "ip", "dim": dim}
+    if index_type in ("ivf_flat", "ivf_pq"):
+        params["nlist"] = _auto_nlist(n_vectors)
+        params["nprobe"] = min(Config.index_nprobe, params["nlist"])
+    if index_type == "ivf_pq":
+        params["pq_m"] = _auto_pq_m(dim)
+        params["pq_nbits"] = Config.index_pq_nbits
+    if index_type == "hnsw":
+        params["hnsw_m"] = Config.index_hnsw_m
+        params["ef_construction"] = Config.index_hnsw_ef_construction
+        params["ef_search"] = Config.index_hnsw_ef_search
+    return params
+
+
+def create_index(dim: int, params: dict) -> faiss.Index:
+    """按参数创建空索引（IVF / PQ 索引还需要 train）；统一使用内积度量，与归一化后的 embedding 向量配合即为余弦相似度"""
+    index_type = params["type"]
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, params["hnsw_m"], faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = params["ef_construction"]
+        return index
+    if index_type in ("ivf_flat", "ivf_pq"):
+        quantizer = faiss.IndexFlatIP(dim)
+        if index_type == "ivf_pq":
+            return faiss.IndexIVFPQ(quantizer, dim, params["nlist"], params["pq_m"], params["pq_nbits"],
+                                    faiss.METRIC_INNER_PRODUCT)
+        return faiss.IndexIVFFlat(quantizer, dim, params["nlist"], faiss.METRIC_INNER_PRODUCT)
+    return faiss.IndexFlatIP(dim)
+
+
+def read_index_params(index_path: str) -> dict:
+    """读取索引的参数文件，不存在或损坏时返回空字典（检索参数使用 Config 默认值）"""
+    path = params_path_for(index_path)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"警告: 索引参数文件 {path} 读取失败，使用默认检索参数: {str(e)}")
+        return {}
+
+
+def write_index_params(path: str, params: dict):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(params, f, ensure_ascii=False, indent=4)
+
+
+def params_signature(index_path: str) -> Tuple[int, ...]:
+    """参数文件的版本（不存在时为空），参数文件修改后检索端的缓存会重新加载"""
+    try:
+        st = os.stat(params_path_for(index_path))
+    except FileNotFoundError:
+        return ()
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+def apply_search_params(index: faiss.Index, params: dict):
+    """把检索参数设置到索引上：IVF 的 nprobe、HNSW 的 efSearch，其他索引没有检索参数"""
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        ivf = None
+    if ivf is not None:
+        ivf.nprobe = max(1, min(int(params.get("nprobe", Config.index_nprobe)), ivf.nlist))
+    hnsw = getattr(index, "hnsw", None)
+    if hnsw is not None:
+        hnsw.efSearch = int(params.get("ef_search", Config.index_hnsw_ef_search))
+
+
+def update_search_params(index_path: str, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> dict:
+    """
+    调整单个知识库的检索参数（写回参数文件），不需要重建索引，返回更新后的参数
+    nprobe 越大 IVF 召回越高、越慢；ef_search 越大 HNSW 召回越高、越慢
+    """
+    params = read_index_params(index_path)
+    if nprobe is not None:
+        params["nprobe"] = int(nprobe)
+    if ef_search is not None:
+        params["ef_search"] = int(ef_search)
+    # 先写临时文件再替换，检索端不会读到写了一半的参数文件
+    tmp_path = params_path_for(index_path) + ".tmp"
+    write_index_params(tmp_path, params)
+    os.replace(tmp_path, params_path_for(index_path))
+    return params
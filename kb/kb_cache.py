@@ -0,0 +1,201 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+import faiss
+from config.configs import Config
+from kb.chunk_store import ChunkStore, open_metadata
+from kb.index_params import apply_search_params, params_signature, read_index_params
+
+# 进程内共享的知识库句柄缓存：FAISS 索引和元数据（kb.chunk_store）打开一次后常驻，检索时不再每次读盘。
+# 以索引和元数据文件的 (mtime, 大小, inode) 作为版本，入库任务发布新索引（os.replace）后版本变化，下一次检索自动重新加载。
+# 总内存超过上限时淘汰最久未使用的知识库。
+# 缓存中的索引只用于检索（只读），入库时追加向量要自己读取一份，不能修改缓存中的对象。
+# Config.kb_index_mmap 开启时索引以内存映射方式打开，数据留在页缓存中，不计入缓存的内存上限。
+# 加载时按索引参数文件（kb.index_params）设置 nprobe / efSearch，参数文件修改后同样自动重新加载。
+
+
+def _file_signature(path: str) -> Tuple[int, int, int]:
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+def _mmap_flags() -> List[int]:
+    # IO_FLAG_MMAP_IFC（较新的 FAISS）可以零拷贝映射 Flat 等索引的向量数据；
+    # IO_FLAG_MMAP 只映射 IVF 的倒排表，其他索引仍会读入内存
+    flags = []
+    if hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+        flags.append(faiss.IO_FLAG_MMAP_IFC)
+    flags.append(faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    return flags
+
+
+def read_index_for_search(index_path: str, mmap: bool = Config.kb_index_mmap) -> Tuple[faiss.Index, bool]:
+    """
+    读取只用于检索的索引，返回 (索引, 是否为内存映射)
+    内存映射的索引不能修改；当前 FAISS 版本或索引类型不支持时退回普通读取
+    """
+    if mmap:
+        for flags in _mmap_flags():
+            try:
+                index = faiss.read_index(index_path, flags)
+            except Exception as e:
+                error = e
+                continue
+            if flags != faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY:
+                return index, True
+            # 退回 IO_FLAG_MMAP 时只有 IVF 索引真正被映射
+            try:
+                faiss.extract_index_ivf(index)
+                return index, True
+            except Exception:
+                return index, False
+        print(f"警告: 索引 {index_path} 无法以内存映射方式打开，改为读入内存: {error}")
+    return faiss.read_index(index_path), False
+
+
+def _metadata_nbytes(metadata: Union[ChunkStore, List[dict]]) -> int:
+    # SQLite 存储的元数据留在磁盘上按需读取，不计内存
+    if isinstance(metadata, ChunkStore):
+        return 0
+    # 估算旧格式元数据列表在内存中的大小：列表、每个字典及其中的字符串
+    total = sys.getsizeof(metadata)
+    for item in metadata:
+        total += sys.getsizeof(item)
+        for value in item.values():
+            total += sys.getsizeof(value)
+    return total
+
+
+class KBHandle:
+    """一个知识库已加载的索引和元数据"""
+
+    def __init__(self, index_path: str, metadata_path: str, signature: tuple):
+        self.index_path = index_path
+        self.metadata_path = metadata_path
+        self.signature = signature
+        self.index, self.mmapped = read_index_for_search(index_path)
+        self.params = read_index_params(index_path)
+        apply_search_params(self.index, self.params)
+        self.metadata = open_metadata(metadata_path)
+        # 索引文件的大小近似等于索引在内存中的大小；内存映射的索引在页缓存中，只计元数据
+        self.nbytes = _metadata_nbytes(self.metadata) + (0 if self.mmapped else os.path.getsize(index_path))
+
+    def get_chunks(self, positions: Iterable[int]) -> List[dict]:
+        """按 FAISS 返回的下标取分块元数据，跳过无效下标（-1 或越界），保持检索结果的顺序"""
+        positions = [int(pos) for pos in positions if 0 <= pos < len(self.metadata)]
+        if isinstance(self.metadata, ChunkStore):
+            return [item for item in self.metadata.get_many(positions) if item is not None]
+        return [self.metadata[pos] for pos in positions]
+
+    @property
+    def consistent(self) -> bool:
+        """索引与元数据条数一致（发布新版本时两个文件先后替换，可能读到一新一旧）"""
+        return self.index.ntotal == len(self.metadata)
+
+
+class KBHandleCache:
+    """
+    知识库句柄缓存，可在多个线程间共享
+    Args:
+        max_bytes: 缓存的索引和元数据总大小上限（字节），超过后淘汰最久未使用的知识库；
+            单个知识库超过上限时仍然保留（只保留它一个）
+    """
+
+    def __init__(self, max_bytes: int = int(Config.kb_cache_max_mb * 1024 * 1024)):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._handles: "OrderedDict[Tuple[str, str], KBHandle]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._load_locks: Dict[Tuple[str, str], threading.Lock] = {}
+
+    def _lookup(self, key: Tuple[str, str], signature: tuple) -> Optional[KBHandle]:
+        handle = self._handles.get(key)
+        if handle is None or handle.signature != signature:
+            return None
+        self._handles.move_to_end(key)
+        self.hits += 1
+        return handle
+
+    def get(self, index_path: str, metadata_path: str) -> KBHandle:
+        """返回知识库句柄，文件变化或未加载时重新加载；文件不存在时抛出 FileNotFoundError"""
+        key = (os.path.abspath(index_path), os.path.abspath(metadata_path))
+        try:
+            signature = _file_signature(key[0]) + _file_signature(key[1]) + params_signature(key[0])
+        except FileNotFoundError:
+            self.invalidate(index_path, metadata_path)
+            raise
+        with self._lock:
+            handle = self._lookup(key, signature)
+            if handle is not None:
+                return handle
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # 同一个知识库只由一个线程加载，其他线程等待后直接使用加载结果
+        with load_lock:
+            with self._lock:
+                handle = self._lookup(key, signature)
+                if handle is not None:
+                    return handle
+            handle = KBHandle(key[0], key[1], signature)
+            with self._lock:
+                self.misses += 1
+                old = self._handles.pop(key, None)
+                if old is not None:
+                    self._total_bytes -= old.nbytes
+                if handle.consistent:
+                    self._handles[key] = handle
+                    self._total_bytes += handle.nbytes
+                    self._evict()
+                else:
+                    print(f"警告: 索引 {index_path} 与元数据条数不一致（{handle.index.ntotal} / {len(handle.metadata)}），"
+                          f"可能正在发布新版本，本次不缓存")
+            return handle
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and len(self._handles) > 1:
+            _, handle = self._handles.popitem(last=False)
+            self._total_bytes -= handle.nbytes
+            print(f"知识库缓存超过 {self.max_bytes / 1024 / 1024:.0f} MB，已释放 {handle.index_path}")
+
+    def invalidate(self, index_path: Optional[str] = None, metadata_path: Optional[str] = None):
+        """丢弃指定知识库（不指定时丢弃全部）的缓存"""
+        with self._lock:
+            if index_path is None:
+                self._handles.clear()
+                self._total_bytes = 0
+                return
+            # 只按索引路径匹配，元数据路径可以不传
+            index_path = os.path.abspath(index_path)
+            for cached_key in [key for key in self._handles if key[0] == index_path]:
+                self._total_bytes -= self._handles.pop(cached_key).nbytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "kbs": len(self._handles),
+                "hits": self.hits,
+                "misses": self.misses,
+                "size_mb": self._total_bytes / 1024 / 1024,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_kb_handle(index_path: str, metadata_path: str) -> KBHandle:
+    """
+    返回知识库句柄（索引 + 元数据），检索路径统一通过这里加载
+    Config.kb_cache_enabled = False 时每次都从磁盘加载
+    """
+    global _cache
+    if not Config.kb_cache_enabled:
+        return KBHandle(index_path, metadata_path, ())
+    with _cache_lock:
+        if _cache is None:
+            _cache = KBHandleCache()
+    return _cache.get(index_path, metadata_path)
@@ -0,0 +1,59 @@
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator
+from kb.kb_config import OUTPUT_DIR
+
+# 入库任务隔离：每个入库任务在 OUTPUT_DIR/jobs 下有自己的工作目录，中间文件（待发布的索引、元数据）
+# 都写在这里，任务结束后删除；不同知识库的任务互不干扰，可以并行执行。
+# 同一个知识库的任务通过知识库锁串行执行，避免两个任务同时读改写同一份索引和文件清单。
+# 锁只在当前进程内有效（Web UI 与命令行不要同时写同一个知识库）。
+
+JOBS_DIR = os.path.join(OUTPUT_DIR, "jobs")
+
+_kb_locks: Dict[str, threading.Lock] = {}
+_registry_lock = threading.Lock()
+
+
+def get_kb_lock(kb_name: str) -> threading.Lock:
+    """返回知识库对应的锁（同名知识库共享同一把锁）"""
+    with _registry_lock:
+        lock = _kb_locks.get(kb_name)
+        if lock is None:
+            lock = _kb_locks[kb_name] = threading.Lock()
+        return lock
+
+
+def create_job_workspace(kb_name: str) -> str:
+    """创建任务工作目录：OUTPUT_DIR/jobs/<知识库>_<时间>_<随机串>"""
+    job_id = f"{kb_name}_{time.strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}"
+    workspace = os.path.join(JOBS_DIR, job_id)
+    os.makedirs(workspace)
+    return workspace
+
+
+@contextmanager
+def kb_ingest_job(kb_name: str) -> Iterator[str]:
+    """
+    入库任务上下文：持有知识库锁，提供独立的工作目录，退出时删除工作目录
+    用法:
+        with kb_ingest_job(kb_name) as workspace:
+            ...
+    """
+    lock = get_kb_lock(kb_name)
+    if not lock.acquire(blocking=False):
+        print(f"知识库 {kb_name} 正在被其他任务更新，等待其完成...")
+        lock.acquire()
+    workspace = None
+    try:
+        workspace = create_job_workspace(kb_name)
+        yield workspace
+    finally:
+        try:
+            if workspace is not None:
+                shutil.rmtree(workspace, ignore_errors=True)
+        finally:
+            lock.release()
@@ -73,10 +73,10 @@ def get_kb_files(kb_name: str) -> List[str]:
         if not os.path.exists(kb_path):
             return []
 
-        # 获取所有文件（排除索引文件和元数据文件）
+        # 获取所有文件（排除索引文件、原始向量文件、元数据文件和文件清单）
         files = [f for f in os.listdir(kb_path)
                  if os.path.isfile(os.path.join(kb_path, f)) and
-                 not f.endswith(('.index', '.json'))]
+                 not f.endswith(('.index', '.npy', '.json', '.sqlite'))]
 
         return sorted(files)
     except Exception as e:
@@ -0,0 +1,59 @@
+import os
+import json
+import hashlib
+from typing import Dict, Iterable, List
+
+# 知识库文件清单（manifest）：记录每个已入库文件的内容哈希，用于增量索引
+# 结构：{文件名: {"sha256": ..., "size": ..., "chunks": ..., "indexed_at": ..., "dedup_refs": [...]}}
+# dedup_refs 是该文件入库时因与其他文件重复而被丢弃的分块所依赖的文件，这些文件被替换时该文件要重新入库
+
+
+def compute_file_hash(file_path: str, block_size: int = 1024 * 1024) -> str:
+    """按块流式计算文件的 sha256，避免把大文件一次性读入内存"""
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def load_manifest(manifest_path: str) -> Dict[str, dict]:
+    """读取知识库文件清单，不存在或损坏时返回空清单"""
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        return manifest if isinstance(manifest, dict) else {}
+    except Exception as e:
+        print(f"警告: 读取文件清单 {manifest_path} 失败，将按空清单处理: {str(e)}")
+        return {}
+
+
+def save_manifest(manifest_path: str, manifest: Dict[str, dict]) -> None:
+    """写入知识库文件清单（先写临时文件再替换，避免写到一半被读到）"""
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, manifest_path)
+
+
+def find_dedup_dependents(manifest: Dict[str, dict], replaced: Iterable[str]) -> List[str]:
+    """
+    找出需要随 replaced 一起重新入库的文件：它们有分块因与 replaced 中的文件重复而被丢弃，
+    旧分块被替换后这部分内容在索引中就不存在了。依赖关系可以传递（C 依赖 B、B 依赖 A）；
+    依赖的文件不在清单中（例如当时与它同批入库但向量化失败）时同样需要重新入库
+    """
+    gone = set(replaced)
+    dependents = []
+    changed = True
+    while changed:
+        changed = False
+        for name, entry in manifest.items():
+            if name in gone:
+                continue
+            if any(ref in gone or ref not in manifest for ref in entry.get("dedup_refs", ())):
+                gone.add(name)
+                dependents.append(name)
+                changed = True
+    return dependents
@@ -1,12 +1,20 @@
 from typing import Dict
 import os
 from kb.kb_config import KB_BASE_DIR,DEFAULT_KB,OUTPUT_DIR
+from kb.chunk_store import migrate_legacy_metadata
 
 # 基于选定知识库生成索引路径
 def get_kb_paths(kb_name: str) -> Dict[str, str]:
     """获取指定知识库的索引文件路径"""
     kb_dir = os.path.join(KB_BASE_DIR, kb_name)
-    return {
+    paths = {
         "index_path": os.path.join(kb_dir, "semantic_chunk.index"),
-        "metadata_path": os.path.join(kb_dir, "semantic_chunk_metadata.json")
+        "metadata_path": os.path.join(kb_dir, "semantic_chunk_metadata.sqlite"),
+        "manifest_path": os.path.join(kb_dir, "file_manifest.json")
     }
+    # 元数据已改为 SQLite 存储（见 kb.chunk_store），旧知识库第一次被访问时自动转换
+    try:
+        migrate_legacy_metadata(paths["metadata_path"])
+    except Exception as e:
+        print(f"转换知识库 {kb_name} 的元数据失败: {str(e)}")
+    return paths
@@ -0,0 +1,168 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from config.configs import Config
+
+# 持久化的 embedding 缓存：以 (模型名, 维度, 清洗后文本) 的 sha256 为键，保存 float32 向量。
+# 重复上传文件、重建知识库、同一文档进入多个知识库、用户重复提问时，都不必再调用一次 embedding API。
+# 缓存超过容量上限时按最近访问时间淘汰。
+# 同一个类也用作入库任务的断点文件（open_checkpoint），保证中途失败后重跑时不必重新向量化已完成的批次。
+
+# SQLite 单条语句的参数个数有限制，批量查询时分段
+_SQL_BATCH = 500
+
+
+class EmbeddingCache:
+    """
+    基于 SQLite 的 embedding 缓存，可在多个线程间共享
+    Args:
+        path: 缓存数据库文件路径
+        max_bytes: 向量数据的容量上限（字节），超过后淘汰最久未访问的条目，<=0 表示不限制
+    """
+
+    def __init__(self, path: str = Config.embedding_cache_path,
+                 max_bytes: int = int(Config.embedding_cache_max_mb * 1024 * 1024)):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        cache_dir = os.path.dirname(path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key BLOB PRIMARY KEY, dim INTEGER NOT NULL, vector BLOB NOT NULL, accessed REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_accessed ON embeddings(accessed)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def make_key(text: str, model_name: str = Config.model_name, dimensions: int = Config.dimensions) -> bytes:
+        return hashlib.sha256(f"{model_name}|{dimensions}|{text}".encode('utf-8')).digest()
+
+    def get_many(self, keys: Iterable[bytes]) -> Dict[bytes, np.ndarray]:
+        """批量查询，返回命中的 {键: 向量}，并刷新命中条目的访问时间"""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), _SQL_BATCH):
+                part = keys[i:i + _SQL_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part)
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE embeddings SET accessed = ? WHERE key = ?",
+                                       [(now, key) for key in found])
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items: List[Tuple[bytes, np.ndarray]]):
+        """批量写入向量（统一存为 float32），写入后检查容量"""
+        if not items:
+            return
+        now = time.time()
+        rows = [(key, len(vector), np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items]
+        with self._lock:
+            keys = [row[0] for row in rows]
+            replaced = 0
+            for i in range(0, len(keys), _SQL_BATCH):
+                part = keys[i:i + _SQL_BATCH]
+                replaced += self._conn.execute(
+                    f"SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings "
+                    f"WHERE key IN ({','.join('?' * len(part))})", part).fetchone()[0]
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, dim, vector, accessed) "
+                                   "VALUES (?, ?, ?, ?)", rows)
+            self._total_bytes += sum(len(row[2]) for row in rows) - replaced
+            if 0 < self.max_bytes < self._total_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # 淘汰到容量上限的 90%，避免每次写入都触发淘汰
+        target = int(self.max_bytes * 0.9)
+        while self._total_bytes > target:
+            rows = self._conn.execute(
+                "SELECT key, LENGTH(vector) FROM embeddings ORDER BY accessed LIMIT ?", (_SQL_BATCH,)).fetchall()
+            if not rows:
+                self._total_bytes = 0
+                break
+            victims = []
+            for key, size in rows:
+                victims.append((key,))
+                self._total_bytes -= size
+                if self._total_bytes <= target:
+                    break
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", victims)
+        print(f"embedding 缓存超过 {self.max_bytes / 1024 / 1024:.0f} MB，已淘汰最久未访问的条目")
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size_mb": self._total_bytes / 1024 / 1024,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def destroy(self):
+        """关闭并删除数据库文件（用于任务成功后清理断点文件）"""
+        self.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+
+def open_checkpoint(path: str) -> Optional[EmbeddingCache]:
+    """
+    打开入库任务的 embedding 断点文件：每个批次成功后立即落盘，且不做容量淘汰；
+    任务中途失败时保留，重新上传同样的文件会直接复用已完成批次的向量，成功后由调用方 destroy
+    """
+    try:
+        checkpoint = EmbeddingCache(path, max_bytes=0)
+    except Exception as e:
+        print(f"警告: 打开 embedding 断点文件 {path} 失败，本次任务不做断点续传: {str(e)}")
+        return None
+    if checkpoint._total_bytes:
+        print(f"发现 embedding 断点文件 {path}（{checkpoint._total_bytes / 1024 / 1024:.1f} MB），将复用已完成的向量")
+    return checkpoint
+
+
+_cache = None
+_cache_failed = False
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """返回全局共享的 embedding 缓存；未启用或打开失败时返回 None"""
+    global _cache, _cache_failed
+    if not Config.embedding_cache_enabled or _cache_failed:
+        return None
+    if _cache is not None:
+        return _cache
+    with _cache_lock:
+        if _cache is None and not _cache_failed:
+            try:
+                _cache = EmbeddingCache()
+            except Exception as e:
+                _cache_failed = True
+                print(f"警告: 打开 embedding 缓存 {Config.embedding_cache_path} 失败，不使用缓存: {str(e)}")
+    return _cache
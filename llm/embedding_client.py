@@ -1,17 +1,143 @@
 from config.configs import Config
+import openai
 from openai import OpenAI
 import numpy as np
+import base64
 from ingest.text_cleaner import clean_text
+from ingest.token_counter import truncate_for_embedding
+from llm.embedding_cache import EmbeddingCache, get_embedding_cache
+import threading
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from typing import List, Optional, Tuple
+
+
+def _pack_batches(texts: List[str], max_items: int, max_chars: int) -> List[Tuple[int, int]]:
+    """
+    按条数和总字符数把文本切成批次，返回每批的 [start, end) 下标
+    短文本多装几条，长文本少装几条，每个请求的数据量大致均衡；单条超过字符预算时独占一批
+    """
+    batches = []
+    start = 0
+    chars = 0
+    for i, text in enumerate(texts):
+        if i > start and (i - start >= max_items or chars + len(text) > max_chars):
+            batches.append((start, i))
+            start, chars = i, 0
+        chars += len(text)
+    if start < len(texts):
+        batches.append((start, len(texts)))
+    return batches
+
+
+# 各 embedding 服务实际使用的响应格式（按 base_url 记录）；服务端不支持 base64 时改为 float，之后的请求不再尝试
+_encoding_formats = {}
+_encoding_formats_lock = threading.Lock()
+
+
+def _client_key(embedding_client) -> str:
+    """同一服务地址的客户端共用响应格式（vectorize_query 每次调用都会新建客户端）"""
+    return str(getattr(embedding_client, "base_url", id(embedding_client)))
+
+
+def _is_retryable(error: Exception) -> bool:
+    """限流（429）、超时、连接错误和 5xx 属于临时错误；其他 4xx（请求错误、输入超长、鉴权失败等）重试也不会成功"""
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def _rejects_base64(error: Exception) -> bool:
+    """服务端以 400 拒绝 encoding_format 参数（不支持 base64）"""
+    if not isinstance(error, openai.BadRequestError):
+        return False
+    message = str(error.message).lower()
+    return "encoding_format" in message or "base64" in message
+
+
+def _decode_embeddings(data, expected: int) -> np.ndarray:
+    """
+    把 API 返回的向量直接写入预分配的 float32 矩阵
+    base64 格式按小端 float32 解码，不产生 Python float 对象；服务端忽略 encoding_format 返回列表时按列表转换
+    """
+    if len(data) != expected:
+        raise ValueError(f"API 返回 {len(data)} 个向量，期望 {expected} 个")
+    vectors = None
+    for i, embedding in enumerate(data):
+        raw = embedding.embedding
+        if isinstance(raw, str):
+            row = np.frombuffer(base64.b64decode(raw), dtype='<f4')
+        else:
+            row = np.asarray(raw, dtype=np.float32)
+        if vectors is None:
+            vectors = np.empty((expected, row.shape[0]), dtype=np.float32)
+        # 按响应中的 index 放置，不依赖返回顺序
+        index = getattr(embedding, "index", None)
+        vectors[i if index is None else index] = row
+    return vectors
+
+
+def _embed_batch(embedding_client, model_name: str, batch: List[str]) -> np.ndarray:
+    key = _client_key(embedding_client)
+    attempt = 0
+    # 限流、超时、网络抖动和服务端 5xx 按指数退避重试，重试用尽后才算批次失败；其他错误立即抛出
+    while True:
+        encoding_format = _encoding_formats.get(key, Config.embedding_encoding_format)
+        try:
+            completion = embedding_client.embeddings.create(
+                model=model_name,
+                input=batch,
+                dimensions=Config.dimensions,
+                encoding_format=encoding_format
+            )
+            return _decode_embeddings(completion.data, len(batch))
+        except Exception as e:
+            if encoding_format == "base64" and _rejects_base64(e):
+                # 服务端拒绝 base64 格式：该服务改用 float 立即重试，不计入重试次数
+                print(f"embedding 服务 {key} 不支持 base64 响应格式，改用 float：{str(e)}")
+                with _encoding_formats_lock:
+                    _encoding_formats[key] = "float"
+                continue
+            if not _is_retryable(e) or attempt >= Config.embedding_max_retries:
+                raise
+            delay = Config.embedding_retry_backoff * (2 ** attempt)
+            attempt += 1
+            print(f"向量化请求失败：{str(e)}，{delay:.1f}s 后第 {attempt} 次重试")
+            time.sleep(delay)
+
+
+def _get_local_encoder():
+    """use_api = False 时返回本地 embedding 模型（ingest.text2vec 导入时按配置加载，torch 等依赖只在这时导入）"""
+    from ingest.text2vec import tv
+    return tv
 
 
 # 向量化查询 - 通用函数，被多处使用
-def vectorize_query(query, model_name=Config.model_name, batch_size=Config.batch_size) -> np.ndarray:
-    """向量化文本查询，返回嵌入向量，改进错误处理和批处理"""
-    embedding_client = OpenAI(
-        api_key=Config.api_key,
-        base_url=Config.base_url
-    )
+def vectorize_query(query, model_name=Config.model_name, batch_size=Config.batch_size,
+                    max_concurrency=Config.embedding_concurrency,
+                    checkpoint: Optional[EmbeddingCache] = None) -> np.ndarray:
+    """
+    向量化文本查询，返回嵌入向量，改进错误处理和批处理
+    batch_size 是单个请求的最大条数，同时受 Config.embedding_batch_max_chars 限制；
+    多个批次最多 max_concurrency 个同时请求，结果按输入顺序组装。
+    checkpoint: 入库任务的断点文件（见 llm.embedding_cache.open_checkpoint），每个成功的批次立即写入，
+        重跑时先从中取回已完成的向量。
+    Config.use_api = False 时使用本地模型（见 ingest.text2vec.TextVector.encode），不调用 API，
+        缓存键的模型名换成本地模型的标识，批次按文本长度排序、串行推理（推理本身已经多线程）。
+    """
+    local_encoder = None
+    embedding_client = None
+    if Config.use_api:
+        embedding_client = OpenAI(
+            api_key=Config.api_key,
+            base_url=Config.base_url
+        )
+    else:
+        local_encoder = _get_local_encoder()
+        model_name = local_encoder.model_id
+        batch_size = Config.local_embedding_batch_size
+        max_concurrency = 1
 
     if not query:
         print("警告: 传入向量化的查询为空")
@@ -34,10 +160,11 @@ def vectorize_query(query, model_name=Config.model_name, batch_size=Config.batch
             print("警告: 清理后的查询文本为空")
             continue
 
-        # 检查长度是否在API限制范围内
-        if len(clean_q) > 8000:
-            print(f"警告: 查询文本过长 ({len(clean_q)} 字符)，截断至 8000 字符")
-            clean_q = clean_q[:8000]
+        # 检查长度是否在API限制范围内（按字符或 token）
+        truncated_q = truncate_for_embedding(clean_q)
+        if len(truncated_q) < len(clean_q):
+            print(f"警告: 查询文本过长 ({len(clean_q)} 字符)，截断至 {len(truncated_q)} 字符")
+            clean_q = truncated_q
 
         valid_queries.append(clean_q)
 
@@ -45,37 +172,93 @@ def vectorize_query(query, model_name=Config.model_name, batch_size=Config.batch
         print("错误: 所有查询都无效，无法进行向量化")
         return np.array([])
 
-    # 分批处理有效查询
-    all_vectors = []
-    for i in range(0, len(valid_queries), batch_size):
-        batch = valid_queries[i:i + batch_size]
+    # 先查断点文件和缓存，只把未命中的文本（同一请求内重复的文本只算一次）发给 API
+    cache = get_embedding_cache()
+    stores = [store for store in (checkpoint, cache) if store is not None]
+    keys = [EmbeddingCache.make_key(q, model_name, Config.dimensions) for q in valid_queries]
+    resolved = {}
+    for store in stores:
+        missing = [key for key in keys if key not in resolved]
+        if not missing:
+            break
+        resolved.update(store.get_many(missing))
+    pending = {}
+    for key, q in zip(keys, valid_queries):
+        if key not in resolved and key not in pending:
+            pending[key] = q
+    if resolved:
+        print(f"embedding 缓存命中 {len(keys) - sum(1 for key in keys if key not in resolved)}/{len(keys)} 个文本")
+
+    # 本地推理按长度排序后再分批，批内长度接近，padding 最少（结果按键组装，顺序无关）
+    if local_encoder is not None:
+        pending = dict(sorted(pending.items(), key=lambda item: len(item[1]), reverse=True))
+
+    # 分批处理未命中的查询，多个批次并发请求
+    pending_keys = list(pending)
+    pending_texts = list(pending.values())
+    if local_encoder is not None:
+        batches = [(begin, min(begin + batch_size, len(pending_texts)))
+                   for begin in range(0, len(pending_texts), batch_size)]
+    else:
+        batches = _pack_batches(pending_texts, batch_size, Config.embedding_batch_max_chars)
+
+    def run_batch(batch_no: int, begin: int, end: int):
+        batch = pending_texts[begin:end]
         try:
             # 记录批次信息便于调试
-            print(f"正在向量化批次 {i // batch_size + 1}/{(len(valid_queries) - 1) // batch_size + 1}, "
+            print(f"正在向量化批次 {batch_no}/{len(batches)}, "
                   f"包含 {len(batch)} 个文本，第一个文本长度: {len(batch[0][:50])}...")
-
-            completion = embedding_client.embeddings.create(
-                model=model_name,
-                input=batch,
-                dimensions=Config.dimensions,
-                encoding_format="float"
-            )
-            vectors = [embedding.embedding for embedding in completion.data]
-            all_vectors.extend(vectors)
-            print(f"批次 {i // batch_size + 1} 向量化成功，获得 {len(vectors)} 个向量")
+            if local_encoder is not None:
+                vectors = local_encoder.encode(batch)
+            else:
+                vectors = _embed_batch(embedding_client, model_name, batch)
         except Exception as e:
-            print(f"向量化批次 {i // batch_size + 1} 失败：{str(e)}")
+            print(f"向量化批次 {batch_no} 失败：{str(e)}")
             print(f"问题批次中的第一个文本: {batch[0][:100]}...")
             traceback.print_exc()
-            # 如果是第一批就失败，直接返回空数组
-            if i == 0:
-                return np.array([])
-            # 否则返回已处理的向量
+            raise
+        batch_items = list(zip(pending_keys[begin:end], vectors))
+        for store in stores:
+            try:
+                store.put_many(batch_items)
+            except Exception as e:
+                print(f"警告: 写入 embedding 缓存失败 {store.path}: {str(e)}")
+        print(f"批次 {batch_no} 向量化成功，获得 {len(vectors)} 个向量")
+        return batch_items
+
+    if len(batches) <= 1 or max_concurrency <= 1:
+        for batch_no, (begin, end) in enumerate(batches, start=1):
+            try:
+                resolved.update(run_batch(batch_no, begin, end))
+            except Exception:
+                # 后续批次不再请求，下面只返回失败位置之前已经得到的向量
+                break
+    elif batches:
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(batches))) as executor:
+            futures = [executor.submit(run_batch, batch_no, begin, end)
+                       for batch_no, (begin, end) in enumerate(batches, start=1)]
+            done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+            # 有批次失败时取消还没开始的批次；已经成功的批次照常收集（也已写入缓存，重试时直接命中）
+            for future in not_done:
+                future.cancel()
+        for future in futures:
+            if not future.cancelled() and future.exception() is None:
+                resolved.update(future.result())
+
+    # 按输入顺序组装结果；遇到缺失的向量就停止，返回已处理的前缀（与原先的部分失败语义一致）
+    count = 0
+    for key in keys:
+        if key not in resolved:
             break
+        count += 1
 
     # 检查是否获得了任何向量
-    if not all_vectors:
+    if count == 0:
         print("错误: 向量化过程没有产生任何向量")
         return np.array([])
 
-    return np.array(all_vectors)
+    # 直接写入预分配的结果矩阵，不经过中间列表和 vstack
+    all_vectors = np.empty((count, len(resolved[keys[0]])), dtype=np.float32)
+    for i, key in enumerate(keys[:count]):
+        all_vectors[i] = resolved[key]
+    return all_vectors
@@ -1,73 +1,283 @@
 import json
+import os
+import shutil
 import faiss
 import numpy as np
 import traceback
+from itertools import chain
+from config.configs import Config
+from kb.chunk_store import iter_metadata, read_metadata_sources, write_metadata
+from kb.index_params import (choose_index_params, create_index, params_path_for, read_index_params,
+                             write_index_params)
 
-# 构建Faiss索引
-def build_faiss_index(vector_file, index_path, metadata_path):
+
+# 根据向量规模和 Config 创建并训练索引，返回 (索引, 索引参数)；索引类型和参数的选择见 kb.index_params
+def _create_index(vectors: np.ndarray):
+    n_vectors, dim = vectors.shape
+    params = choose_index_params(n_vectors, dim)
+    print(f"使用 {params['type']} 索引，参数: {params}")
+    index = create_index(dim, params)
+    if not index.is_trained:
+        # IVF：k-均值聚类，将向量分配到不同的簇（cluster）；IVF-PQ 同时训练 PQ 码本
+        index.train(vectors)
+    index.add(vectors)
+    return index, params
+
+
+# 原始向量文件：与索引逐行对应的 float32 向量（.npy），索引类型或 nlist 需要调整时从这里重建，
+# 不从索引中取回向量（IVF-PQ 只能取回有损的解码向量，反复重建会累积误差）；只在建索引时读取，检索端不使用
+def vectors_path_for(index_path: str) -> str:
+    return index_path + ".vectors.npy"
+
+
+# 写原始向量文件时每次复制的行数，旧向量以内存映射方式读取，按块复制，内存占用与向量总数无关
+_COPY_BLOCK_ROWS = 65536
+
+
+# 从已有索引中取回全部向量（IVF 索引需要临时建立 direct map；IVF-PQ 只能取回解码后的近似向量）
+def _reconstruct_all(index) -> np.ndarray:
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
     try:
-        with open(vector_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return index.reconstruct_n(0, index.ntotal)  # 非 IVF 索引，可以直接 reconstruct
+    ivf.make_direct_map()
+    vectors = index.reconstruct_n(0, index.ntotal)
+    # 有 direct map 的 IVF 索引不支持 remove_ids，用完即清除
+    ivf.make_direct_map(False)
+    return vectors
 
-        if not data:
-            raise ValueError("向量数据为空，请检查输入文件。")
 
-        # 确认所有数据项都有向量
-        valid_data = []
-        for item in data:
-            if 'vector' in item and item['vector']:
-                valid_data.append(item)
-            else:
-                print(f"警告: 跳过没有向量的数据项 ID: {item.get('id', '未知')}")
+# 读取已有索引的原始向量（内存映射）；没有原始向量文件的旧索引退回从索引中取回
+def _load_original_vectors(index, index_path: str, params: dict) -> np.ndarray:
+    path = vectors_path_for(index_path)
+    if os.path.exists(path):
+        vectors = np.load(path, mmap_mode='r')
+        if vectors.shape == (index.ntotal, index.d):
+            return vectors
+        print(f"警告: 原始向量文件 {path} 与索引不一致（{vectors.shape}），改为从索引中取回向量")
+    if params.get("type") == "ivf_pq":
+        print("警告: 缺少原始向量文件，只能从 IVF-PQ 索引中取回近似向量")
+    return _reconstruct_all(index)
 
-        if not valid_data:
-            raise ValueError("没有找到任何有效的向量数据。")
 
-        # 提取向量
-        vectors = [item['vector'] for item in valid_data]
-        vectors = np.array(vectors, dtype=np.float32)
-
-        if vectors.size == 0:
-            raise ValueError("向量数组为空，转换失败。")
-
-        # 检查向量维度
-        dim = vectors.shape[1]
-        n_vectors = vectors.shape[0]
-        print(f"构建索引: {n_vectors} 个向量，每个向量维度: {dim}")
-
-        # 确定索引类型和参数
-        max_nlist = n_vectors // 39
-        nlist = min(max_nlist, 128) if max_nlist >= 1 else 1
-
-        # 在 Faiss 的 IndexIVFFlat 训练机制中的硬性规定：
-        # 要训练出 n 个聚类中心，训练数据最好是 n 的 39 倍以上。
-        # n_vectors >= 39， 走 IndexIVFFlat
-
-        if n_vectors > 10000 and nlist >= 1 and n_vectors >= nlist * 39:
-            print(f"使用 IndexIVFFlat 索引，nlist={nlist}")
-            # 创建暴力搜索索引，是创建了一个使用内积作为相似度度量的 Flat 向量索引
-            quantizer = faiss.IndexFlatIP(dim)
-            # 创建索引，
-            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
-            if not index.is_trained:
-                # k-均值聚类，将向量分配到不同的簇（cluster）
-                index.train(vectors)
-            index.add(vectors)
-        # n_vectors 小于10000，走 IndexFlatIP
+# 把 (向量矩阵, 行掩码) 依次写入一个 .npy 文件，掩码为 None 时写入全部行
+def _write_vectors(path: str, parts):
+    dim = parts[0][0].shape[1]
+    n_rows = sum(len(vectors) if mask is None else int(mask.sum()) for vectors, mask in parts)
+    out = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(n_rows, dim))
+    row = 0
+    for vectors, mask in parts:
+        for begin in range(0, len(vectors), _COPY_BLOCK_ROWS):
+            block = vectors[begin:begin + _COPY_BLOCK_ROWS]
+            if mask is not None:
+                block = block[mask[begin:begin + _COPY_BLOCK_ROWS]]
+            out[row:row + len(block)] = block
+            row += len(block)
+    out.flush()
+    del out
+
+
+# 从索引中删除指定位置的向量，剩余向量的 id 按原顺序重新编号为 0..n-1，与元数据的行号保持一致
+# Flat 索引删除后自动紧凑；IVF 倒排表中保存的是显式 id，需要逐个倒排表减去其前面被删除的个数
+def _remove_positions(index, positions: np.ndarray):
+    positions = np.ascontiguousarray(positions, dtype=np.int64)
+    index.remove_ids(faiss.IDSelectorBatch(positions))
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return
+    invlists = ivf.invlists
+    for list_no in range(ivf.nlist):
+        size = invlists.list_size(list_no)
+        if size:
+            ids = faiss.rev_swig_ptr(invlists.get_ids(list_no), size)
+            ids -= np.searchsorted(positions, ids)
+
+
+# 判断增量更新后是否需要用原始向量重建索引，需要时返回原因
+def _rebuild_reason(params: dict, wanted: dict, removing: bool) -> str:
+    if params.get("type") != wanted["type"]:
+        # 向量数增长后 auto 选择的索引类型变化（如 flat -> ivf_flat），或修改了 Config.index_type；
+        # 没有参数文件的旧索引也重建一次（旧的 IVF 索引按 L2 距离建立，且未设置 nprobe）
+        return f"索引类型由 {params.get('type', '未记录')} 调整为 {wanted['type']}"
+    if "nlist" in wanted and params.get("nlist"):
+        ratio = wanted["nlist"] / params["nlist"]
+        if max(ratio, 1 / ratio) > Config.index_rebuild_nlist_ratio:
+            # 聚类中心是按训练时的向量数选的，规模变化太大后每个倒排表过长（或过短），召回和速度都会变差
+            return f"向量数变化后 nlist 应由 {params['nlist']} 调整为 {wanted['nlist']}"
+    if removing and params["type"] == "hnsw":
+        return "HNSW 索引不支持删除向量"
+    return ""
+
+
+# 把新向量追加到已有索引，replace_sources 中的文件旧分块会被剔除，同时把更新后的原始向量写到 vectors_out
+# 返回 (索引, 元数据行的迭代器, 索引参数)；旧元数据从存储中逐行读出，不整体读入内存
+def _append_to_existing(vectors, metadata, index_path, metadata_path, replace_sources, vectors_out):
+    index = faiss.read_index(index_path)
+    old_sources = read_metadata_sources(metadata_path)
+    params = read_index_params(index_path)
+
+    if vectors.shape[0] == 0:
+        # 没有新向量，只删除被替换文件的旧分块
+        vectors = np.zeros((0, index.d), dtype=np.float32)
+    if index.d != vectors.shape[1]:
+        raise ValueError(f"新向量维度 {vectors.shape[1]} 与已有索引维度 {index.d} 不一致，请全量重建索引。")
+    if index.ntotal != len(old_sources):
+        raise ValueError(f"已有索引向量数 {index.ntotal} 与元数据条数 {len(old_sources)} 不一致，请全量重建索引。")
+
+    keep_mask = np.array([source not in replace_sources for source in old_sources], dtype=bool)
+    n_removed = len(keep_mask) - int(keep_mask.sum())
+    kept_metadata = (item for item, k in zip(iter_metadata(metadata_path), keep_mask) if k)
+    old_vectors = _load_original_vectors(index, index_path, params)
+    wanted = choose_index_params(len(keep_mask) - n_removed + vectors.shape[0], index.d)
+    reason = _rebuild_reason(params, wanted, n_removed > 0)
+
+    if reason:
+        # 从原始向量重建（不需要重新调用 embedding）
+        print(f"{reason}，用原始向量重建索引")
+        all_vectors = np.vstack([old_vectors[keep_mask], vectors]).astype(np.float32)
+        index, params = _create_index(all_vectors)
+        _write_vectors(vectors_out, [(all_vectors, None)])
+        return index, chain(kept_metadata, metadata), params
+
+    # 剔除变化文件的旧分块后追加新向量，IVF 沿用已训练的聚类中心和 PQ 码本，无需重新训练
+    if n_removed:
+        print(f"从索引中删除 {n_removed} 个过期分块")
+        _remove_positions(index, np.flatnonzero(~keep_mask))
+    print(f"追加 {vectors.shape[0]} 个向量到已有索引（保留 {index.ntotal} 个）")
+    index.add(vectors)
+    _write_vectors(vectors_out, [(old_vectors, keep_mask), (vectors, None)])
+    return index, chain(kept_metadata, metadata), params
+
+
+# 基于内存中的向量构建（或增量更新）Faiss 索引
+def build_index_from_vectors(vectors, metadata, index_path, metadata_path, append=False, replace_sources=None,
+                             staging_dir=None):
+    """
+    Args:
+        vectors: (n, dim) 的 float32 向量矩阵（可以是内存映射），与 metadata 逐行对应
+        metadata: 分块元数据 [{'id', 'chunk', 'method', 'source'}, ...]，列表或支持 len() 和按顺序迭代的序列
+        metadata_path: 元数据存储路径，第 i 行对应索引中的第 i 个向量（见 kb.chunk_store，.json 结尾时写旧格式）
+        append: 为 True 且索引已存在时，把新向量追加到已有索引，而不是覆盖重建
+        replace_sources: 追加模式下需要替换的文件名集合，这些文件的旧分块会从索引中删除
+        staging_dir: 入库任务的工作目录；给出时先把索引和元数据写到这里，写完再替换到目标路径，
+            检索端不会读到写了一半的文件
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    appending = append and os.path.exists(index_path) and os.path.exists(metadata_path)
+    # 追加模式下允许没有新向量（只从已有索引中删除 replace_sources 的旧分块）
+    if vectors.ndim != 2 or (vectors.shape[0] == 0 and not appending):
+        raise ValueError("向量数组为空，转换失败。")
+    if vectors.shape[0] != len(metadata):
+        raise ValueError(f"向量数量({vectors.shape[0]})与元数据条目({len(metadata)})不匹配")
+
+    # 检查向量维度
+    dim = vectors.shape[1]
+    n_vectors = vectors.shape[0]
+    print(f"构建索引: {n_vectors} 个向量，每个向量维度: {dim}")
+
+    # 没有工作目录时写到同目录的临时文件再替换：检索进程可能以内存映射方式打开着旧索引（见 kb.kb_cache），
+    # 原地覆盖会截断被映射的文件，使其崩溃；替换后旧文件在映射释放前仍然有效
+    def out_path(path):
+        return os.path.join(staging_dir, os.path.basename(path)) if staging_dir else path + ".tmp"
+
+    vectors_path = vectors_path_for(index_path)
+    vectors_out = out_path(vectors_path)
+    if appending:
+        index, metadata, params = _append_to_existing(vectors, metadata, index_path, metadata_path,
+                                                      set(replace_sources or []), vectors_out)
+    else:
+        index, params = _create_index(vectors)
+        _write_vectors(vectors_out, [(vectors, None)])
+
+    index_out = out_path(index_path)
+    metadata_out = out_path(metadata_path)
+    params_path = params_path_for(index_path)
+    params_out = out_path(params_path)
+
+    faiss.write_index(index, index_out)
+    n_rows = write_metadata(metadata_out, metadata)
+    if n_rows != index.ntotal:
+        raise ValueError(f"写入的元数据条数({n_rows})与索引向量数({index.ntotal})不一致")
+    # 参数文件先于索引发布：检索端在两者之间加载时，索引替换后版本变化会再次加载
+    if params:
+        write_index_params(params_out, params)
+        _publish(params_out, params_path)
+    _publish(vectors_out, vectors_path)
+    _publish(index_out, index_path)
+    _publish(metadata_out, metadata_path)
+    print(f"成功写入索引到 {index_path}，共 {index.ntotal} 个向量")
+    print(f"成功写入元数据到 {metadata_path}")
+    return index.ntotal
+
+
+# 把工作目录中写好的文件替换到目标位置；跨文件系统时 os.replace 不可用，退回先复制再替换
+def _publish(src, dst):
+    try:
+        os.replace(src, dst)
+    except OSError:
+        tmp = dst + ".tmp"
+        shutil.copy2(src, tmp)
+        os.replace(tmp, dst)
+        os.remove(src)
+
+
+# 从分块数据生成元数据，source 记录分块来自哪个文件，增量更新时用于替换旧分块
+def to_metadata(item) -> dict:
+    meta = {'id': item['id'], 'chunk': item['chunk'], 'method': item['method']}
+    if 'source' in item:
+        meta['source'] = item['source']
+    return meta
+
+
+# 读取向量化结果：优先读取二进制格式（<name>.json 分块 + <name>.npy 向量），否则按旧的内嵌向量 JSON 解析
+def load_vector_file(vector_file):
+    base = vector_file[:-5] if vector_file.endswith(".json") else vector_file
+    chunks_path, npy_path = base + ".json", base + ".npy"
+    if os.path.exists(npy_path):
+        with open(chunks_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        # 以内存映射方式打开，建索引时按需读入，不额外复制一份
+        vectors = np.load(npy_path, mmap_mode='r')
+        if len(data) != vectors.shape[0]:
+            raise ValueError(f"分块数量({len(data)})与向量数量({vectors.shape[0]})不匹配: {npy_path}")
+        return data, vectors
+
+    with open(vector_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    # 旧格式：确认所有数据项都有向量
+    valid_data = []
+    for item in data:
+        if 'vector' in item and item['vector']:
+            valid_data.append(item)
         else:
-            print(f"使用 IndexFlatIP 索引")
-            index = faiss.IndexFlatIP(dim)
-            index.add(vectors)
+            print(f"警告: 跳过没有向量的数据项 ID: {item.get('id', '未知')}")
+    if not valid_data:
+        return [], np.zeros((0, 0), dtype=np.float32)
+    return valid_data, np.array([item['vector'] for item in valid_data], dtype=np.float32)
+
 
-        faiss.write_index(index, index_path)
-        print(f"成功写入索引到 {index_path}")
+# 构建Faiss索引
+def build_faiss_index(vector_file, index_path, metadata_path, append=False, replace_sources=None):
+    """
+    从向量化结果文件构建（或增量更新）Faiss 索引和元数据；内存中已有向量时直接调用 build_index_from_vectors
+    Args:
+        append: 为 True 且索引已存在时，把新向量追加到已有索引，而不是覆盖重建
+        replace_sources: 追加模式下需要替换的文件名集合，这些文件的旧分块会从索引中剔除
+    """
+    try:
+        data, vectors = load_vector_file(vector_file)
+
+        if not data:
+            raise ValueError("没有找到任何有效的向量数据。")
 
-        # 创建元数据
-        metadata = [{'id': item['id'], 'chunk': item['chunk'], 'method': item['method']} for item in valid_data]
-        with open(metadata_path, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, ensure_ascii=False, indent=4)
-        print(f"成功写入元数据到 {metadata_path}")
+        metadata = [to_metadata(item) for item in data]
 
+        build_index_from_vectors(vectors, metadata, index_path, metadata_path,
+                                 append=append, replace_sources=replace_sources)
         return True
     except Exception as e:
         print(f"构建索引失败: {str(e)}")
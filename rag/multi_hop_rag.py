@@ -1,9 +1,9 @@
 from config.configs import Config
 import json
-import faiss
 import numpy as np
 import os
 from typing import List, Dict, Any, Optional, Tuple
+from kb.kb_cache import get_kb_handle
 from llm.embedding_client import vectorize_query
 from llm.llm_client import client
 import traceback
@@ -28,7 +28,7 @@ class ReasoningRAG:
 
         参数:
             index_path: FAISS索引的路径
-            metadata_path: 元数据JSON文件的路径
+            metadata_path: 元数据存储的路径（SQLite，或旧格式的 JSON）
             max_hops: 最大推理-检索跳数
             initial_candidates: 初始检索候选数量
             refined_candidates: 精炼检索候选数量
@@ -47,16 +47,11 @@ class ReasoningRAG:
         self._load_resources()
 
     def _load_resources(self):
-        """加载FAISS索引和元数据"""
+        """加载FAISS索引和元数据（与向量检索共用进程内缓存，每个请求新建实例时不再重复读盘）"""
         if os.path.exists(self.index_path) and os.path.exists(self.metadata_path):
-            self.index = faiss.read_index(self.index_path)
-            try:
-                with open(self.metadata_path, 'r', encoding='utf-8') as f:
-                    self.metadata = json.load(f)
-            except UnicodeDecodeError:
-                with open(self.metadata_path, 'rb') as f:
-                    content = f.read().decode('utf-8', errors='ignore')
-                    self.metadata = json.loads(content)
+            self.kb_handle = get_kb_handle(self.index_path, self.metadata_path)
+            self.index = self.kb_handle.index
+            self.metadata = self.kb_handle.metadata
         else:
             raise FileNotFoundError(f"Index or metadata not found at {self.index_path} or {self.metadata_path}")
 
@@ -70,7 +65,8 @@ class ReasoningRAG:
             return []
 
         D, I = self.index.search(query_vector, limit)
-        results = [self.metadata[i] for i in I[0] if i < len(self.metadata)]
+        # 只按下标读取命中的分块（元数据存储见 kb.chunk_store）
+        results = self.kb_handle.get_chunks(I[0])
         return results
 
     def _generate_reasoning(self,
@@ -1,7 +1,6 @@
-import json
 import numpy as np
-import faiss
 import os
+from kb.kb_cache import get_kb_handle
 from llm.embedding_client import vectorize_query
 
 
@@ -25,35 +24,22 @@ def vector_search(query, index_path, metadata_path, limit=5):
     # FAISS 需要 float32 类型的二维数组
     query_vector = np.array(query_vector, dtype=np.float32).reshape(1, -1)
 
-    # 2. 加载索引
+    # 2. 加载索引和元数据（进程内缓存，文件更新后自动重新加载）
     if not os.path.exists(index_path):
         print(f"Error: Index file not found at {index_path}")
         return []
-
-    try:
-        index = faiss.read_index(index_path)
-    except Exception as e:
-        print(f"Error loading FAISS index: {e}")
-        return []
-
-    # 3. 加载元数据
     if not os.path.exists(metadata_path):
         print(f"Error: Metadata file not found at {metadata_path}")
         return []
 
     try:
-        with open(metadata_path, 'r', encoding='utf-8') as f:
-            metadata = json.load(f)
-    except UnicodeDecodeError:
-        print(f"警告：{metadata_path} 编码异常，尝试忽略错误读取...")
-        with open(metadata_path, 'rb') as f:
-            content = f.read().decode('utf-8', errors='ignore')
-            metadata = json.loads(content)
+        handle = get_kb_handle(index_path, metadata_path)
     except Exception as e:
-        print(f"Error loading metadata: {e}")
+        print(f"Error loading FAISS index or metadata: {e}")
         return []
+    index = handle.index
 
-    # 4. 执行搜索
+    # 3. 执行搜索
     # 这里的 limit 是关键，streaming_handler 会传入 50
     try:
         D, I = index.search(query_vector, limit)
@@ -61,15 +47,10 @@ def vector_search(query, index_path, metadata_path, limit=5):
         print(f"Error during FAISS search: {e}")
         return []
 
-    # 5. 提取结果
-    results = []
-    # I[0] 是索引 ID 列表，D[0] 是距离/分数列表
-    for i in I[0]:
-        if i < len(metadata):
-            # 确保返回的是完整的元数据对象
-            item = metadata[i]
-            # 可以在这里把 FAISS 的距离分数也带上，方便调试，但不是必须的
-            # item['vector_score'] = float(D[0][idx])
-            results.append(item)
+    # 4. 提取结果
+    # I[0] 是索引 ID 列表，D[0] 是距离/分数列表；只按下标读取命中的分块（结果不足 limit 时 FAISS 用 -1 填充）
+    # 复制一份，调用方修改结果时不影响缓存中的元数据
+    # 可以在这里把 FAISS 的距离分数也带上，方便调试，但不是必须的
+    results = [dict(item) for item in handle.get_chunks(I[0])]
 
-    return results
\ No newline at end of file
+    return results
@@ -0,0 +1,65 @@
+"""
+分块吞吐基准：测量 ingest.chunker.semantic_chunk 的处理速度（MB/s）
+
+默认读取 output/knowledge_base.txt；文本太小时重复拼接到 --min-mb 指定的大小，避免计时误差。
+
+使用方法:
+    python test/bench_chunker.py [--file PATH] [--min-mb 8] [--repeat 3]
+"""
+
+import os
+import sys
+import time
+import argparse
+import logging
+
+# 确保可以从项目根目录导入模块
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from ingest.chunker import semantic_chunk
+
+
+def load_corpus(file_path: str, min_mb: float) -> str:
+    with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+        text = f.read()
+    if not text:
+        raise ValueError(f"基准文本 {file_path} 为空")
+    target = int(min_mb * 1024 * 1024)
+    size = len(text.encode("utf-8"))
+    if size < target:
+        text = "\n\n".join([text] * (target // size + 1))
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="semantic_chunk 吞吐基准")
+    parser.add_argument("--file", default=os.path.join(PROJECT_ROOT, "output", "knowledge_base.txt"),
+                        help="基准文本路径（默认: output/knowledge_base.txt）")
+    parser.add_argument("--min-mb", type=float, default=8, help="文本不足时重复拼接到的最小大小（MB）")
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数，取最快一次")
+    args = parser.parse_args()
+
+    # 基准只关心分块本身，屏蔽日志输出
+    logging.disable(logging.INFO)
+
+    text = load_corpus(args.file, args.min_mb)
+    mb = len(text.encode("utf-8")) / (1024 * 1024)
+    print(f"基准文本: {args.file}，{mb:.2f} MB，{len(text)} 字符")
+
+    best = None
+    n_chunks = 0
+    for i in range(args.repeat):
+        start = time.perf_counter()
+        chunks = semantic_chunk(text)
+        elapsed = time.perf_counter() - start
+        n_chunks = len(chunks)
+        print(f"第 {i + 1} 次: {elapsed:.3f}s，{mb / elapsed:.2f} MB/s")
+        best = elapsed if best is None else min(best, elapsed)
+
+    print(f"最快: {best:.3f}s，{mb / best:.2f} MB/s，生成分块 {n_chunks} 个")
+
+
+if __name__ == "__main__":
+    main()
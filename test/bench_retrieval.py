@@ -0,0 +1,321 @@
+"""
+检索基准：不依赖 embedding API，用确定性的哈希 embedding 生成合成语料，
+在每种索引配置下测量建索引耗时、索引大小、相对精确检索的 recall@k 和单条查询的 p50/p99 延迟。
+
+流程:
+    1. 合成语料：每个分块由若干主题词和公共词组成，哈希 embedding 把每个词映射为固定的随机向量，
+       分块向量是词向量之和（归一化），同一主题的分块彼此相近，接近真实 embedding 的聚簇分布
+    2. 查询：从随机选取的分块中抽取部分词，再混入少量其他词；标准答案为对全部向量的精确内积检索
+    3. 每种索引类型调用 build_faiss_index 建一次索引，再用 update_search_params 依次设置检索参数，
+       通过 search.retriever.vector_search 走完整的检索路径（向量化、加载缓存、检索、读取元数据）计时
+    哈希 embedding 只在本脚本中替换 vector_search 使用的 vectorize_query，不影响其他模块。
+
+结果以 JSON 输出（--output），可与之前的结果对比（--baseline），recall 下降或延迟变慢超过阈值时退出码为 1。
+
+使用方法:
+    python test/bench_retrieval.py [--sizes 10000 100000] [--dim 256] [--queries 1000] [--k 10]
+                                   [--configs flat ivf_flat:nprobe=16 hnsw:ef_search=128 ...]
+                                   [--output result.json] [--baseline old.json] [--tolerance 0.2]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import platform
+import tempfile
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# 确保可以从项目根目录导入模块
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import faiss
+from config.configs import Config
+import search.retriever as retriever
+from kb.index_params import read_index_params, update_search_params
+from rag.indexer import build_faiss_index
+
+# 默认测试的索引配置：索引类型[:检索参数=值,...]，同一索引类型只建一次索引
+DEFAULT_CONFIGS = [
+    "flat",
+    "ivf_flat:nprobe=4", "ivf_flat:nprobe=16", "ivf_flat:nprobe=64",
+    "ivf_pq:nprobe=16", "ivf_pq:nprobe=64",
+    "hnsw:ef_search=32", "hnsw:ef_search=128",
+]
+
+
+class HashEmbedder:
+    """
+    确定性的哈希 embedding：每个词按 blake2b(种子, 词) 生成固定的随机向量，文本向量为词向量之和再归一化
+    相同的文本在任何机器上得到相同的向量；共享词越多的文本越相似
+    """
+
+    def __init__(self, dim: int, seed: int = 0):
+        self.dim = dim
+        self.seed = seed
+        self._cache: Dict[str, np.ndarray] = {}
+
+    def token_vector(self, token: str) -> np.ndarray:
+        vector = self._cache.get(token)
+        if vector is None:
+            digest = hashlib.blake2b(f"{self.seed}:{token}".encode("utf-8"), digest_size=8).digest()
+            rng = np.random.default_rng(int.from_bytes(digest, "little"))
+            vector = rng.standard_normal(self.dim).astype(np.float32)
+            self._cache[token] = vector
+        return vector
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for token in text.split():
+                vectors[i] += self.token_vector(token)
+        return _normalize(vectors)
+
+    def vectorize_query(self, query, *args, **kwargs) -> np.ndarray:
+        """与 llm.embedding_client.vectorize_query 的用法一致：单条文本返回 (1, dim)，列表返回 (n, dim)"""
+        return self.embed([query] if isinstance(query, str) else list(query))
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def make_corpus(embedder: HashEmbedder, n: int, seed: int, n_topics: int = 0, topic_vocab: int = 50,
+                common_vocab: int = 2000, words_per_chunk: int = 24, block: int = 20000) -> Tuple[List[List[int]], np.ndarray, List[str]]:
+    """
+    生成合成语料，返回 (每个分块的词 id 列表, 向量矩阵, 词表)
+    词表 = 公共词 + 每个主题各自的主题词；每个分块约 2/3 的词来自所属主题，其余为公共词
+    """
+    rng = np.random.default_rng(seed)
+    n_topics = n_topics or max(16, int(np.sqrt(n)))
+    vocab = [f"w{i}" for i in range(common_vocab)] + \
+            [f"t{t}_{j}" for t in range(n_topics) for j in range(topic_vocab)]
+    # 词向量矩阵与 embed() 使用同一套哈希向量，查询文本走 embed() 得到一致的结果
+    table = np.stack([embedder.token_vector(token) for token in vocab])
+
+    n_topic_words = words_per_chunk * 2 // 3
+    topics = rng.integers(0, n_topics, n)
+    # 主题词服从偏斜分布（少数高频词），更接近真实文本
+    topic_probs = 1.0 / np.arange(1, topic_vocab + 1)
+    topic_probs /= topic_probs.sum()
+    token_ids = np.empty((n, words_per_chunk), dtype=np.int64)
+    token_ids[:, :n_topic_words] = common_vocab + topics[:, None] * topic_vocab + \
+        rng.choice(topic_vocab, size=(n, n_topic_words), p=topic_probs)
+    token_ids[:, n_topic_words:] = rng.integers(0, common_vocab, (n, words_per_chunk - n_topic_words))
+
+    vectors = np.empty((n, embedder.dim), dtype=np.float32)
+    for start in range(0, n, block):
+        ids = token_ids[start:start + block]
+        acc = np.zeros((len(ids), embedder.dim), dtype=np.float32)
+        for j in range(words_per_chunk):
+            acc += table[ids[:, j]]
+        vectors[start:start + block] = _normalize(acc)
+    return token_ids.tolist(), vectors, vocab
+
+
+def make_queries(token_ids: List[List[int]], vocab: List[str], n_queries: int, seed: int) -> List[str]:
+    """从随机分块中抽取一半的词，再混入 4 个随机词作为查询文本"""
+    rng = np.random.default_rng(seed + 1)
+    queries = []
+    for pos in rng.integers(0, len(token_ids), n_queries):
+        words = token_ids[pos]
+        picked = rng.choice(len(words), size=len(words) // 2, replace=False)
+        noise = rng.integers(0, len(vocab), 4)
+        queries.append(" ".join([vocab[words[i]] for i in picked] + [vocab[i] for i in noise]))
+    return queries
+
+
+def write_vector_file(work_dir: str, token_ids: List[List[int]], vectors: np.ndarray, vocab: List[str]) -> str:
+    """写成 build_faiss_index 读取的向量化结果格式（<name>.json 分块 + <name>.npy 向量）"""
+    base = os.path.join(work_dir, "corpus_vector")
+    chunks = [{"id": f"chunk{pos}", "chunk": " ".join(vocab[i] for i in ids), "method": "synthetic",
+               "source": f"doc{pos // 100}.txt"} for pos, ids in enumerate(token_ids)]
+    with open(base + ".json", "w", encoding="utf-8") as f:
+        json.dump(chunks, f, ensure_ascii=False)
+    np.save(base + ".npy", vectors)
+    return base + ".json"
+
+
+def parse_config(spec: str) -> Tuple[str, dict]:
+    """解析 "ivf_flat:nprobe=16" 形式的配置"""
+    index_type, _, options = spec.partition(":")
+    params = {}
+    for option in filter(None, options.split(",")):
+        key, _, value = option.partition("=")
+        if key not in ("nprobe", "ef_search"):
+            raise ValueError(f"不支持的检索参数 {key}（可选 nprobe、ef_search）")
+        params[key] = int(value)
+    return index_type, params
+
+
+def percentile_ms(samples: List[float], q: float) -> float:
+    return float(np.percentile(samples, q) * 1000) if samples else 0.0
+
+
+def bench_search(queries: List[str], truth: np.ndarray, index_path: str, metadata_path: str, k: int) -> dict:
+    """逐条调用 vector_search，返回 recall@k 和延迟分布（第一次查询单独计为冷启动加载）"""
+    start = time.perf_counter()
+    retriever.vector_search(queries[0], index_path, metadata_path, limit=k)
+    first_ms = (time.perf_counter() - start) * 1000
+
+    latencies = []
+    hits = 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        results = retriever.vector_search(query, index_path, metadata_path, limit=k)
+        latencies.append(time.perf_counter() - start)
+        found = {int(item["id"][len("chunk"):]) for item in results}
+        hits += len(found & set(expected.tolist()))
+    return {
+        "recall_at_k": hits / (len(queries) * k),
+        "p50_ms": percentile_ms(latencies, 50),
+        "p99_ms": percentile_ms(latencies, 99),
+        "mean_ms": float(np.mean(latencies) * 1000),
+        "qps": len(latencies) / sum(latencies),
+        "first_query_ms": first_ms,
+    }
+
+
+def run_size(n: int, args, configs: List[Tuple[str, str, dict]]) -> List[dict]:
+    embedder = HashEmbedder(args.dim, args.seed)
+    start = time.perf_counter()
+    token_ids, vectors, vocab = make_corpus(embedder, n, args.seed)
+    queries = make_queries(token_ids, vocab, args.queries, args.seed)
+    print(f"\n===== {n} 个向量，维度 {args.dim}：语料生成 {time.perf_counter() - start:.1f}s =====")
+
+    # 标准答案：对全部向量做精确内积检索
+    exact = faiss.IndexFlatIP(args.dim)
+    exact.add(vectors)
+    _, truth = exact.search(embedder.embed(queries), args.k)
+    del exact
+
+    work_dir = tempfile.mkdtemp(prefix=f"bench_retrieval_{n}_", dir=args.work_dir)
+    results = []
+    try:
+        vector_file = write_vector_file(work_dir, token_ids, vectors, vocab)
+        del token_ids, vectors
+        built: Dict[str, dict] = {}
+        for name, index_type, search_params in configs:
+            index_path = os.path.join(work_dir, f"{index_type}.index")
+            metadata_path = os.path.join(work_dir, f"{index_type}_metadata.sqlite")
+            if index_type not in built:
+                Config.index_type = index_type
+                start = time.perf_counter()
+                build_faiss_index(vector_file, index_path, metadata_path)
+                built[index_type] = {
+                    "build_s": time.perf_counter() - start,
+                    "index_bytes": os.path.getsize(index_path),
+                    "metadata_bytes": os.path.getsize(metadata_path),
+                    "index_params": read_index_params(index_path),
+                }
+            # 检索参数保存在参数文件中，每个配置在建索引时的参数基础上改写，检索缓存随之重新加载
+            tuned = {key: value for key, value in built[index_type]["index_params"].items()
+                     if key in ("nprobe", "ef_search")}
+            tuned.update(search_params)
+            if tuned:
+                update_search_params(index_path, **tuned)
+            entry = {"n_vectors": n, "dim": args.dim, "k": args.k, "config": name, "index_type": index_type,
+                     "search_params": search_params, **built[index_type]}
+            entry["actual_type"] = entry["index_params"].get("type", index_type)
+            entry.update(bench_search(queries, truth, index_path, metadata_path, args.k))
+            results.append(entry)
+            print(f"{name:<22} 建索引 {entry['build_s']:7.2f}s  索引 {entry['index_bytes'] / 1024 / 1024:8.1f} MB  "
+                  f"recall@{args.k} {entry['recall_at_k']:.4f}  p50 {entry['p50_ms']:7.3f}ms  "
+                  f"p99 {entry['p99_ms']:7.3f}ms")
+    finally:
+        if args.keep:
+            print(f"基准数据保留在 {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def compare_with_baseline(results: List[dict], baseline_path: str, tolerance: float) -> List[str]:
+    """与之前的结果对比，返回退化的项目（recall 下降超过 0.01，或 p50/p99 变慢超过 tolerance 比例）"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {(item["n_vectors"], item["config"]): item for item in json.load(f)["results"]}
+    regressions = []
+    for item in results:
+        old = baseline.get((item["n_vectors"], item["config"]))
+        if old is None:
+            continue
+        label = f"{item['n_vectors']} / {item['config']}"
+        if item["recall_at_k"] < old["recall_at_k"] - 0.01:
+            regressions.append(f"{label}: recall@k {old['recall_at_k']:.4f} -> {item['recall_at_k']:.4f}")
+        for key in ("p50_ms", "p99_ms"):
+            if item[key] > old[key] * (1 + tolerance):
+                regressions.append(f"{label}: {key} {old[key]:.3f} -> {item[key]:.3f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线检索基准（哈希 embedding，不调用 API）")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000],
+                        help="语料向量数，可指定多个（如 10000 100000 1000000）")
+    parser.add_argument("--dim", type=int, default=256, help="向量维度")
+    parser.add_argument("--queries", type=int, default=1000, help="查询条数")
+    parser.add_argument("--k", type=int, default=10, help="每条查询返回的结果数（recall@k）")
+    parser.add_argument("--configs", nargs="+", default=DEFAULT_CONFIGS,
+                        help="索引配置，格式为 索引类型[:nprobe=N][,ef_search=N]")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子，相同种子生成相同的语料和查询")
+    parser.add_argument("--work-dir", default=None, help="存放索引文件的目录（默认系统临时目录）")
+    parser.add_argument("--keep", action="store_true", help="保留生成的索引文件")
+    parser.add_argument("--output", help="结果 JSON 的保存路径")
+    parser.add_argument("--baseline", help="之前保存的结果 JSON，用于检查性能退化")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="延迟允许变慢的比例（默认 0.2）")
+    args = parser.parse_args()
+
+    configs = []
+    for spec in args.configs:
+        index_type, search_params = parse_config(spec)
+        configs.append((spec, index_type, search_params))
+
+    # 检索路径的向量化换成哈希 embedding，不调用 API
+    embedder = HashEmbedder(args.dim, args.seed)
+    retriever.vectorize_query = embedder.vectorize_query
+
+    results = []
+    for n in args.sizes:
+        results.extend(run_size(n, args, configs))
+
+    report = {
+        "benchmark": "retrieval",
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "faiss": getattr(faiss, "__version__", "unknown"),
+            "numpy": np.__version__,
+            "faiss_threads": faiss.omp_get_max_threads(),
+            "kb_index_mmap": Config.kb_index_mmap,
+        },
+        "settings": {"sizes": args.sizes, "dim": args.dim, "queries": args.queries, "k": args.k, "seed": args.seed},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到 {args.output}")
+
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.tolerance)
+        if regressions:
+            print("与基准结果相比出现退化：")
+            for message in regressions:
+                print(f"  - {message}")
+            sys.exit(1)
+        print("与基准结果相比没有退化")
+
+
+if __name__ == "__main__":
+    main()
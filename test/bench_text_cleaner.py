@@ -0,0 +1,83 @@
+"""
+文本清洗基准：对比旧版 clean_text（三次未预编译的 re.sub）与当前实现的处理速度（MB/s）
+
+同时校验两者输出一致，并测量对已清洗文本（CleanStr）再次调用 clean_text 的开销。
+默认读取 output/knowledge_base.txt；文本太小时重复拼接到 --min-mb 指定的大小，避免计时误差。
+
+使用方法:
+    python test/bench_text_cleaner.py [--file PATH] [--min-mb 8] [--repeat 3]
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+
+# 确保可以从项目根目录导入模块
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from ingest.text_cleaner import clean_text
+
+
+def legacy_clean_text(text):
+    """优化前的 clean_text，作为对照"""
+    if not text:
+        return ""
+    text = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]', '', text)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\.\.\.+', ' ', text)
+    return text.strip()
+
+
+def load_corpus(file_path: str, min_mb: float) -> str:
+    with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+        text = f.read()
+    if not text:
+        raise ValueError(f"基准文本 {file_path} 为空")
+    target = int(min_mb * 1024 * 1024)
+    size = len(text.encode("utf-8"))
+    if size < target:
+        text = "\n\n".join([text] * (target // size + 1))
+    return text
+
+
+def bench(name: str, func, text: str, mb: float, repeat: int):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{name}: 最快 {best * 1000:.1f}ms，{mb / best:.1f} MB/s（每 MB {best / mb * 1000:.2f}ms）")
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="clean_text 吞吐基准")
+    parser.add_argument("--file", default=os.path.join(PROJECT_ROOT, "output", "knowledge_base.txt"),
+                        help="基准文本路径（默认: output/knowledge_base.txt）")
+    parser.add_argument("--min-mb", type=float, default=8, help="文本不足时重复拼接到的最小大小（MB）")
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数，取最快一次")
+    args = parser.parse_args()
+
+    text = load_corpus(args.file, args.min_mb)
+    mb = len(text.encode("utf-8")) / (1024 * 1024)
+    print(f"基准文本: {args.file}，{mb:.2f} MB，{len(text)} 字符")
+
+    expected, legacy_seconds = bench("旧版 clean_text", legacy_clean_text, text, mb, args.repeat)
+    cleaned, seconds = bench("当前 clean_text", clean_text, text, mb, args.repeat)
+    if cleaned != expected:
+        print("错误: 当前实现与旧版输出不一致")
+        sys.exit(1)
+    print(f"输出一致，加速 {legacy_seconds / seconds:.2f}x")
+
+    # 已清洗的文本再次清洗（分块、向量化阶段）应当几乎没有开销
+    bench("已清洗文本再次 clean_text", clean_text, cleaned, mb, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
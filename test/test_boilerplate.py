@@ -0,0 +1,71 @@
+"""
+PDF 样板内容检测测试：ingest.boilerplate.strip_boilerplate 只删除目录页和页眉页脚，不能误删参数表
+
+器件手册的绝对最大额定值、电气特性表每行都是"参数名 + 空白 + 符号 + 空白 + 数值"，
+形式上与用空白作引导符的目录条目相同，只有点/省略号引导符才算目录条目。
+
+使用方法:
+    python test/test_boilerplate.py
+"""
+
+import os
+import sys
+
+# 确保可以从项目根目录导入模块
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from ingest.boilerplate import is_toc_page, strip_boilerplate
+
+RATINGS_PAGE = """Absolute Maximum Ratings
+Drain-Source Voltage  VDS  1200
+Gate-Source Voltage  VGS  25
+Continuous Drain Current  ID  36
+Pulsed Drain Current  IDM  80
+Power Dissipation  PD  208
+Operating Junction Temperature  TJ  175
+"""
+
+CHARACTERISTICS_PAGE = """Electrical Characteristics\tTJ = 25℃
+Gate Threshold Voltage\tVGS(th)\t2
+Zero Gate Voltage Drain Current\tIDSS\t1
+Input Capacitance\tCiss\t1890
+Output Capacitance\tCoss\t80
+Total Gate Charge\tQg\t62
+"""
+
+TOC_PAGE = """目录
+1 产品概述 ........................ 3
+2 绝对最大额定值 .................. 4
+3 电气特性 ........................ 5
+4 典型特性曲线 . . . . . . . . . . . 7
+5 封装尺寸 ………………………… 12
+6 订购信息 ·························· 14
+"""
+
+
+def test_ratings_table_is_not_toc():
+    assert not is_toc_page(RATINGS_PAGE)
+    assert not is_toc_page(CHARACTERISTICS_PAGE)
+
+
+def test_ratings_table_survives():
+    pages = [TOC_PAGE, RATINGS_PAGE, CHARACTERISTICS_PAGE]
+    result, stats = strip_boilerplate(pages)
+    assert stats["toc_pages"] == 1
+    assert result[0] == ""
+    for page, text in zip(pages[1:], result[1:]):
+        for line in page.splitlines():
+            assert line in text
+
+
+def test_dot_leader_toc():
+    assert is_toc_page(TOC_PAGE)
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"{name}: 通过")
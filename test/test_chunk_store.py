@@ -0,0 +1,74 @@
+"""
+元数据存储测试：旧格式元数据 JSON 转换为 SQLite 存储后行顺序和 id 不变（第 pos 行对应索引中的第 pos 个向量），
+转换后删除 JSON，已有存储时不再转换
+
+使用方法:
+    python test/test_chunk_store.py
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+# 确保可以从项目根目录导入模块
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from kb.chunk_store import ChunkStore, iter_metadata, legacy_path_for, migrate_legacy_metadata
+
+# 超过一个 SQL 批次（500 行），id 故意不按字典序排列；旧数据中可能没有 source 字段
+LEGACY = [{"id": f"chunk-{(i * 7919) % 1200}", "chunk": f"第 {i} 个分块：栅氧可靠性", "method": "semantic",
+           "source": f"doc{i % 3}.pdf"} for i in range(1200)]
+LEGACY[5].pop("source")
+
+
+def _write_legacy(store_path: str):
+    with open(legacy_path_for(store_path), "w", encoding="utf-8") as f:
+        json.dump(LEGACY, f, ensure_ascii=False, indent=4)
+
+
+def test_migrate_preserves_order_and_ids():
+    tmp = tempfile.mkdtemp()
+    try:
+        store_path = os.path.join(tmp, "semantic_chunk_metadata.sqlite")
+        _write_legacy(store_path)
+        assert migrate_legacy_metadata(store_path)
+        assert not os.path.exists(legacy_path_for(store_path))
+        assert list(iter_metadata(store_path)) == LEGACY
+
+        store = ChunkStore(store_path)
+        try:
+            assert len(store) == len(LEGACY)
+            assert store[1199] == LEGACY[1199]
+            assert store.get_many([700, 5, 0, 1200]) == [LEGACY[700], LEGACY[5], LEGACY[0], None]
+        finally:
+            store.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def test_existing_store_not_overwritten():
+    tmp = tempfile.mkdtemp()
+    try:
+        store_path = os.path.join(tmp, "semantic_chunk_metadata.sqlite")
+        _write_legacy(store_path)
+        assert migrate_legacy_metadata(store_path)
+        # 存储已存在时残留的 JSON 不再转换
+        _write_legacy(store_path)
+        assert not migrate_legacy_metadata(store_path)
+        assert os.path.exists(legacy_path_for(store_path))
+        # 没有旧 JSON、或传入的就是 JSON 路径时什么都不做
+        assert not migrate_legacy_metadata(os.path.join(tmp, "other.sqlite"))
+        assert not migrate_legacy_metadata(legacy_path_for(store_path))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"{name}: 通过")
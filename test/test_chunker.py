@@ -0,0 +1,77 @@
+"""
+分块测试：按 token 打包（semantic_chunk 传入 token_size）时，相邻分块之间只重叠一次
+
+分段时如果已经带上 chunk_overlap 的重叠，再把相邻分段打包进同一个分块，重叠文本会在分块内部重复出现。
+测试用按空格计词的计数器代替分词器，不依赖 tiktoken / transformers。
+
+使用方法:
+    python test/test_chunker.py
+"""
+
+import os
+import re
+import sys
+import logging
+from typing import List
+
+# 确保可以从项目根目录导入模块
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from ingest.chunker import semantic_chunk, semantic_chunk_stream
+
+CHUNK_OVERLAP = 20
+TOKEN_SIZE = 300
+# 每句话末尾带编号，分块末尾的重叠片段在全文中唯一
+TEXT = " ".join(f"Sentence {i} covers gate oxide reliability of device {i}." for i in range(400))
+
+
+class WordCounter:
+    """按空格计词的 token 计数器，接口与 ingest.token_counter.TokenCounter 一致"""
+
+    def count(self, text: str) -> int:
+        return len(text.split())
+
+    def split(self, text: str, max_tokens: int) -> List[str]:
+        words = text.split()
+        return [" ".join(words[i:i + max_tokens]) for i in range(0, len(words), max_tokens)]
+
+
+def _chunks() -> List[str]:
+    return [item["chunk"] for item in semantic_chunk(TEXT, chunk_overlap=CHUNK_OVERLAP, token_size=TOKEN_SIZE,
+                                                     counter=WordCounter())]
+
+
+def test_overlap_appears_once():
+    chunks = _chunks()
+    assert len(chunks) > 3
+    for previous, chunk in zip(chunks, chunks[1:]):
+        overlap = previous[-CHUNK_OVERLAP:].lstrip()
+        assert chunk.startswith(overlap)
+        assert chunk.count(overlap) == 1, chunk
+    for chunk in chunks:
+        numbers = re.findall(r"Sentence (\d+) ", chunk)
+        assert len(numbers) == len(set(numbers)), chunk
+
+
+def test_token_budget_and_coverage():
+    chunks = _chunks()
+    assert max(WordCounter().count(chunk) for chunk in chunks) <= TOKEN_SIZE
+    numbers = [int(n) for chunk in chunks for n in re.findall(r"Sentence (\d+) ", chunk)]
+    assert sorted(set(numbers)) == list(range(400))
+
+
+def test_stream_matches():
+    pieces = [TEXT[i:i + 700] for i in range(0, len(TEXT), 700)]
+    streamed = [item["chunk"] for item in semantic_chunk_stream(pieces, chunk_overlap=CHUNK_OVERLAP,
+                                                                token_size=TOKEN_SIZE, counter=WordCounter())]
+    assert streamed == _chunks()
+
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"{name}: 通过")
@@ -0,0 +1,69 @@
+"""
+去重依赖测试：被去重丢弃的分块记录它重复的来源文件，来源文件被替换时依赖它的文件要重新入库
+
+文件 B 的分块与已入库文件 A 的分块重复而被丢弃后，A 被替换时 B 的这部分内容在索引中就不存在了，
+所以 B 要随 A 一起重新入库（依赖关系可以传递）。
+
+使用方法:
+    python test/test_dedup.py
+"""
+
+import os
+import sys
+
+# 确保可以从项目根目录导入模块
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from ingest.dedup import ChunkDeduplicator
+from kb.kb_manifest import find_dedup_dependents
+
+SHARED = "绝对最大额定值：漏源电压 1200V，栅源电压 -10V 至 +25V，结温 -55℃ 至 175℃。超过上述额定值可能导致器件永久损坏。"
+UNIQUE_A = "A 型器件的导通电阻为 80mΩ，适用于车载充电机和光伏逆变器，封装为 TO-247-4。" * 2
+UNIQUE_B = "B 型器件的栅极电荷为 62nC，开关损耗较低，推荐驱动电压为 +18V/-3V，封装为 D2PAK-7。" * 2
+
+
+def test_references_to_seeded_source():
+    dedup = ChunkDeduplicator()
+    dedup.seed([(SHARED, "a.txt"), (UNIQUE_A, "a.txt")])
+    kept = dedup.filter([SHARED, UNIQUE_B], "b.txt")
+    assert kept == [UNIQUE_B]
+    assert dedup.dropped == 1
+    assert dedup.references == {"b.txt": {"a.txt"}}
+
+
+def test_near_duplicate_reference():
+    dedup = ChunkDeduplicator()
+    text = SHARED * 4
+    dedup.filter([text], "a.txt")
+    assert dedup.filter([text[:-5] + "使器件永久失效。"], "b.txt") == []
+    assert dedup.references == {"b.txt": {"a.txt"}}
+
+
+def test_same_file_repeat_is_not_a_reference():
+    dedup = ChunkDeduplicator()
+    assert dedup.filter([SHARED, UNIQUE_A, SHARED], "a.txt") == [SHARED, UNIQUE_A]
+    assert dedup.references == {}
+    assert dedup.is_duplicate(SHARED)
+
+
+def test_dependents_of_replaced_file():
+    manifest = {
+        "a.txt": {"sha256": "1"},
+        "b.txt": {"sha256": "2", "dedup_refs": ["a.txt"]},
+        "c.txt": {"sha256": "3", "dedup_refs": ["b.txt"]},
+        "d.txt": {"sha256": "4", "dedup_refs": []},
+    }
+    assert find_dedup_dependents(manifest, {"a.txt"}) == ["b.txt", "c.txt"]
+    assert find_dedup_dependents(manifest, {"d.txt"}) == []
+    # 依赖的文件不在清单中（同批入库时失败）也要重新入库
+    manifest["e.txt"] = {"sha256": "5", "dedup_refs": ["missing.txt"]}
+    assert find_dedup_dependents(manifest, set()) == ["e.txt"]
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"{name}: 通过")
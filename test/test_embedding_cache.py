@@ -0,0 +1,108 @@
+"""
+embedding 缓存测试：向量写入后重新打开数据库仍能原样取回；超过容量上限时淘汰最久未访问的条目，
+断点文件（open_checkpoint）不做淘汰
+
+使用方法:
+    python test/test_embedding_cache.py
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# 确保可以从项目根目录导入模块
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from llm.embedding_cache import EmbeddingCache, open_checkpoint
+
+DIM = 4
+# 每个向量 DIM 个 float32
+VECTOR_BYTES = DIM * 4
+
+
+def _items(n: int, start: int = 0):
+    rng = np.random.default_rng(start)
+    return [(EmbeddingCache.make_key(f"分块 {i}", "test-model", DIM), rng.standard_normal(DIM).astype(np.float32))
+            for i in range(start, start + n)]
+
+
+def test_round_trip_after_reopen():
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, "cache", "embeddings.sqlite")
+        items = _items(600)
+        cache = EmbeddingCache(path, max_bytes=0)
+        cache.put_many(items)
+        cache.close()
+
+        cache = EmbeddingCache(path, max_bytes=0)
+        found = cache.get_many([key for key, _ in items] + [b"missing"])
+        assert len(found) == len(items)
+        for key, vector in items:
+            assert found[key].dtype == np.float32
+            assert np.array_equal(found[key], vector)
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"]) == (600, 1)
+        assert stats["size_mb"] * 1024 * 1024 == 600 * VECTOR_BYTES
+        # 相同的键覆盖写入不重复计算容量
+        cache.put_many(items[:10])
+        assert cache.stats()["size_mb"] * 1024 * 1024 == 600 * VECTOR_BYTES
+        cache.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def test_key_includes_model_and_dimensions():
+    key = EmbeddingCache.make_key("分块", "model-a", 1024)
+    assert key != EmbeddingCache.make_key("分块", "model-b", 1024)
+    assert key != EmbeddingCache.make_key("分块", "model-a", 512)
+
+
+def test_evict_least_recently_accessed():
+    tmp = tempfile.mkdtemp()
+    try:
+        # 容量 10 个向量，超过后淘汰到 90%（9 个）
+        cache = EmbeddingCache(os.path.join(tmp, "embeddings.sqlite"), max_bytes=10 * VECTOR_BYTES)
+        items = _items(10)
+        for item in items:
+            cache.put_many([item])
+            time.sleep(0.005)
+        # 访问最早写入的条目，它不再是最久未访问的
+        cache.get_many([items[0][0]])
+        time.sleep(0.005)
+        extra = _items(1, start=10)
+        cache.put_many(extra)
+
+        found = cache.get_many([key for key, _ in items + extra])
+        assert set(found) == {key for key, _ in [items[0]] + items[3:] + extra}
+        assert cache.stats()["size_mb"] * 1024 * 1024 == 9 * VECTOR_BYTES
+        cache.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def test_checkpoint_never_evicts():
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, "job.embeddings.sqlite")
+        checkpoint = open_checkpoint(path)
+        items = _items(1000)
+        checkpoint.put_many(items)
+        assert len(checkpoint.get_many([key for key, _ in items])) == 1000
+        checkpoint.destroy()
+        assert not os.path.exists(path)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"{name}: 通过")
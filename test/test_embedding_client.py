@@ -0,0 +1,136 @@
+"""
+embedding 请求重试测试：只有限流、超时、连接错误和 5xx 才重试，其他 4xx 立即抛出；
+服务端以 400 拒绝 base64 响应格式时该服务改用 float，之后的请求不再尝试 base64
+
+用假的客户端（embeddings.create 按预设顺序抛出 openai 异常或返回结果）代替 OpenAI，不需要网络。
+
+使用方法:
+    python test/test_embedding_client.py
+"""
+
+import base64
+import os
+import sys
+from types import SimpleNamespace
+
+import httpx
+import numpy as np
+import openai
+
+# 确保可以从项目根目录导入模块
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import llm.embedding_client as embedding_client
+from config.configs import Config
+
+DIM = 4
+BATCH = ["碳化硅 MOSFET", "氮化镓 HEMT"]
+
+
+def _status_error(cls, status: int, message: str):
+    request = httpx.Request("POST", "https://embedding.test/v1/embeddings")
+    return cls(message, response=httpx.Response(status, request=request), body=None)
+
+
+class _FakeClient:
+    """按顺序抛出 outcomes 中的异常，用完后返回向量；记录每次请求的 encoding_format"""
+
+    def __init__(self, outcomes=(), base_url="https://embedding.test/v1/", reject_base64=False):
+        self.outcomes = list(outcomes)
+        self.base_url = base_url
+        self.reject_base64 = reject_base64
+        self.formats = []
+        self.embeddings = SimpleNamespace(create=self.create)
+
+    def create(self, model, input, dimensions, encoding_format):
+        self.formats.append(encoding_format)
+        if self.reject_base64 and encoding_format == "base64":
+            raise _status_error(openai.BadRequestError, 400, "Invalid value for 'encoding_format': base64")
+        if self.outcomes:
+            raise self.outcomes.pop(0)
+        data = []
+        for i in range(len(input)):
+            row = np.full(DIM, i, dtype="<f4")
+            raw = base64.b64encode(row.tobytes()).decode() if encoding_format == "base64" else row.tolist()
+            data.append(SimpleNamespace(embedding=raw, index=i))
+        return SimpleNamespace(data=data)
+
+
+class _Settings:
+    """缩短退避时间，清空已记录的响应格式"""
+
+    def __enter__(self):
+        self.saved = (Config.embedding_retry_backoff, Config.embedding_max_retries, Config.embedding_encoding_format)
+        Config.embedding_retry_backoff = 0.001
+        Config.embedding_max_retries = 3
+        Config.embedding_encoding_format = "base64"
+        embedding_client._encoding_formats.clear()
+
+    def __exit__(self, *exc):
+        Config.embedding_retry_backoff, Config.embedding_max_retries, Config.embedding_encoding_format = self.saved
+        embedding_client._encoding_formats.clear()
+
+
+def test_retry_transient_errors():
+    request = httpx.Request("POST", "https://embedding.test/v1/embeddings")
+    with _Settings():
+        client = _FakeClient([
+            _status_error(openai.RateLimitError, 429, "rate limited"),
+            openai.APITimeoutError(request),
+            _status_error(openai.InternalServerError, 503, "unavailable"),
+        ])
+        vectors = embedding_client._embed_batch(client, "test-model", BATCH)
+        assert vectors.shape == (2, DIM)
+        assert len(client.formats) == 4
+
+
+def test_retries_exhausted():
+    with _Settings():
+        client = _FakeClient([_status_error(openai.RateLimitError, 429, "rate limited")] * 10)
+        try:
+            embedding_client._embed_batch(client, "test-model", BATCH)
+            raise AssertionError("重试用尽后应抛出异常")
+        except openai.RateLimitError:
+            pass
+        assert len(client.formats) == Config.embedding_max_retries + 1
+
+
+def test_client_errors_not_retried():
+    with _Settings():
+        for error in (_status_error(openai.BadRequestError, 400, "input is too long"),
+                      _status_error(openai.AuthenticationError, 401, "invalid api key"),
+                      ValueError("API 返回 1 个向量，期望 2 个")):
+            client = _FakeClient([error])
+            try:
+                embedding_client._embed_batch(client, "test-model", BATCH)
+                raise AssertionError("不可重试的错误应立即抛出")
+            except type(error):
+                pass
+            assert len(client.formats) == 1
+        # 与响应格式无关的 400 不会让服务改用 float
+        assert embedding_client._encoding_formats == {}
+
+
+def test_base64_fallback_per_service():
+    with _Settings():
+        plain = _FakeClient(base_url="https://plain.test/v1/", reject_base64=True)
+        vectors = embedding_client._embed_batch(plain, "test-model", BATCH)
+        assert np.array_equal(vectors[1], np.ones(DIM, dtype=np.float32))
+        assert plain.formats == ["base64", "float"]
+        # 同一服务地址的新客户端直接使用 float
+        again = _FakeClient(base_url="https://plain.test/v1/", reject_base64=True)
+        embedding_client._embed_batch(again, "test-model", BATCH)
+        assert again.formats == ["float"]
+        # 其他服务仍使用 base64
+        other = _FakeClient(base_url="https://other.test/v1/")
+        embedding_client._embed_batch(other, "test-model", BATCH)
+        assert other.formats == ["base64"]
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"{name}: 通过")
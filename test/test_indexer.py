@@ -0,0 +1,153 @@
+"""
+增量建索引测试：替换文件时从索引中删除旧向量后追加，不重新训练；需要重建时从原始向量重建
+
+用随机单位向量代替 embedding，检查：
+- 删除/追加后索引中第 i 个向量仍对应元数据第 i 行（元数据行号即向量 id）
+- IVF 索引替换文件后沿用原来的聚类中心
+- 索引类型变化、nlist 相差过大时从原始向量文件重建，IVF-PQ 改为 flat 后得到的是原始向量而不是解码后的近似向量
+
+使用方法:
+    python test/test_indexer.py
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+
+import faiss
+import numpy as np
+
+# 确保可以从项目根目录导入模块
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from config.configs import Config
+from kb.chunk_store import iter_metadata
+from kb.index_params import read_index_params
+from rag.indexer import build_index_from_vectors, vectors_path_for
+
+DIM = 16
+
+
+class _Workspace:
+    """临时知识库目录；记录每个分块 id 对应的向量，用于检查索引与元数据是否逐行对应"""
+
+    def __init__(self, index_type: str):
+        self.dir = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.dir, "semantic_chunk.index")
+        self.metadata_path = os.path.join(self.dir, "semantic_chunk_metadata.sqlite")
+        self.vectors = {}
+        self.rng = np.random.default_rng(0)
+        self.saved_type = Config.index_type
+        Config.index_type = index_type
+
+    def close(self):
+        Config.index_type = self.saved_type
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def add(self, sources, append=True, replace=()):
+        vectors, metadata = [], []
+        for source, n in sources.items():
+            block = self.rng.standard_normal((n, DIM)).astype(np.float32)
+            block /= np.linalg.norm(block, axis=1, keepdims=True)
+            for i, vector in enumerate(block):
+                chunk_id = f"{source}-{len(self.vectors)}-{i}"
+                self.vectors[chunk_id] = vector
+                metadata.append({"id": chunk_id, "chunk": chunk_id, "method": "test", "source": source})
+            vectors.append(block)
+        return build_index_from_vectors(np.vstack(vectors), metadata, self.index_path, self.metadata_path,
+                                        append=append, replace_sources=set(replace))
+
+    def check(self, exact_search=True):
+        index = faiss.read_index(self.index_path)
+        originals = np.load(vectors_path_for(self.index_path))
+        expected = np.vstack([self.vectors[meta["id"]] for meta in iter_metadata(self.metadata_path)])
+        assert index.ntotal == len(expected)
+        assert np.array_equal(originals, expected)
+        if exact_search:
+            try:
+                ivf = faiss.extract_index_ivf(index)
+                ivf.nprobe = ivf.nlist
+            except RuntimeError:
+                pass
+            if hasattr(index, "hnsw"):
+                index.hnsw.efSearch = 256
+            _, ids = index.search(expected, 1)
+            assert (ids[:, 0] == np.arange(len(expected))).mean() > 0.99
+        return index
+
+
+def test_flat_replace():
+    ws = _Workspace("flat")
+    try:
+        ws.add({"a.txt": 100, "b.txt": 100, "c.txt": 50}, append=False)
+        assert ws.add({"b.txt": 30}, replace={"b.txt"}) == 180
+        sources = [meta["source"] for meta in iter_metadata(ws.metadata_path)]
+        assert sources == ["a.txt"] * 100 + ["c.txt"] * 50 + ["b.txt"] * 30
+        ws.check()
+    finally:
+        ws.close()
+
+
+def test_ivf_replace_keeps_centroids():
+    ws = _Workspace("ivf_flat")
+    try:
+        ws.add({"a.txt": 3000, "b.txt": 1000}, append=False)
+        before = faiss.read_index(ws.index_path)
+        nlist = faiss.extract_index_ivf(before).nlist
+        centroids = faiss.extract_index_ivf(before).quantizer.reconstruct_n(0, nlist)
+        ws.add({"a.txt": 2500, "c.txt": 500}, replace={"a.txt"})
+        after = ws.check()
+        assert faiss.extract_index_ivf(after).nlist == nlist
+        assert np.array_equal(faiss.extract_index_ivf(after).quantizer.reconstruct_n(0, nlist), centroids)
+    finally:
+        ws.close()
+
+
+def test_ivf_rebuild_when_nlist_drifts():
+    ws = _Workspace("ivf_flat")
+    try:
+        ws.add({"a.txt": 2000}, append=False)
+        nlist = read_index_params(ws.index_path)["nlist"]
+        ws.add({"b.txt": 20000})
+        assert read_index_params(ws.index_path)["nlist"] > nlist * Config.index_rebuild_nlist_ratio
+        ws.check()
+    finally:
+        ws.close()
+
+
+def test_hnsw_replace():
+    ws = _Workspace("hnsw")
+    try:
+        ws.add({"a.txt": 500, "b.txt": 500}, append=False)
+        ws.add({"a.txt": 200}, replace={"a.txt"})
+        ws.check()
+    finally:
+        ws.close()
+
+
+def test_type_change_uses_original_vectors():
+    ws = _Workspace("ivf_pq")
+    try:
+        ws.add({"a.txt": 10000}, append=False)
+        assert read_index_params(ws.index_path)["type"] == "ivf_pq"
+        ws.add({"b.txt": 100})
+        assert read_index_params(ws.index_path)["type"] == "ivf_pq"
+        ws.check(exact_search=False)
+        Config.index_type = "flat"
+        ws.add({"c.txt": 100})
+        index = ws.check()
+        assert read_index_params(ws.index_path)["type"] == "flat"
+        # flat 索引中存的是原始向量，不是 PQ 解码后的近似向量
+        assert np.array_equal(index.reconstruct_n(0, index.ntotal), np.load(vectors_path_for(ws.index_path)))
+    finally:
+        ws.close()
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"{name}: 通过")
@@ -0,0 +1,150 @@
+"""
+入库流水线测试：分块全部与知识库已有内容重复的文件记为已入库（分块数为 0），索引不需要重写；
+多进程分块与串行分块结果一致；阶段吞吐按墙钟时间计算
+
+用按文本哈希生成的确定性向量代替 embedding API（替换 ingest.ingest_pipeline.vectorize_query），不需要网络。
+
+使用方法:
+    python test/test_ingest_pipeline.py
+"""
+
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+# 确保可以从项目根目录导入模块
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import ingest.ingest_pipeline as ingest_pipeline
+from ingest.ingest_pipeline import IngestPipeline, StageStats
+from kb.chunk_store import read_metadata_sources
+
+DIM = 32
+TEXT = "\n\n".join(f"第 {i} 段：碳化硅 MOSFET 在 {150 + i}℃ 高温栅偏试验后阈值电压漂移 {i * 0.01:.2f}V，"
+                   f"测试条件编号 {i * 7}。" for i in range(120))
+
+
+def _hash_vectors(texts, checkpoint=None):
+    vectors = []
+    for text in texts:
+        seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+        vector = np.random.default_rng(seed).standard_normal(DIM).astype(np.float32)
+        vectors.append(vector / np.linalg.norm(vector))
+    return np.vstack(vectors)
+
+
+class _KB:
+    """临时知识库目录和源文件目录"""
+
+    def __init__(self):
+        self.dir = tempfile.mkdtemp()
+        self.kb_dir = os.path.join(self.dir, "kb")
+        self.src_dir = os.path.join(self.dir, "src")
+        os.makedirs(self.kb_dir)
+        os.makedirs(self.src_dir)
+        self.index_path = os.path.join(self.kb_dir, "semantic_chunk.index")
+        self.metadata_path = os.path.join(self.kb_dir, "semantic_chunk_metadata.sqlite")
+        self.saved_vectorize = ingest_pipeline.vectorize_query
+        ingest_pipeline.vectorize_query = _hash_vectors
+
+    def close(self):
+        ingest_pipeline.vectorize_query = self.saved_vectorize
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def write(self, name: str, text: str) -> str:
+        path = os.path.join(self.src_dir, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def run(self, paths, append=True, replace_sources=(), chunk_workers=1, dedup=True):
+        pipeline = IngestPipeline(self.kb_dir, self.index_path, self.metadata_path,
+                                  parse_workers=1, chunk_workers=chunk_workers, dedup=dedup)
+        return pipeline.run(paths, append=append, replace_sources=replace_sources)
+
+
+def test_all_duplicate_file_is_indexed():
+    kb = _KB()
+    try:
+        a = kb.write("a.txt", TEXT)
+        first = kb.run([a], append=False)
+        n_vectors = first["num_vectors"]
+        assert first["indexed_files"][a] == n_vectors > 0
+        index_mtime = os.stat(kb.index_path).st_mtime_ns
+
+        b = kb.write("b.txt", TEXT)
+        result = kb.run([b])
+        assert result["indexed_files"] == {b: 0}
+        assert result["dedup_refs"] == {b: ["a.txt"]}
+        assert result["num_chunks"] == 0
+        assert result["num_vectors"] == n_vectors
+        assert not result["errors"]
+        # 没有新向量时索引不重写
+        assert os.stat(kb.index_path).st_mtime_ns == index_mtime
+    finally:
+        kb.close()
+
+
+def test_replaced_file_now_all_duplicate():
+    # 文件内容变为与其他文件完全重复时，没有新向量，但它的旧分块仍要从索引中删除
+    kb = _KB()
+    try:
+        a = kb.write("a.txt", TEXT)
+        b = kb.write("b.txt", TEXT.replace("碳化硅", "氮化镓"))
+        kb.run([a, b], append=False)
+        n_a = read_metadata_sources(kb.metadata_path).count("a.txt")
+
+        b = kb.write("b.txt", TEXT)
+        result = kb.run([b], replace_sources={"b.txt"})
+        assert result["indexed_files"] == {b: 0}
+        assert read_metadata_sources(kb.metadata_path) == ["a.txt"] * n_a
+        assert result["num_vectors"] == n_a
+    finally:
+        kb.close()
+
+
+def test_chunk_process_pool():
+    # 多进程分块（spawn 启动的子进程）与串行分块结果一致；文件完成顺序不固定，关闭去重后比较
+    kb = _KB()
+    try:
+        paths = [kb.write(f"f{i}.txt", TEXT.replace("碳化硅", f"器件{i}")) for i in range(3)]
+        serial = kb.run(paths, append=False, dedup=False)
+        parallel = kb.run(paths, append=False, chunk_workers=2, dedup=False)
+        assert not parallel["errors"]
+        assert parallel["indexed_files"] == serial["indexed_files"]
+    finally:
+        kb.close()
+
+
+def test_stage_rate_uses_wall_clock():
+    # 4 个工作线程并行各处理 0.2s：吞吐按墙钟时间（约 0.2s）计算，而不是累计的 0.8s
+    stats = StageStats("解析", "files")
+
+    def work():
+        start = time.perf_counter()
+        time.sleep(0.2)
+        stats.record(1, time.perf_counter() - start)
+
+    workers = [threading.Thread(target=work) for _ in range(4)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    assert stats.busy_seconds >= 0.8
+    assert 0.2 <= stats.wall_seconds < 0.5
+    assert stats.rate > 8
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"{name}: 通过")
@@ -0,0 +1,123 @@
+"""
+知识库句柄缓存测试：文件不变时复用已加载的索引和元数据；入库任务发布新版本（os.replace）后，
+即使文件大小和 mtime 不变（inode 变化）也会重新加载；索引与元数据条数不一致时不缓存
+
+使用方法:
+    python test/test_kb_cache.py
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+import faiss
+import numpy as np
+
+# 确保可以从项目根目录导入模块
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from kb.chunk_store import write_metadata
+from kb.kb_cache import KBHandleCache
+
+DIM = 8
+
+
+class _KB:
+    """临时知识库目录，publish 按入库任务的方式先写临时文件再替换"""
+
+    def __init__(self):
+        self.dir = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.dir, "semantic_chunk.index")
+        self.metadata_path = os.path.join(self.dir, "semantic_chunk_metadata.sqlite")
+        self.rng = np.random.default_rng(0)
+
+    def close(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def publish(self, n: int, tag: str, n_metadata: int = None):
+        index = faiss.IndexFlatIP(DIM)
+        index.add(self.rng.standard_normal((n, DIM)).astype(np.float32))
+        faiss.write_index(index, self.index_path + ".tmp")
+        rows = [{"id": f"{tag}-{i}", "chunk": f"{tag} 分块 {i}", "method": "test", "source": f"{tag}.txt"}
+                for i in range(n if n_metadata is None else n_metadata)]
+        write_metadata(self.metadata_path + ".tmp", rows)
+        os.replace(self.metadata_path + ".tmp", self.metadata_path)
+        os.replace(self.index_path + ".tmp", self.index_path)
+
+
+def test_reuse_until_replaced():
+    kb = _KB()
+    try:
+        cache = KBHandleCache(max_bytes=1 << 30)
+        kb.publish(10, "v1")
+        first = cache.get(kb.index_path, kb.metadata_path)
+        assert cache.get(kb.index_path, kb.metadata_path) is first
+        assert first.get_chunks([0])[0]["id"] == "v1-0"
+
+        kb.publish(20, "v2")
+        second = cache.get(kb.index_path, kb.metadata_path)
+        assert second is not first
+        assert second.index.ntotal == 20
+        assert second.get_chunks([19])[0]["id"] == "v2-19"
+        assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+    finally:
+        kb.close()
+
+
+def test_reload_when_only_inode_changes():
+    # 同样条数的新版本文件大小相同，mtime 也可能相同，靠 inode 识别
+    kb = _KB()
+    try:
+        cache = KBHandleCache(max_bytes=1 << 30)
+        kb.publish(10, "v1")
+        first = cache.get(kb.index_path, kb.metadata_path)
+        stats = {path: os.stat(path) for path in (kb.index_path, kb.metadata_path)}
+        kb.publish(10, "v2")
+        for path, stat in stats.items():
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            assert os.path.getsize(path) == stat.st_size
+        second = cache.get(kb.index_path, kb.metadata_path)
+        assert second is not first
+        assert second.get_chunks([0])[0]["id"] == "v2-0"
+    finally:
+        kb.close()
+
+
+def test_inconsistent_version_not_cached():
+    kb = _KB()
+    try:
+        cache = KBHandleCache(max_bytes=1 << 30)
+        kb.publish(10, "v1", n_metadata=9)
+        first = cache.get(kb.index_path, kb.metadata_path)
+        assert not first.consistent
+        assert cache.get(kb.index_path, kb.metadata_path) is not first
+        assert cache.stats()["kbs"] == 0
+    finally:
+        kb.close()
+
+
+def test_missing_files_drop_cached_handle():
+    kb = _KB()
+    try:
+        cache = KBHandleCache(max_bytes=1 << 30)
+        kb.publish(10, "v1")
+        cache.get(kb.index_path, kb.metadata_path)
+        os.remove(kb.index_path)
+        try:
+            cache.get(kb.index_path, kb.metadata_path)
+            raise AssertionError("索引文件不存在时应抛出 FileNotFoundError")
+        except FileNotFoundError:
+            pass
+        assert cache.stats()["kbs"] == 0
+    finally:
+        kb.close()
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"{name}: 通过")
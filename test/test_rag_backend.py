@@ -220,8 +220,8 @@ def test_vectorize_and_index(kb_name: str = DEFAULT_KB):
 
     # 向量化
     print("\n开始向量化分块...")
-    vectorize_file(all_chunks, semantic_chunk_vector)
-    print(f"向量化结果已保存到: {semantic_chunk_vector}")
+    valid_chunks, vectors = vectorize_file(all_chunks, semantic_chunk_vector)
+    print(f"向量化结果已保存到: {semantic_chunk_vector}（向量见同名 .npy 文件），向量矩阵形状: {vectors.shape}")
 
     # 构建索引
     print("\n开始基于向量文件构建索引...")
@@ -0,0 +1,82 @@
+"""
+TXT 解码测试：ingest.text_loader.read_text_file 对各种编码组合的文件能否正确解码
+
+重点覆盖开头 64KB 样本是合法 UTF-8（纯 ASCII）、后面才出现 GBK 中文的文件：
+样本判断为 UTF-8，整个文件解码失败后必须重新检测编码，而不是退回忽略非法字符；
+流式读取（iter_text_file）时从出错位置开始改用重新检测的编码。
+
+使用方法:
+    python test/test_text_loader.py
+"""
+
+import os
+import sys
+import tempfile
+
+# 确保可以从项目根目录导入模块
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from config.configs import Config
+from ingest.text_loader import iter_text_file, read_text_file
+
+CHINESE = "碳化硅MOSFET的栅氧可靠性与阈值电压漂移密切相关，高温栅偏试验是常用的评估手段。\n" * 200
+
+
+def _roundtrip(data: bytes, stream: bool = False) -> str:
+    with tempfile.NamedTemporaryFile(suffix=".txt", delete=False) as f:
+        f.write(data)
+        path = f.name
+    try:
+        if stream:
+            # 块比样本小，出错位置落在中间的某一块，且多字节字符会跨块
+            return "".join(iter_text_file(path, block_size=4093))
+        return read_text_file(path)
+    finally:
+        os.remove(path)
+
+
+def test_ascii_header_then_gbk():
+    header = "ASCII header line for the export.\n" * (Config.encoding_sample_bytes // 34 + 100)
+    assert len(header) > Config.encoding_sample_bytes
+    text = header + CHINESE
+    assert _roundtrip(text.encode("gbk")) == text
+
+
+def test_stream_ascii_header_then_gbk():
+    header = "ASCII header line for the export.\n" * (Config.encoding_sample_bytes // 34 + 100)
+    text = header + CHINESE
+    assert _roundtrip(text.encode("gbk"), stream=True) == text
+
+
+def test_stream_utf8():
+    assert _roundtrip(CHINESE.encode("utf-8"), stream=True) == CHINESE
+
+
+def test_utf8():
+    assert _roundtrip(CHINESE.encode("utf-8")) == CHINESE
+
+
+def test_gbk():
+    assert _roundtrip(CHINESE.encode("gbk")) == CHINESE
+
+
+def test_utf8_with_corrupt_byte():
+    # 个别损坏的字节只丢掉该字节，其余内容保持 UTF-8 解码
+    header = "a" * (Config.encoding_sample_bytes + 10)
+    text = _roundtrip(header.encode("utf-8") + b"\xff" + CHINESE.encode("utf-8"))
+    assert text == header + CHINESE
+
+
+def test_stream_utf8_with_corrupt_byte():
+    header = "a" * (Config.encoding_sample_bytes + 10)
+    text = _roundtrip(header.encode("utf-8") + b"\xff" + CHINESE.encode("utf-8"), stream=True)
+    assert text == header + CHINESE
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"{name}: 通过")
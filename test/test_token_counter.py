@@ -0,0 +1,64 @@
+"""
+token 切分测试：TokenCounter.split（tiktoken）只在字符边界处切分，中文不会被切成 U+FFFD
+
+中文字符通常占多个 token，直接 decode 任意一段 token 会把字符切成两半。
+测试用逐字节编码的 tiktoken.Encoding（每个 UTF-8 字节一个 token，另加一个只覆盖半个汉字的合并），
+不需要下载 cl100k_base。
+
+使用方法:
+    python test/test_token_counter.py
+"""
+
+import os
+import sys
+
+# 确保可以从项目根目录导入模块
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import tiktoken
+
+from ingest.token_counter import TokenCounter
+
+TEXT = "碳化硅MOSFET的栅氧可靠性与阈值电压漂移密切相关，高温栅偏（HTGB）试验是常用的评估手段。\n" * 20
+
+
+def _byte_counter() -> TokenCounter:
+    ranks = {bytes([i]): i for i in range(256)}
+    ranks["碳".encode("utf-8")[:2]] = 256
+    encoding = tiktoken.Encoding("test_bytes", pat_str=r"\S+|\s+", mergeable_ranks=ranks, special_tokens={})
+    counter = TokenCounter.__new__(TokenCounter)
+    counter.backend = "tiktoken"
+    counter.name = "test_bytes"
+    counter._encoding = encoding
+    return counter
+
+
+def test_cjk_round_trip():
+    counter = _byte_counter()
+    for max_tokens in (1, 2, 5, 7, 64, 100):
+        pieces = counter.split(TEXT, max_tokens)
+        assert len(pieces) > 1
+        assert "".join(pieces) == TEXT
+        assert not any("�" in piece for piece in pieces)
+
+
+def test_piece_token_limit():
+    counter = _byte_counter()
+    for max_tokens in (5, 7, 64):
+        assert all(counter.count(piece) <= max_tokens for piece in counter.split(TEXT, max_tokens))
+
+
+def test_truncate():
+    counter = _byte_counter()
+    head = counter.truncate(TEXT, 10)
+    assert TEXT.startswith(head)
+    assert 0 < counter.count(head) <= 10
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"{name}: 通过")
@@ -1,9 +1,11 @@
 import gradio as gr
 import os
+import time
+from config.configs import Config
 from kb.kb_config import KB_BASE_DIR,DEFAULT_KB
 from kb.kb_manager import get_knowledge_bases,create_knowledge_base,delete_knowledge_base,\
     get_kb_files
-from ingest.ingest_service import batch_upload_to_kb
+from ingest.ingest_jobs import get_job_manager
 from rag.streaming_handler import process_question_with_reasoning
 
 
@@ -402,14 +404,27 @@ with gr.Blocks(title="半导体知识问答系统", theme=custom_theme, css=cust
 
 
     # 处理文件上传到指定知识库
+    # 入库作为后台任务提交，这里只轮询任务进度并流式刷新上传状态；任务本身不占用界面的 worker
     def process_upload_to_kb(files, kb_name):
         if not kb_name:
-            return "错误：未选择知识库"
+            yield "错误：未选择知识库", gr.update()
+            return
+        if not files:
+            yield "错误：未选择任何文件", gr.update()
+            return
+
+        manager = get_job_manager()
+        job = manager.submit(files, kb_name)
+        while not job.finished:
+            progress = job.render()
+            others = [j for j in manager.active_jobs() if j.job_id != job.job_id]
+            if others:
+                progress += "\n\n其他进行中的任务: " + "，".join(f"{j.job_id}（{j.kb_name}，{j.status}）" for j in others)
+            yield progress, gr.update()
+            time.sleep(Config.ingest_progress_interval)
 
-        result = batch_upload_to_kb(files, kb_name)
         # 更新知识库文件列表
-        files_list = update_kb_files_list(kb_name)
-        return result, files_list
+        yield job.render(), update_kb_files_list(kb_name)
 
 
     # 知识库选择变化时
@@ -476,10 +491,13 @@ with gr.Blocks(title="半导体知识问答系统", theme=custom_theme, css=cust
     )
 
     # 处理文件上传
+    # 上传使用单独的并发组，多个上传可以同时排队跟踪进度，不占用问答的 worker
     file_upload.upload(
         fn=process_upload_to_kb,
         inputs=[file_upload, kb_dropdown],
-        outputs=[upload_status, kb_files_list]
+        outputs=[upload_status, kb_files_list],
+        concurrency_limit=Config.ingest_ui_concurrency,
+        concurrency_id="ingest"
     )
 
     # 清空输入按钮功能